@@ -33,8 +33,11 @@ export default function Generator() {
       }));
     } else if (name === 'maxIterations' || name === 'width' || name === 'height') {
       setParams({ ...params, [name]: parseInt(value) });
-    } else if (name === 'power' || name === 'scale' || name === 'offsetX' || name === 'offsetY') {
+    } else if (name === 'power' || name === 'scale') {
       setParams({ ...params, [name]: parseFloat(value) });
+    } else if (name === 'offsetX' || name === 'offsetY') {
+      // Sent as typed: the server keeps digits of a deep zoom's centre that a double would drop
+      setParams({ ...params, [name]: value });
     } else {
       setParams({ ...params, [name]: value });
     }
@@ -48,7 +51,7 @@ export default function Generator() {
     try {
       const response = await generateFractal(params, token);
       if (response.status === 429) {
-        setError('Please wait, you are already generating a fractal.');
+        setError('The server is busy rendering other fractals. Please try again shortly.');
         setLoading(false);
         return;
       }
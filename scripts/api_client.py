@@ -0,0 +1,178 @@
+import base64
+import json
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Tokens are issued with expiresIn: '1h'; refresh a little before that.
+TOKEN_LIFETIME_SECONDS = 3600
+TOKEN_REFRESH_MARGIN_SECONDS = 60
+
+# verifyToken answers 401 without a token and 403 'Invalid token.' for a bad or
+# expired one. Other 403s (generation disabled, admin only) are not auth failures.
+INVALID_TOKEN_MESSAGE = "Invalid token."
+
+
+def iter_events(response):
+    """Parses a text/event-stream response, yielding (event, data) pairs with
+    `data` decoded from JSON."""
+    event, data = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith(":"):
+            continue
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].lstrip())
+
+
+def token_expiry(token):
+    """Returns the `exp` claim of a JWT as a UNIX timestamp, or None if it can't be read."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload)).get("exp")
+    except (IndexError, ValueError):
+        return None
+
+
+class ApiClient:
+    """Shared HTTP client for the fractal API.
+
+    Keeps one pooled keep-alive `requests.Session` for all calls and caches a
+    JWT per user until shortly before it expires, so callers don't pay for a
+    new TCP connection and a server-side bcrypt check on every request.
+    """
+
+    def __init__(self, base_url, pool_size=10, on_login=None):
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.on_login = on_login
+        self.credentials = {}
+        self.tokens = {}
+        self.lock = threading.Lock()
+        self.user_locks = {}
+
+    def url(self, path):
+        return path if path.startswith("http") else f"{self.base_url}{path}"
+
+    def login(self, username, password):
+        """Logs in and caches the token. Returns the token, or raises
+        requests.exceptions.RequestException on failure."""
+        self.credentials[username] = password
+        start = time.time()
+        try:
+            r = self.session.post(self.url("/auth/login"), json={"username": username, "password": password})
+        except requests.exceptions.RequestException:
+            self.report_login(username, "error", time.time() - start)
+            raise
+        self.report_login(username, r.status_code, time.time() - start)
+        r.raise_for_status()
+
+        token = r.json()["token"]
+        expires_at = token_expiry(token) or (time.time() + TOKEN_LIFETIME_SECONDS)
+        with self.lock:
+            self.tokens[username] = (token, expires_at)
+        return token
+
+    def report_login(self, username, status, seconds):
+        if self.on_login:
+            self.on_login(username, status, seconds)
+
+    def token(self, username, password=None):
+        """Returns a cached token for `username`, logging in if there is none
+        or it is about to expire."""
+        if password is not None:
+            self.credentials[username] = password
+        with self.lock:
+            user_lock = self.user_locks.setdefault(username, threading.Lock())
+        # One login per user at a time; other threads wait for its token.
+        with user_lock:
+            with self.lock:
+                cached = self.tokens.get(username)
+            if cached and cached[1] - TOKEN_REFRESH_MARGIN_SECONDS > time.time():
+                return cached[0]
+            return self.login(username, self.credentials[username])
+
+    def invalidate(self, username):
+        with self.lock:
+            self.tokens.pop(username, None)
+
+    def request(self, method, path, user=None, **kwargs):
+        """Sends a request as `user` (if given) and returns the response.
+
+        If the server rejects the token, it is dropped and the request is
+        retried once with a fresh login.
+        """
+        for attempt in range(2):
+            headers = dict(kwargs.pop("headers", None) or {})
+            if user is not None:
+                headers["Authorization"] = f"Bearer {self.token(user)}"
+            r = self.session.request(method, self.url(path), headers=headers, **kwargs)
+            if user is None or attempt == 1 or not self.is_auth_failure(r):
+                return r
+            self.invalidate(user)
+            kwargs["headers"] = {k: v for k, v in headers.items() if k != "Authorization"}
+        return r
+
+    @staticmethod
+    def is_auth_failure(r):
+        return r.status_code == 401 or (r.status_code == 403 and r.text.strip() == INVALID_TOKEN_MESSAGE)
+
+    def submit_job(self, body, user):
+        """Submits a render job. Returns the response; 202 carries the job."""
+        return self.post("/jobs", user=user, json=body, timeout=30)
+
+    def wait_for_job(self, job_id, user, on_update=None, poll_interval=1.0, stream=True):
+        """Follows a job until it finishes and returns its final state.
+
+        Listens to the job's server-sent events when `stream` is set, and
+        falls back to polling GET /jobs/<id> if the stream can't be used.
+        `on_update` is called with every job state received.
+        """
+        if stream:
+            try:
+                with self.get(f"/jobs/{job_id}/events", user=user, stream=True, timeout=(10, 60)) as r:
+                    r.raise_for_status()
+                    for event, job in iter_events(r):
+                        if event != "status":
+                            continue
+                        if on_update:
+                            on_update(job)
+                        if job["status"] in ("done", "failed"):
+                            return job
+            except (requests.exceptions.RequestException, ValueError):
+                pass  # fall back to polling
+
+        while True:
+            r = self.get(f"/jobs/{job_id}", user=user, timeout=30)
+            r.raise_for_status()
+            job = r.json()
+            if on_update:
+                on_update(job)
+            if job["status"] in ("done", "failed"):
+                return job
+            time.sleep(poll_interval)
+
+    def get(self, path, user=None, **kwargs):
+        return self.request("GET", path, user=user, **kwargs)
+
+    def post(self, path, user=None, **kwargs):
+        return self.request("POST", path, user=user, **kwargs)
+
+    def put(self, path, user=None, **kwargs):
+        return self.request("PUT", path, user=user, **kwargs)
+
+    def delete(self, path, user=None, **kwargs):
+        return self.request("DELETE", path, user=user, **kwargs)
@@ -0,0 +1,511 @@
+/**
+ * @file bench.js
+ * @description Render benchmark and golden-image regression check.
+ *
+ * Usage:
+ *   node scripts/bench.js                 benchmark the default grid and check goldens
+ *   node scripts/bench.js --full          include 1920x1080 and 2500 iterations
+ *   node scripts/bench.js --deep          only compare perturbation against the plain kernel at deep zoom
+ *   node scripts/bench.js --shortcuts     only time periodicity checking and subdivision against full renders
+ *   node scripts/bench.js --golden        only check golden images (npm test)
+ *   node scripts/bench.js --update-golden rewrite golden images from the current kernel
+ *   node scripts/bench.js --out file.json write results somewhere other than scripts/bench_results/
+ */
+const fs = require('fs');
+const os = require('os');
+const path = require('path');
+const zlib = require('zlib');
+const { execSync, execFileSync } = require('child_process');
+const { map, renderPixels, createIndexField, colorField, PROGRESSIVE_STEPS } = require('../src/fractalKernel');
+const { renderPerturbed, toFixed } = require('../src/perturbation');
+
+const goldenDir = path.join(__dirname, 'golden');
+const resultsDir = path.join(__dirname, 'bench_results');
+
+const COLOR_SCHEMES = ['rainbow', 'grayscale', 'fire', 'hsl'];
+
+// Geometries covering power 2 vs. non-integer power and interior-heavy vs. escaping c.
+const GEOMETRIES = [
+    { name: 'p2-escaping', power: 2, c: { real: 0.285, imag: 0.01 }, scale: 1.5, offsetX: 0, offsetY: 0 },
+    { name: 'p2-interior', power: 2, c: { real: -0.5, imag: 0.5 }, scale: 1.5, offsetX: 0, offsetY: 0 },
+    { name: 'p2-zoom', power: 2, c: { real: -0.8, imag: 0.156 }, scale: 0.2, offsetX: 0.3, offsetY: 0.1 },
+    { name: 'p2.5-interior', power: 2.5, c: { real: -0.4, imag: 0.6 }, scale: 1.5, offsetX: 0, offsetY: 0 },
+    { name: 'p3-interior', power: 3, c: { real: -0.1, imag: 0.65 }, scale: 1.2, offsetX: 0, offsetY: 0 }
+];
+
+// Deep zooms, where the plain kernel's pixel coordinates collapse. 0 lies on
+// the Julia set for c = i; the other centres are points on their Julia sets
+// found by inverse iteration.
+const DEEP_GEOMETRIES = [
+    { name: 'p2-deep-dendrite', power: 2, c: { real: 0, imag: 1 }, scale: 1e-14, offsetX: 0, offsetY: 0 },
+    { name: 'p2-deep-dendrite', power: 2, c: { real: 0, imag: 1 }, scale: 1e-40, offsetX: 0, offsetY: 0 },
+    { name: 'p2-deep-boundary', power: 2, c: { real: -0.8, imag: 0.156 }, scale: 1e-14, offsetX: 0.14496837838299714, offsetY: -0.7425547568988013 },
+    { name: 'p3-deep-boundary', power: 3, c: { real: -0.1, imag: 0.65 }, scale: 1e-14, offsetX: 0.1012983545438442, offsetY: -0.7990249937723329 }
+];
+const DEEP_SIZE = { width: 320, height: 180, maxIterations: 2000 };
+// Pixels per deep case checked against an exact BigInt iteration
+const DEEP_SAMPLE = 64;
+
+const RESOLUTIONS = [[320, 180], [800, 450]];
+const FULL_RESOLUTIONS = [[1920, 1080]];
+const ITERATIONS = [250, 1000];
+const FULL_ITERATIONS = [2500];
+
+const GOLDEN_SIZE = { width: 128, height: 96, maxIterations: 500 };
+
+// The interior shortcuts in renderPixels, alone and together, at the
+// iteration count where interior pixels cost the most
+const SHORTCUTS = {
+    periodicity: { periodicity: true },
+    subdivision: { subdivision: true },
+    both: { periodicity: true, subdivision: true }
+};
+const SHORTCUT_SIZE = { width: 800, height: 450, maxIterations: 2500 };
+const SHORTCUT_CHECK_ITERATIONS = 2500;
+// Progressive renders are checked at the golden size and at one that no
+// grid step divides, so the passes' ragged last rows and columns are covered
+const PROGRESSIVE_SIZES = [GOLDEN_SIZE, { width: 125, height: 93, maxIterations: 500 }];
+
+// A golden comparison passes if no more than maxBadFraction of pixels differ
+// by more than badPixelDiff in any channel, and the mean channel error stays
+// under maxMeanDiff. Small colour quantisation passes; changed escape counts don't.
+const TOLERANCE = { badPixelDiff: 16, maxBadFraction: 0.002, maxMeanDiff: 0.5 };
+
+// scripts/fractal_render.py colours through the same palette table, so its
+// images may only differ where its polar-form iteration rounds a boundary
+// pixel's escape count differently from the kernel's multiplication. At most
+// this fraction of pixels may differ at all.
+const REFERENCE_MAX_DIFF_FRACTION = 0.001;
+
+// Renders a list of options with fractal_render.render_fractal, writing the
+// RGBA images to stdout one after another
+const REFERENCE_RENDER = `
+import json, sys
+from fractal_render import render_fractal
+for options in json.load(sys.stdin):
+    sys.stdout.buffer.write(render_fractal(options).tobytes())
+`;
+
+function parseArgs(argv) {
+    const args = { full: false, deep: false, shortcuts: false, golden: false, updateGolden: false, repeat: 3, out: null };
+    for (let i = 0; i < argv.length; i++) {
+        switch (argv[i]) {
+            case '--full': args.full = true; break;
+            case '--deep': args.deep = true; break;
+            case '--shortcuts': args.shortcuts = true; break;
+            case '--golden': args.golden = true; break;
+            case '--update-golden': args.updateGolden = true; break;
+            case '--repeat': args.repeat = parseInt(argv[++i]) || 1; break;
+            case '--out': args.out = argv[++i]; break;
+            default:
+                console.error(`Unknown argument: ${argv[i]}`);
+                process.exit(2);
+        }
+    }
+    return args;
+}
+
+function benchCases(full) {
+    const resolutions = full ? RESOLUTIONS.concat(FULL_RESOLUTIONS) : RESOLUTIONS;
+    const iterations = full ? ITERATIONS.concat(FULL_ITERATIONS) : ITERATIONS;
+    const cases = [];
+    for (const geometry of GEOMETRIES) {
+        for (const [width, height] of resolutions) {
+            for (const maxIterations of iterations) {
+                cases.push({ ...geometry, width, height, maxIterations, colorScheme: 'rainbow' });
+            }
+        }
+    }
+    // Colouring cost: every scheme on one geometry at the smallest size.
+    const [width, height] = resolutions[0];
+    for (const colorScheme of COLOR_SCHEMES.filter(s => s !== 'rainbow')) {
+        cases.push({ ...GEOMETRIES[1], width, height, maxIterations: iterations[0], colorScheme });
+    }
+    return cases;
+}
+
+function goldenCases() {
+    const cases = [];
+    for (const geometry of GEOMETRIES) {
+        for (const colorScheme of COLOR_SCHEMES) {
+            cases.push({ ...geometry, ...GOLDEN_SIZE, colorScheme });
+        }
+    }
+    return cases;
+}
+
+function caseLabel(options) {
+    return `${options.name} ${options.width}x${options.height} it=${options.maxIterations} ${options.colorScheme}`;
+}
+
+function goldenPath(options) {
+    return path.join(goldenDir, `${options.name}-${options.colorScheme}.rgba.gz`);
+}
+
+function median(timings) {
+    timings.sort((a, b) => a - b);
+    return timings[Math.floor(timings.length / 2)];
+}
+
+// Renders `repeat` times, also filling an index field (as the render workers
+// do) so recolouring can be measured from it
+async function timeRender(options, repeat) {
+    const timings = [];
+    const field = createIndexField(options.maxIterations, options.width * options.height);
+    let result;
+    for (let i = 0; i < repeat; i++) {
+        const start = process.hrtime.bigint();
+        result = await renderPixels({ ...options, field, maxTime: Infinity });
+        timings.push(Number(process.hrtime.bigint() - start) / 1e6);
+    }
+    return { ms: median(timings), result, field };
+}
+
+function timeRecolor(options, field, repeat) {
+    const timings = [];
+    for (let i = 0; i < repeat; i++) {
+        const start = process.hrtime.bigint();
+        colorField(field, 'fire', options.maxIterations);
+        timings.push(Number(process.hrtime.bigint() - start) / 1e6);
+    }
+    return median(timings);
+}
+
+function compareImages(expected, actual) {
+    let maxDiff = 0;
+    let totalDiff = 0;
+    let badPixels = 0;
+    for (let i = 0; i < expected.length; i += 4) {
+        let pixelDiff = 0;
+        for (let k = 0; k < 4; k++) {
+            const diff = Math.abs(expected[i + k] - actual[i + k]);
+            totalDiff += diff;
+            if (diff > pixelDiff) pixelDiff = diff;
+        }
+        if (pixelDiff > maxDiff) maxDiff = pixelDiff;
+        if (pixelDiff > TOLERANCE.badPixelDiff) badPixels++;
+    }
+    const pixels = expected.length / 4;
+    const meanDiff = totalDiff / expected.length;
+    const badFraction = badPixels / pixels;
+    const pass = badFraction <= TOLERANCE.maxBadFraction && meanDiff <= TOLERANCE.maxMeanDiff;
+    return { pass, maxDiff, meanDiff, badFraction };
+}
+
+async function runGolden(update) {
+    if (update) fs.mkdirSync(goldenDir, { recursive: true });
+    const results = [];
+    for (const options of goldenCases()) {
+        const { result } = await timeRender(options, 1);
+        const file = goldenPath(options);
+        if (update) {
+            fs.writeFileSync(file, zlib.gzipSync(Buffer.from(result.data.buffer), { level: 9 }));
+            console.log(`Updated ${path.relative(process.cwd(), file)}`);
+            continue;
+        }
+        if (!fs.existsSync(file)) {
+            console.log(`MISSING ${caseLabel(options)} (run with --update-golden)`);
+            results.push({ name: caseLabel(options), pass: false, missing: true });
+            continue;
+        }
+        const expected = new Uint8Array(zlib.gunzipSync(fs.readFileSync(file)));
+        const comparison = compareImages(expected, result.data);
+        console.log(`${comparison.pass ? 'ok  ' : 'FAIL'} ${caseLabel(options)}: max diff ${comparison.maxDiff}, `
+            + `mean ${comparison.meanDiff.toFixed(3)}, ${(comparison.badFraction * 100).toFixed(2)}% pixels off`);
+        results.push({ name: caseLabel(options), ...comparison });
+    }
+    if (!update) {
+        results.push(...await checkRecolor(), ...await checkPerturbation(), ...await checkShortcuts(), ...await checkProgressive(),
+            ...await checkReference());
+    }
+    return results;
+}
+
+// At shallow zoom, where plain doubles are accurate, perturbation must give
+// the plain kernel's image within the golden tolerance
+async function checkPerturbation() {
+    const results = [];
+    for (const geometry of GEOMETRIES.filter(g => Number.isInteger(g.power))) {
+        const options = { ...geometry, ...GOLDEN_SIZE, colorScheme: 'rainbow', maxTime: Infinity };
+        const plain = await renderPixels(options);
+        const perturbed = await renderPerturbed(options);
+        const comparison = compareImages(plain.data, perturbed.data);
+        console.log(`${comparison.pass ? 'ok  ' : 'FAIL'} ${caseLabel(options)} by perturbation: `
+            + `mean ${comparison.meanDiff.toFixed(3)}, ${(comparison.badFraction * 100).toFixed(2)}% pixels off`);
+        results.push({ name: `${caseLabel(options)} perturbation`, ...comparison });
+    }
+    return results;
+}
+
+// The interior shortcuts must give the full render's image within the golden
+// tolerance. Periodicity checking should match exactly; subdivision can miss
+// escaping filaments thinner than a pixel.
+async function checkShortcuts() {
+    const results = [];
+    for (const geometry of GEOMETRIES) {
+        const options = { ...geometry, ...GOLDEN_SIZE, maxIterations: SHORTCUT_CHECK_ITERATIONS, colorScheme: 'rainbow', maxTime: Infinity };
+        const plain = await renderPixels(options);
+        for (const [mode, flags] of Object.entries(SHORTCUTS)) {
+            const result = await renderPixels({ ...options, ...flags });
+            const comparison = compareImages(plain.data, result.data);
+            console.log(`${comparison.pass ? 'ok  ' : 'FAIL'} ${caseLabel(options)} with ${mode}: `
+                + `mean ${comparison.meanDiff.toFixed(3)}, ${(comparison.badFraction * 100).toFixed(2)}% pixels off`);
+            results.push({ name: `${caseLabel(options)} ${mode}`, ...comparison });
+        }
+    }
+    return results;
+}
+
+// A progressive render must end with exactly the single-pass image, with
+// and without each shortcut, and report its stages in order
+async function checkProgressive() {
+    const results = [];
+    for (const geometry of GEOMETRIES) {
+        for (const size of PROGRESSIVE_SIZES) {
+            const options = { ...geometry, ...size, colorScheme: 'rainbow', maxTime: Infinity };
+            for (const [mode, flags] of Object.entries({ none: {}, ...SHORTCUTS })) {
+                const single = await renderPixels({ ...options, ...flags });
+                const stages = [];
+                const progressive = await renderPixels({ ...options, ...flags, steps: PROGRESSIVE_STEPS, onStage: (step) => stages.push(step) });
+                const pass = Buffer.compare(Buffer.from(single.data.buffer), Buffer.from(progressive.data.buffer)) === 0
+                    && stages.join() === PROGRESSIVE_STEPS.join();
+                console.log(`${pass ? 'ok  ' : 'FAIL'} ${caseLabel(options)} progressive, shortcuts: ${mode}`);
+                results.push({ name: `${caseLabel(options)} progressive ${mode}`, pass });
+            }
+        }
+    }
+    return results;
+}
+
+// The NumPy reference renderer must give the kernel's images, within
+// REFERENCE_MAX_DIFF_FRACTION. Skipped where python3 with NumPy isn't installed.
+async function checkReference() {
+    const cases = goldenCases();
+    let output;
+    try {
+        output = execFileSync('python3', ['-c', REFERENCE_RENDER], {
+            cwd: __dirname,
+            input: JSON.stringify(cases),
+            maxBuffer: cases.length * GOLDEN_SIZE.width * GOLDEN_SIZE.height * 4 + 1024,
+            stdio: ['pipe', 'pipe', 'pipe']
+        });
+    } catch (err) {
+        const reason = (err.stderr && err.stderr.toString().trim().split('\n').pop()) || err.message;
+        if (err.code === 'ENOENT' || /No module named 'numpy'/.test(reason)) {
+            console.log(`skip reference renderer: ${reason}`);
+            return [];
+        }
+        console.log(`FAIL reference renderer: ${reason}`);
+        return [{ name: 'reference renderer', pass: false }];
+    }
+
+    const results = [];
+    let offset = 0;
+    for (const options of cases) {
+        const { data } = await renderPixels({ ...options, maxTime: Infinity });
+        const reference = output.subarray(offset, offset + data.length);
+        offset += data.length;
+        let diffPixels = 0;
+        for (let i = 0; i < data.length; i += 4) {
+            if (data[i] !== reference[i] || data[i + 1] !== reference[i + 1]
+                || data[i + 2] !== reference[i + 2] || data[i + 3] !== reference[i + 3]) diffPixels++;
+        }
+        const diffFraction = reference.length === data.length ? diffPixels / (data.length / 4) : 1;
+        const pass = diffFraction <= REFERENCE_MAX_DIFF_FRACTION;
+        console.log(`${pass ? 'ok  ' : 'FAIL'} ${caseLabel(options)} matches fractal_render.py: `
+            + `${(diffFraction * 100).toFixed(2)}% pixels differ`);
+        results.push({ name: `${caseLabel(options)} reference`, pass, diffFraction });
+    }
+    return results;
+}
+
+// Recolouring a stored index field must give exactly the image a direct
+// render in that scheme gives
+async function checkRecolor() {
+    const results = [];
+    for (const geometry of GEOMETRIES) {
+        const base = { ...geometry, ...GOLDEN_SIZE, colorScheme: 'rainbow' };
+        const { field } = await timeRender(base, 1);
+        for (const colorScheme of COLOR_SCHEMES) {
+            const options = { ...base, colorScheme };
+            const direct = await renderPixels({ ...options, maxTime: Infinity });
+            const recolored = colorField(field, colorScheme, options.maxIterations);
+            const pass = Buffer.compare(Buffer.from(direct.data.buffer), Buffer.from(recolored.buffer)) === 0;
+            console.log(`${pass ? 'ok  ' : 'FAIL'} ${caseLabel(options)} recoloured from field`);
+            results.push({ name: `${caseLabel(options)} recolor`, pass });
+        }
+    }
+    return results;
+}
+
+async function runBench(full, repeat) {
+    const results = [];
+    for (const options of benchCases(full)) {
+        const pixels = options.width * options.height;
+        const { ms, result, field } = await timeRender(options, repeat);
+        const recolorMs = timeRecolor(options, field, repeat);
+        const entry = {
+            name: options.name,
+            width: options.width,
+            height: options.height,
+            maxIterations: options.maxIterations,
+            power: options.power,
+            c: options.c,
+            scale: options.scale,
+            colorScheme: options.colorScheme,
+            ms,
+            pixelsPerSecond: pixels / (ms / 1000),
+            iterations: result.iterations,
+            iterationsPerSecond: result.iterations / (ms / 1000),
+            recolorMs
+        };
+        console.log(`${caseLabel(options)}: ${ms.toFixed(1)} ms, `
+            + `${(entry.pixelsPerSecond / 1e6).toFixed(2)} Mpx/s, ${(entry.iterationsPerSecond / 1e6).toFixed(1)} Mit/s, recolour ${recolorMs.toFixed(1)} ms`);
+        results.push(entry);
+    }
+    return results;
+}
+
+// Escape count of the pixel at (x, y) by plain iteration in BigInt fixed
+// point, precise enough to serve as the reference answer at deep zoom
+function exactEscapeCount(options, x, y) {
+    const bits = 4096;
+    const one = BigInt(bits);
+    const bailout = 4n << one;
+    const cr = toFixed(options.c.real, bits);
+    const ci = toFixed(options.c.imag, bits);
+    let zr = toFixed(options.offsetX, bits) + toFixed(map(x, 0, options.width, -options.scale, options.scale), bits);
+    let zi = toFixed(options.offsetY, bits) + toFixed(map(y, 0, options.height, -options.scale, options.scale), bits);
+    let n = 0;
+    while (n < options.maxIterations) {
+        let pr = zr;
+        let pi = zi;
+        for (let k = 1; k < options.power; k++) {
+            const t = (pr * zr - pi * zi) >> one;
+            pi = (pr * zi + pi * zr) >> one;
+            pr = t;
+        }
+        zr = pr + cr;
+        zi = pi + ci;
+        if (((zr * zr + zi * zi) >> one) > bailout) break;
+        n++;
+    }
+    return n;
+}
+
+// Times the plain kernel and perturbation on each deep zoom, and checks a
+// fixed sample of pixels from both against exact iteration (a pixel counts
+// as right if its escape count is within one iteration)
+async function runDeepBench(repeat) {
+    const results = [];
+    for (const geometry of DEEP_GEOMETRIES) {
+        const options = { ...geometry, ...DEEP_SIZE, colorScheme: 'rainbow', maxTime: Infinity };
+        const pixels = options.width * options.height;
+        const entry = { name: options.name, scale: options.scale, power: options.power, c: options.c, ...DEEP_SIZE };
+        const fields = {};
+        for (const [mode, render] of [['plain', renderPixels], ['perturbation', renderPerturbed]]) {
+            const timings = [];
+            const field = createIndexField(options.maxIterations, pixels);
+            let result;
+            for (let i = 0; i < repeat; i++) {
+                const start = process.hrtime.bigint();
+                result = await render({ ...options, field });
+                timings.push(Number(process.hrtime.bigint() - start) / 1e6);
+            }
+            fields[mode] = field;
+            entry[mode] = { ms: median(timings), iterations: result.iterations, distinctValues: new Set(field).size, right: 0 };
+            if (result.rebases !== undefined) entry[mode].rebases = result.rebases;
+        }
+        for (let i = 0; i < DEEP_SAMPLE; i++) {
+            const idx = Math.floor((i + 0.5) * pixels / DEEP_SAMPLE);
+            const exact = exactEscapeCount(options, idx % options.width, Math.floor(idx / options.width));
+            for (const mode of ['plain', 'perturbation']) {
+                const n = Math.floor(fields[mode][idx] / 16);
+                if (Math.abs(n - Math.min(exact, options.maxIterations)) <= 1) entry[mode].right++;
+            }
+        }
+        console.log(`${options.name} scale=${options.scale} ${options.width}x${options.height} it=${options.maxIterations}: `
+            + ['plain', 'perturbation'].map(mode => `${mode} ${entry[mode].ms.toFixed(1)} ms, ${entry[mode].distinctValues} distinct values, `
+                + `${entry[mode].right}/${DEEP_SAMPLE} right`).join('; '));
+        results.push(entry);
+    }
+    return results;
+}
+
+// Full renders against each combination of interior shortcuts, with the
+// pixels that differ from the full render
+async function runShortcutBench(repeat) {
+    const results = [];
+    for (const geometry of GEOMETRIES) {
+        const options = { ...geometry, ...SHORTCUT_SIZE, colorScheme: 'rainbow', maxTime: Infinity };
+        const entry = { name: options.name, power: options.power, c: options.c, scale: options.scale, ...SHORTCUT_SIZE };
+        let plain;
+        for (const [mode, flags] of [['plain', {}], ...Object.entries(SHORTCUTS)]) {
+            const timings = [];
+            let result;
+            for (let i = 0; i < repeat; i++) {
+                const start = process.hrtime.bigint();
+                result = await renderPixels({ ...options, ...flags });
+                timings.push(Number(process.hrtime.bigint() - start) / 1e6);
+            }
+            plain = plain || result;
+            entry[mode] = { ms: median(timings), iterations: result.iterations, speedup: entry.plain ? entry.plain.ms / median(timings) : 1 };
+            entry[mode].pixelsOff = compareImages(plain.data, result.data).badFraction * options.width * options.height;
+        }
+        console.log(`${caseLabel(options)}: plain ${entry.plain.ms.toFixed(1)} ms; `
+            + Object.keys(SHORTCUTS).map(mode => `${mode} ${entry[mode].ms.toFixed(1)} ms (${entry[mode].speedup.toFixed(1)}x, `
+                + `${entry[mode].pixelsOff} pixels off)`).join('; '));
+        results.push(entry);
+    }
+    return results;
+}
+
+function gitCommit() {
+    try {
+        return execSync('git rev-parse --short HEAD', { cwd: __dirname, stdio: ['ignore', 'pipe', 'ignore'] }).toString().trim();
+    } catch (err) {
+        return null;
+    }
+}
+
+async function main() {
+    const args = parseArgs(process.argv.slice(2));
+
+    if (args.updateGolden) {
+        await runGolden(true);
+        return;
+    }
+
+    const golden = await runGolden(false);
+    const goldenFailed = golden.some(g => !g.pass);
+    if (args.golden) {
+        process.exitCode = goldenFailed ? 1 : 0;
+        return;
+    }
+
+    const only = args.deep || args.shortcuts;
+    const bench = only ? [] : await runBench(args.full, args.repeat);
+    const deep = !only || args.deep ? await runDeepBench(args.repeat) : [];
+    const shortcuts = !only || args.shortcuts ? await runShortcutBench(args.repeat) : [];
+    const commit = gitCommit();
+    const report = {
+        commit,
+        date: new Date().toISOString(),
+        node: process.version,
+        cpu: os.cpus()[0] ? os.cpus()[0].model : null,
+        cpus: os.cpus().length,
+        tolerance: TOLERANCE,
+        golden,
+        bench,
+        deep,
+        shortcuts
+    };
+
+    const out = args.out || path.join(resultsDir, `${report.date.replace(/[:.]/g, '-')}-${commit || 'unknown'}.json`);
+    fs.mkdirSync(path.dirname(out), { recursive: true });
+    fs.writeFileSync(out, JSON.stringify(report, null, 2));
+    console.log(`Results written to ${out}`);
+    if (goldenFailed) process.exitCode = 1;
+}
+
+main();
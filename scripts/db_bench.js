@@ -0,0 +1,280 @@
+/**
+ * @file db_bench.js
+ * @description Database benchmark: the models' hot queries against a seeded
+ * fractal.db, before and after tuning (WAL and pragmas, indexes, planner
+ * statistics, cached prepared statements).
+ *
+ * Usage:
+ *   node scripts/db_bench.js                  seed 1M history rows and compare
+ *   node scripts/db_bench.js --history 100000 smaller seed for a quick run
+ *   node scripts/db_bench.js --repeat 200     timed runs per query (default 100)
+ *   node scripts/db_bench.js --out file.json  write results somewhere other than scripts/bench_results/
+ *
+ * The scratch databases go to the OS temp directory and are removed afterwards.
+ */
+const fs = require('fs');
+const os = require('os');
+const path = require('path');
+const sqlite3 = require('sqlite3');
+const { TABLES, INDEXES, PRAGMAS } = require('../src/schema');
+
+const resultsDir = path.join(__dirname, 'bench_results');
+
+const SEED = 12345;
+const COLOR_SCHEMES = ['rainbow', 'grayscale', 'fire', 'hsl'];
+const POWERS = [2, 2.5, 3, 4];
+const SIZES = [[800, 600], [1280, 720], [1920, 1080]];
+const ITERATIONS = [250, 500, 1000];
+
+function parseArgs(argv) {
+    const args = { history: 1000000, fractals: 20000, users: 100, galleryPerUser: 200, inserts: 2000, repeat: 100, out: null };
+    for (let i = 0; i < argv.length; i++) {
+        switch (argv[i]) {
+            case '--history': args.history = parseInt(argv[++i]); break;
+            case '--fractals': args.fractals = parseInt(argv[++i]); break;
+            case '--users': args.users = parseInt(argv[++i]); break;
+            case '--repeat': args.repeat = parseInt(argv[++i]) || 1; break;
+            case '--out': args.out = argv[++i]; break;
+            default:
+                console.error(`Unknown argument: ${argv[i]}`);
+                process.exit(2);
+        }
+    }
+    return args;
+}
+
+// Small deterministic PRNG (mulberry32) so every run seeds the same data
+function random(seed) {
+    let a = seed;
+    return () => {
+        a = (a + 0x6D2B79F5) | 0;
+        let t = Math.imul(a ^ (a >>> 15), 1 | a);
+        t = (t + Math.imul(t ^ (t >>> 7), 61 | t)) ^ t;
+        return ((t ^ (t >>> 14)) >>> 0) / 4294967296;
+    };
+}
+
+function pick(rand, list) {
+    return list[Math.floor(rand() * list.length)];
+}
+
+// Promise wrappers over the sqlite3 callback API
+function open(file) {
+    return new Promise((resolve, reject) => {
+        const db = new sqlite3.Database(file, (err) => err ? reject(err) : resolve(db));
+    });
+}
+
+function call(target, method, ...args) {
+    return new Promise((resolve, reject) => {
+        target[method](...args, function (err, result) {
+            if (err) reject(err);
+            else resolve(result === undefined ? this : result);
+        });
+    });
+}
+
+// Time as of `secondsAgo` in SQLite's CURRENT_TIMESTAMP format
+function timestamp(secondsAgo) {
+    return new Date(Date.now() - secondsAgo * 1000).toISOString().slice(0, 19).replace('T', ' ');
+}
+
+async function insertRows(db, sql, count, row) {
+    const statement = db.prepare(sql);
+    await call(db, 'exec', 'BEGIN');
+    for (let i = 0; i < count; i++) {
+        await call(statement, 'run', row(i));
+    }
+    await call(db, 'exec', 'COMMIT');
+    await call(statement, 'finalize');
+}
+
+async function seed(file, args) {
+    const rand = random(SEED);
+    const db = await open(file);
+    for (const sql of Object.values(TABLES)) {
+        await call(db, 'run', sql);
+    }
+
+    const span = 365 * 24 * 3600;
+    await insertRows(db, `INSERT INTO fractals (hash, width, height, iterations, power, c_real, c_imag, scale, offsetX, offsetY, colorScheme, image_path, created_at)
+                          VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)`, args.fractals, (i) => {
+        const [width, height] = pick(rand, SIZES);
+        const hash = `${i.toString(16).padStart(8, '0')}${'0'.repeat(56)}`;
+        return [hash, width, height, pick(rand, ITERATIONS), pick(rand, POWERS), rand() * 2 - 1, rand() * 2 - 1,
+            1 + rand(), rand() - 0.5, rand() - 0.5, pick(rand, COLOR_SCHEMES), `./fractals/${hash}.png`, timestamp(rand() * span)];
+    });
+
+    await insertRows(db, 'INSERT INTO history (user_id, fractal_id, generated_at) VALUES (?, ?, ?)', args.history, () => [
+        1 + Math.floor(rand() * args.users), 1 + Math.floor(rand() * args.fractals), timestamp(rand() * span)
+    ]);
+
+    await insertRows(db, 'INSERT OR IGNORE INTO gallery (user_id, fractal_id, fractal_hash, added_at) VALUES (?, ?, ?, ?)', args.users * args.galleryPerUser, (i) => {
+        const fractalId = 1 + Math.floor(rand() * args.fractals);
+        const hash = `${(fractalId - 1).toString(16).padStart(8, '0')}${'0'.repeat(56)}`;
+        return [1 + (i % args.users), fractalId, hash, timestamp(rand() * span)];
+    });
+
+    await call(db, 'close');
+}
+
+// The models' queries, with parameters drawn from the seeded ranges
+function workload(args) {
+    const rand = random(SEED + 1);
+    const user = () => 1 + Math.floor(rand() * args.users);
+    const fractal = () => 1 + Math.floor(rand() * args.fractals);
+    return [
+        {
+            name: 'history for user',
+            sql: `SELECT h.id, f.hash, f.width, f.height, f.iterations, f.power, f.c_real, f.c_imag, f.scale, f.offsetX, f.offsetY, f.colorScheme, h.generated_at
+                  FROM history h JOIN fractals f ON h.fractal_id = f.id WHERE h.user_id = ? ORDER BY h.generated_at DESC`,
+            method: 'all',
+            params: () => [user()]
+        },
+        {
+            name: 'history entry by user and fractal',
+            sql: 'SELECT generated_at FROM history WHERE user_id = ? AND fractal_id = ?',
+            method: 'get',
+            params: () => [user(), fractal()]
+        },
+        {
+            name: 'history count for fractal',
+            sql: 'SELECT COUNT(*) as count FROM history WHERE fractal_id = ?',
+            method: 'get',
+            params: () => [fractal()]
+        },
+        {
+            name: 'admin history page',
+            sql: `SELECT h.id, h.user_id, h.fractal_id, f.hash, h.generated_at FROM history h LEFT JOIN fractals f ON h.fractal_id = f.id
+                  ORDER BY h.generated_at DESC LIMIT ? OFFSET ?`,
+            method: 'all',
+            params: () => [10, Math.floor(rand() * 10) * 10]
+        },
+        {
+            name: 'gallery page for user',
+            sql: `SELECT g.id, g.fractal_id, f.hash, f.width, f.height, f.colorScheme, g.added_at FROM gallery g JOIN fractals f ON g.fractal_id = f.id
+                  WHERE g.user_id = ? ORDER BY added_at DESC LIMIT ? OFFSET ?`,
+            method: 'all',
+            params: () => [user(), 10, 0]
+        },
+        {
+            name: 'gallery count for hash',
+            sql: 'SELECT COUNT(*) as count FROM gallery WHERE fractal_hash = ?',
+            method: 'get',
+            params: () => [`${(fractal() - 1).toString(16).padStart(8, '0')}${'0'.repeat(56)}`]
+        },
+        {
+            name: 'fractals filtered page',
+            sql: 'SELECT * FROM fractals WHERE colorScheme = ? AND power = ? ORDER BY created_at DESC LIMIT ? OFFSET ?',
+            method: 'all',
+            params: () => [pick(rand, COLOR_SCHEMES), pick(rand, POWERS), 10, 0]
+        }
+    ];
+}
+
+// Baseline prepares every query from its SQL text, as db.get/db.all do;
+// tuned reuses one prepared statement per query, as src/statements.js does
+async function timeQuery(db, query, repeat, cached) {
+    const statement = cached ? db.prepare(query.sql) : null;
+    const timings = [];
+    for (let i = 0; i < repeat; i++) {
+        const params = query.params();
+        const start = process.hrtime.bigint();
+        if (cached) {
+            await call(statement, query.method, params);
+            if (query.method === 'get') await call(statement, 'reset');
+        } else {
+            await call(db, query.method, query.sql, params);
+        }
+        timings.push(Number(process.hrtime.bigint() - start) / 1e6);
+    }
+    if (statement) await call(statement, 'finalize');
+    timings.sort((a, b) => a - b);
+    return {
+        p50: timings[Math.floor(timings.length * 0.5)],
+        p99: timings[Math.min(timings.length - 1, Math.floor(timings.length * 0.99))]
+    };
+}
+
+// History inserts one per transaction, as recordForUser issues them
+async function timeInserts(db, args, cached) {
+    const rand = random(SEED + 2);
+    const sql = 'INSERT INTO history (user_id, fractal_id) VALUES (?, ?)';
+    const statement = cached ? db.prepare(sql) : null;
+    const start = process.hrtime.bigint();
+    for (let i = 0; i < args.inserts; i++) {
+        const params = [1 + Math.floor(rand() * args.users), 1 + Math.floor(rand() * args.fractals)];
+        if (cached) await call(statement, 'run', params);
+        else await call(db, 'run', sql, params);
+    }
+    const seconds = Number(process.hrtime.bigint() - start) / 1e9;
+    if (statement) await call(statement, 'finalize');
+    return args.inserts / seconds;
+}
+
+async function runMode(file, mode, args) {
+    const db = await open(file);
+    const tuned = mode === 'tuned';
+    let indexSeconds = null;
+    if (tuned) {
+        await call(db, 'exec', PRAGMAS.join(';\n'));
+        const start = process.hrtime.bigint();
+        for (const sql of Object.values(INDEXES).flat()) {
+            await call(db, 'run', sql);
+        }
+        indexSeconds = Number(process.hrtime.bigint() - start) / 1e9;
+        console.log(`[${mode}] built indexes in ${indexSeconds.toFixed(1)}s`);
+        // Planner statistics as database.js gathers them: PRAGMA optimize
+        // after the queries have run on the connection
+        for (const query of workload(args)) {
+            await call(db, query.method, query.sql, query.params());
+        }
+        await call(db, 'exec', 'PRAGMA optimize');
+    }
+
+    const queries = {};
+    for (const query of workload(args)) {
+        const repeat = query.name === 'history for user' ? Math.max(1, Math.floor(args.repeat / 10)) : args.repeat;
+        queries[query.name] = await timeQuery(db, query, repeat, tuned);
+        console.log(`[${mode}] ${query.name}: p50 ${queries[query.name].p50.toFixed(3)} ms, p99 ${queries[query.name].p99.toFixed(3)} ms`);
+    }
+    const insertsPerSecond = await timeInserts(db, args, tuned);
+    console.log(`[${mode}] history inserts: ${insertsPerSecond.toFixed(0)}/s`);
+
+    await call(db, 'close');
+    return { indexSeconds, queries, insertsPerSecond };
+}
+
+async function main() {
+    const args = parseArgs(process.argv.slice(2));
+    const scratch = fs.mkdtempSync(path.join(os.tmpdir(), 'fractal-db-bench-'));
+    const baselineFile = path.join(scratch, 'baseline.db');
+    const tunedFile = path.join(scratch, 'tuned.db');
+
+    try {
+        console.log(`Seeding ${args.fractals} fractals, ${args.history} history rows, ${args.users * args.galleryPerUser} gallery rows...`);
+        const start = process.hrtime.bigint();
+        await seed(baselineFile, args);
+        console.log(`Seeded in ${(Number(process.hrtime.bigint() - start) / 1e9).toFixed(1)}s`);
+        fs.copyFileSync(baselineFile, tunedFile);
+
+        const baseline = await runMode(baselineFile, 'baseline', args);
+        const tuned = await runMode(tunedFile, 'tuned', args);
+
+        console.log('\nSpeed-up (baseline p50 / tuned p50):');
+        for (const name of Object.keys(baseline.queries)) {
+            console.log(`  ${name}: ${(baseline.queries[name].p50 / tuned.queries[name].p50).toFixed(1)}x`);
+        }
+        console.log(`  history inserts: ${(tuned.insertsPerSecond / baseline.insertsPerSecond).toFixed(1)}x`);
+
+        const report = { date: new Date().toISOString(), node: process.version, seed: SEED, args, baseline, tuned };
+        const out = args.out || path.join(resultsDir, `db-${report.date.replace(/[:.]/g, '-')}.json`);
+        fs.mkdirSync(path.dirname(out), { recursive: true });
+        fs.writeFileSync(out, JSON.stringify(report, null, 2));
+        console.log(`Results written to ${out}`);
+    } finally {
+        fs.rmSync(scratch, { recursive: true, force: true });
+    }
+}
+
+main();
@@ -1,7 +1,23 @@
+import argparse
+import hashlib
+import json
+import math
 import os
+import random
+import struct
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import requests
 
+from api_client import ApiClient
+from fractal_params import fractal_options, options_hash, read_parameter_sets, row_options
+
 BASE_URL = ""
+client = None
 USERS = {
     "user": {"username": "user", "password": "user"},
     "user2": {"username": "user2", "password": "user2"},
@@ -11,13 +27,32 @@ USERS = {
 current_user_role = None
 current_token = None
 
+# Fetches the next page of a listing while the current one is on screen
+page_prefetcher = ThreadPoolExecutor(max_workers=1)
+
+# Batch renders retry a full render queue (429) with exponential backoff
+BATCH_RETRIES = 8
+BATCH_BACKOFF_SECONDS = 0.5
+BATCH_BACKOFF_MAX_SECONDS = 30
+
+# Gallery exports fetch listings in pages of this size
+EXPORT_PAGE_SIZE = 100
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_MAX_CHUNK_LENGTH = 2**31 - 1
+
+# Map tiles (see tileOptions in fractalService.js): level z splits the square
+# [-TILE_EXTENT, TILE_EXTENT]^2 of the plane into 2^z x 2^z tiles, for z up
+# to MAX_TILE_ZOOM
+TILE_EXTENT = 2
+MAX_TILE_ZOOM = 48
+
+# Interactive renders are progressive; their previews are saved here
+PREVIEW_DIR = "previews"
+
 def login(username, password):
     global current_token, current_user_role
     try:
-        r = requests.post(f"{BASE_URL}/auth/login", json={"username": username, "password": password})
-        r.raise_for_status()
-        data = r.json()
-        current_token = data['token']
+        current_token = client.login(username, password)
         current_user_role = username
 
         print(f"Logged in as {username}.")
@@ -28,6 +63,13 @@ def login(username, password):
         current_user_role = None
         return False
 
+def offset_input(text):
+    """An offset as typed, once checked to be a number. It is sent as a
+    string so the centre of a deep zoom keeps the digits a float would drop
+    (see exact_offset in fractal_params)."""
+    float(text)
+    return text.strip()
+
 def generate_fractal():
     if not current_token:
         print("Please log in first.")
@@ -46,23 +88,28 @@ def generate_fractal():
     offset_y = input("Offset Y (default 0): ")
     color_scheme = input("Color Scheme (rainbow, grayscale, fire, hsl - default rainbow): ")
 
-    params = {}
-    if width: params["width"] = int(width)
-    if height: params["height"] = int(height)
-    if iterations: params["iterations"] = int(iterations)
-    if power: params["power"] = float(power)
-    if c_real: params["real"] = float(c_real)
-    if c_imag: params["imag"] = float(c_imag)
-    if scale: params["scale"] = float(scale)
-    if offset_x: params["offsetX"] = float(offset_x)
-    if offset_y: params["offsetY"] = float(offset_y)
-    if color_scheme: params["color"] = color_scheme
-
-    headers = {"Authorization": f"Bearer {current_token}"}
+    body = {}
+    if width: body["width"] = int(width)
+    if height: body["height"] = int(height)
+    if iterations: body["maxIterations"] = int(iterations)
+    if power: body["power"] = float(power)
+    body["c"] = {}
+    if c_real: body["c"]["real"] = float(c_real)
+    if c_imag: body["c"]["imag"] = float(c_imag)
+    if scale: body["scale"] = float(scale)
+    if offset_x: body["offsetX"] = offset_input(offset_x)
+    if offset_y: body["offsetY"] = offset_input(offset_y)
+    if color_scheme: body["colorScheme"] = color_scheme
+
     try:
-        r = requests.get(f"{BASE_URL}/fractal", headers=headers, params=params, timeout=180)
+        r = client.submit_job({**body, "progressive": True}, current_user_role)
         r.raise_for_status()
-        data = r.json()
+        job = client.wait_for_job(r.json()["id"], current_user_role, on_update=PreviewFetcher(current_user_role))
+        print()
+        if job["status"] == "failed":
+            print(f"\nFractal generation failed: {job['error']['message']}")
+            return
+        data = job["result"]
         fractal_url = data.get('url')
         fractal_hash = data.get('hash')
         if fractal_url:
@@ -79,7 +126,39 @@ def generate_fractal():
     except requests.exceptions.RequestException as e:
         print(f"\nFractal generation failed: {e}")
 
-def list_users(limit=None, offset=None):
+def print_job_progress(job):
+    width = 30
+    filled = int(job.get("progress", 0) * width)
+    print(f"\r{job['status']:<8} [{'#' * filled}{'.' * (width - filled)}] {job.get('progress', 0) * 100:5.1f}%", end="", flush=True)
+
+class PreviewFetcher:
+    """Job update callback for a progressive render: prints its progress and
+    downloads each preview stage to PREVIEW_DIR as soon as the job lists it,
+    so the coarse image is on disk long before the full render finishes."""
+
+    def __init__(self, user):
+        self.user = user
+        self.fetched = set()
+
+    def __call__(self, job):
+        for stage in job.get("stages", []):
+            if stage["step"] in self.fetched:
+                continue
+            self.fetched.add(stage["step"])
+            try:
+                r = client.get(stage["url"], user=self.user, timeout=30)
+                r.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                print(f"\nPreview 1/{stage['step']} unavailable: {e}")
+                continue
+            os.makedirs(PREVIEW_DIR, exist_ok=True)
+            path = os.path.join(PREVIEW_DIR, f"{job['id']}-{stage['step']}.png")
+            with open(path, "wb") as f:
+                f.write(r.content)
+            print(f"\nPreview 1/{stage['step']} ({stage['width']}x{stage['height']}): {path}")
+        print_job_progress(job)
+
+def list_users(limit=None):
     if not current_token:
         print("Please log in first.")
         return
@@ -87,34 +166,14 @@ def list_users(limit=None, offset=None):
         print("Admin privileges required to list users.")
         return
 
-    headers = {"Authorization": f"Bearer {current_token}"}
     query_params = {}
     if limit is not None: query_params["limit"] = int(limit)
-    if offset is not None: query_params["offset"] = int(offset)
 
-    try:
-        r = requests.get(f"{BASE_URL}/admin/users", headers=headers, params=query_params)
-        r.raise_for_status()
-        response_data = r.json()
-        data = response_data.get('data', [])
-        total_count = response_data.get('totalCount', len(data))
-        current_limit = response_data.get('limit', len(data))
-        current_offset = response_data.get('offset', 0)
-
-        print(f"\n--- All Users (Total: {total_count}, Showing {current_offset}-{current_offset + len(data)} of {total_count}) ---")
-        if data:
-            for user in data:
-                print(f"ID: {user.get('id')}, Username: {user.get('username')}, Role: {user.get('role')}, Can Generate: {user.get('can_generate_fractals')}")
-        else:
-            print("No users found.")
+    def print_users(data):
+        for user in data:
+            print(f"ID: {user.get('id')}, Username: {user.get('username')}, Role: {user.get('role')}, Can Generate: {user.get('can_generate_fractals')}")
 
-        return {'data': data, 'totalCount': total_count, 'limit': current_limit, 'offset': current_offset}
-    except requests.exceptions.RequestException as e:
-        print(f"Failed to retrieve users: {e}")
-        if e.response is not None:
-            print(f"HTTP Status Code: {e.response.status_code}")
-            print(f"Response Body: {e.response.text}")
-        return None
+    browse("/admin/users", query_params, "All Users", print_users)
 
 def toggle_user_generation():
     if not current_token:
@@ -129,9 +188,8 @@ def toggle_user_generation():
         print("Invalid User ID. Please enter a number.")
         return
 
-    headers = {"Authorization": f"Bearer {current_token}"}
     try:
-        r = requests.put(f"{BASE_URL}/admin/users/{user_id}/toggle-generation", headers=headers)
+        r = client.put(f"/admin/users/{user_id}/toggle-generation", user=current_user_role)
         r.raise_for_status()
         response_data = r.json()
         new_status = response_data.get('can_generate_fractals', 'unknown')
@@ -142,7 +200,7 @@ def toggle_user_generation():
             print(f"HTTP Status Code: {e.response.status_code}")
             print(f"Response Body: {e.response.text}")
 
-def view_data(view_type="my_gallery", limit=None, offset=None, filters=None, sortBy=None, sortOrder=None, prompt_for_filters=True):
+def view_data(view_type="my_gallery", limit=None, filters=None, sortBy=None, sortOrder=None, prompt_for_filters=True):
     if not current_token:
         print("Please log in first.")
         return
@@ -172,7 +230,6 @@ def view_data(view_type="my_gallery", limit=None, offset=None, filters=None, sor
     query_params = {}
     if limit is not None:
         query_params["limit"] = int(limit)
-    if offset is not None: query_params["offset"] = int(offset)
 
     if prompt_for_filters:
         print("\n--- Filters (leave blank to skip) ---")
@@ -189,7 +246,7 @@ def view_data(view_type="my_gallery", limit=None, offset=None, filters=None, sor
         if width: filters["width"] = int(width)
         if height: filters["height"] = int(height)
 
-    for k, v in filters.items():
+    for k, v in (filters or {}).items():
         query_params[k] = v
 
     if sortBy is None: sortBy = input("Sort By (e.g., added_at, hash, width - leave blank for default): ")
@@ -197,52 +254,110 @@ def view_data(view_type="my_gallery", limit=None, offset=None, filters=None, sor
     if sortBy: query_params["sortBy"] = sortBy
     if sortOrder: query_params["sortOrder"] = sortOrder
 
+    browse(endpoint, query_params, title, print_fractal_entries)
+
+def print_fractal_entries(data):
+    for entry in data:
+        timestamp_field = 'added_at' if 'added_at' in entry else 'generated_at'
+        user_info = f", User: {entry.get('username')}" if 'username' in entry else ''
+
+        fractal_hash = entry.get('hash')
+        display_hash = fractal_hash[:8] + '...' if fractal_hash else 'N/A (Deleted)'
+
+        width = entry.get('width', 'N/A')
+        height = entry.get('height', 'N/A')
+        iterations = entry.get('iterations', 'N/A')
+        power = entry.get('power', 'N/A')
+        c_real = entry.get('c_real', 'N/A')
+        c_imag = entry.get('c_imag', 'N/A')
+        scale = entry.get('scale', 'N/A')
+        offset_x = entry.get('offsetX', 'N/A')
+        offset_y = entry.get('offsetY', 'N/A')
+        color_scheme = entry.get('colorScheme', 'N/A')
+
+        print(f"ID: {entry.get('id')}, Hash: {display_hash}{user_info}, Time: {entry.get(timestamp_field)}")
+        print(f"  Params: W:{width}, H:{height}, Iter:{iterations}, Power:{power}, C:{c_real}+{c_imag}i, Scale:{scale}, Offset:{offset_x},{offset_y}, Color:{color_scheme}")
+        if entry.get('url'):
+            print(f"  URL: {entry.get('url')}\n")
+
+def fetch_page(endpoint, query_params, cursor=None, with_count=False):
+    """Fetches one page of a listing, starting after `cursor` (None for the first page)."""
+    params = dict(query_params, cursor=cursor or "")
+    if with_count:
+        params["count"] = 1
+    r = client.get(endpoint, user=current_user_role, params=params)
+    r.raise_for_status()
+    return r.json()
+
+def browse(endpoint, query_params, title, print_entries):
+    """Pages through a listing by cursor. While a page is shown, the next one
+    is already being fetched in the background, so "Next Page" is instant."""
     clear_terminal()
-
-    headers = {"Authorization": f"Bearer {current_token}"}
     try:
-        r = requests.get(f"{BASE_URL}{endpoint}", headers=headers, params=query_params)
-        r.raise_for_status()
-        response_data = r.json()
-        data = response_data.get('data', [])
-        total_count = response_data.get('totalCount', len(data))
-        current_limit = response_data.get('limit', len(data))
-        current_offset = response_data.get('offset', 0)
-
-        if data:
-            print(f"\n--- {title} (Total: {total_count}, Showing {current_offset}-{current_offset + len(data)} of {total_count}) ---")
-            for entry in data:
-                timestamp_field = 'added_at' if 'added_at' in entry else 'generated_at'
-                user_info = f", User: {entry.get('username')}" if 'username' in entry else ''
-                
-                fractal_hash = entry.get('hash')
-                display_hash = fractal_hash[:8] + '...' if fractal_hash else 'N/A (Deleted)'
-                
-                width = entry.get('width', 'N/A')
-                height = entry.get('height', 'N/A')
-                iterations = entry.get('iterations', 'N/A')
-                power = entry.get('power', 'N/A')
-                c_real = entry.get('c_real', 'N/A')
-                c_imag = entry.get('c_imag', 'N/A')
-                scale = entry.get('scale', 'N/A')
-                offset_x = entry.get('offsetX', 'N/A')
-                offset_y = entry.get('offsetY', 'N/A')
-                color_scheme = entry.get('colorScheme', 'N/A')
-
-                print(f"ID: {entry.get('id')}, Hash: {display_hash}{user_info}, Time: {entry.get(timestamp_field)}")
-                print(f"  Params: W:{width}, H:{height}, Iter:{iterations}, Power:{power}, C:{c_real}+{c_imag}i, Scale:{scale}, Offset:{offset_x},{offset_y}, Color:{color_scheme}")
-                if entry.get('url'):
-                    print(f"  URL: {entry.get('url')}\n")
-                
-            return {'data': data, 'totalCount': total_count, 'limit': current_limit, 'offset': current_offset, 'filters': filters, 'sortBy': sortBy, 'sortOrder': sortOrder}
-        else:
-            print(f"No {title.lower()} items found for the current query.")
-            return {'data': [], 'totalCount': total_count, 'limit': current_limit, 'offset': current_offset, 'filters': filters, 'sortBy': sortBy, 'sortOrder': sortOrder}
+        page = fetch_page(endpoint, query_params, with_count=True)
     except requests.exceptions.RequestException as e:
-        print(f"Failed to retrieve {title.lower()}: {e}")
-        if e.response is not None:
-            print(f"HTTP Status Code: {e.response.status_code}")
-            print(f"Response Body: {e.response.text}")
+        print_request_error(f"Failed to retrieve {title.lower()}", e)
+        return
+
+    total_count = page.get('totalCount')
+    cursors = [None]  # the cursor each visited page was fetched with
+    shown = 0  # entries on the pages before the current one
+    sizes = []
+
+    while True:
+        data = page.get('data', [])
+        next_cursor = page.get('nextCursor')
+        prefetch = page_prefetcher.submit(fetch_page, endpoint, query_params, next_cursor) if next_cursor else None
+
+        if not data:
+            print(f"No {title.lower()} items found for the current query.")
+            return
+
+        total = total_count if total_count is not None else "?"
+        print(f"\n--- {title} (Total: {total}, Page {len(cursors)}, Showing {shown + 1}-{shown + len(data)} of {total}) ---")
+        print_entries(data)
+
+        can_go_back = len(cursors) > 1
+        if not (next_cursor or can_go_back):
+            return
+
+        print("\nNavigation:")
+        if can_go_back:
+            print("  1. Previous Page")
+        if next_cursor:
+            print("  2. Next Page")
+        print("  Any other key to exit pagination.")
+
+        nav_choice = input("Enter your choice: ")
+        try:
+            if nav_choice == '2' and next_cursor:
+                clear_terminal()
+                page = prefetch.result()
+                cursors.append(next_cursor)
+                sizes.append(len(data))
+                shown += len(data)
+            elif nav_choice == '1' and can_go_back:
+                clear_terminal()
+                if prefetch:
+                    prefetch.cancel()
+                cursors.pop()
+                shown -= sizes.pop()
+                page = fetch_page(endpoint, query_params, cursors[-1])
+            else:
+                return
+        except requests.exceptions.RequestException as e:
+            print_request_error(f"Failed to retrieve {title.lower()}", e)
+            return
+
+def print_request_error(message, e):
+    print(f"{message}: {e}")
+    if e.response is not None:
+        print(f"HTTP Status Code: {e.response.status_code}")
+        print(f"Response Body: {e.response.text}")
+
+def prompt_limit():
+    limit_input = input("Enter page size (leave blank for default 5): ")
+    return int(limit_input) if limit_input.isdigit() else 5
 
 def clear_terminal():
     os.system('cls' if os.name == 'nt' else 'clear')
@@ -257,9 +372,8 @@ def delete_gallery_entry():
         print("Invalid ID. Please enter a number.")
         return
 
-    headers = {"Authorization": f"Bearer {current_token}"}
     try:
-        r = requests.delete(f"{BASE_URL}/gallery/{gallery_id}", headers=headers)
+        r = client.delete(f"/gallery/{gallery_id}", user=current_user_role)
         r.raise_for_status()
         print(f"Gallery entry {gallery_id} deleted successfully.")
     except requests.exceptions.HTTPError as e:
@@ -274,12 +388,517 @@ def delete_gallery_entry():
     except requests.exceptions.RequestException as e:
         print(f"Failed to delete gallery entry {gallery_id}: {e}")
 
+class BatchManifest:
+    """Hashes of the fractals a batch has finished, kept as JSON lines next to
+    the input file. A restarted batch skips every hash already listed."""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self.lock = threading.Lock()
+        text = ""
+        if os.path.exists(path):
+            with open(path) as f:
+                text = f.read()
+            for line in text.splitlines():
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by an interrupted run
+                if isinstance(entry, dict) and entry.get("hash"):
+                    self.done.add(entry["hash"])
+        self.file = open(path, "a")
+        if text and not text.endswith("\n"):
+            self.file.write("\n")
+
+    def __contains__(self, fractal_hash):
+        return fractal_hash in self.done
+
+    def record(self, entry):
+        line = json.dumps(entry)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+            self.done.add(entry["hash"])
+
+    def close(self):
+        self.file.close()
+
+class BatchStats:
+    """Thread-safe counters and timings for a batch run."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rendered = 0
+        self.cached = 0
+        self.failed = 0
+        self.retries = 0
+        self.pixels = 0
+        self.latencies = []
+
+    def retry(self):
+        with self.lock:
+            self.retries += 1
+
+    def finish(self, options, seconds, result=None):
+        with self.lock:
+            self.latencies.append(seconds)
+            if result is None:
+                self.failed += 1
+            elif result.get("cached"):
+                self.cached += 1
+            else:
+                self.rendered += 1
+                self.pixels += options["width"] * options["height"]
+
+    def report(self, elapsed, skipped, duplicates):
+        latencies = sorted(self.latencies)
+        completed = self.rendered + self.cached
+        percentile = lambda pct: latencies[min(len(latencies) - 1, int(pct / 100 * len(latencies)))] if latencies else None
+        return {
+            "elapsed": elapsed,
+            "skipped": skipped,
+            "duplicates": duplicates,
+            "rendered": self.rendered,
+            "cached": self.cached,
+            "failed": self.failed,
+            "retries": self.retries,
+            "fractalsPerSecond": completed / elapsed if elapsed else None,
+            "megapixelsPerSecond": self.pixels / elapsed / 1e6 if elapsed else None,
+            "latency": {"p50": percentile(50), "p90": percentile(90), "max": latencies[-1] if latencies else None}
+        }
+
+def render_batch_item(username, options, stats, poll=False):
+    """Renders one parameter set as a job and returns the job's result.
+
+    A full render queue (429) is retried with exponential backoff and jitter,
+    waiting at least as long as the server's Retry-After; any other failure
+    (such as 422, predicted to run over the time limit) raises RuntimeError
+    with the status and message.
+    """
+    for attempt in range(BATCH_RETRIES + 1):
+        r = client.submit_job(options, username)
+        retry_after = 0
+        if r.status_code == 202:
+            job = client.wait_for_job(r.json()["id"], username, stream=not poll)
+            if job["status"] == "done":
+                return job["result"]
+            status, message = job["error"]["status"], job["error"]["message"]
+        else:
+            status, message = r.status_code, r.text
+            try:
+                retry_after = float(r.headers.get("Retry-After", 0))
+            except ValueError:
+                pass
+        if status != 429 or attempt == BATCH_RETRIES:
+            raise RuntimeError(f"{status}: {message}")
+        stats.retry()
+        delay = min(BATCH_BACKOFF_MAX_SECONDS, BATCH_BACKOFF_SECONDS * 2 ** attempt)
+        time.sleep(max(retry_after, delay * random.uniform(0.5, 1)))
+
+def run_batch(path, username, concurrency=4, manifest_path=None, poll=False, report_path=None):
+    """Renders every parameter set in `path` (JSON, JSON lines or CSV),
+    `concurrency` at a time, and prints a throughput report. Returns the
+    number of failed renders."""
+    bodies = read_parameter_sets(path)
+    manifest = BatchManifest(manifest_path or f"{path}.done.jsonl")
+
+    # The server stores each fractal under the sha256 of its normalised
+    # options, so the same hash identifies work that is already done.
+    pending = {}
+    skipped = duplicates = 0
+    for body in bodies:
+        options = fractal_options(body)
+        fractal_hash = options_hash(options)
+        if fractal_hash in manifest:
+            skipped += 1
+        elif fractal_hash in pending:
+            duplicates += 1
+        else:
+            pending[fractal_hash] = options
+    print(f"{len(bodies)} parameter sets: {skipped} already in {manifest.path}, {duplicates} duplicates, "
+          f"{len(pending)} to render ({concurrency} at a time).")
+
+    if pending and not login(USERS[username]["username"], USERS[username]["password"]):
+        manifest.close()
+        return len(pending)
+
+    stats = BatchStats()
+    print_lock = threading.Lock()
+
+    def render(fractal_hash, options):
+        start = time.time()
+        try:
+            result = render_batch_item(username, options, stats, poll)
+        except (requests.exceptions.RequestException, RuntimeError) as e:
+            stats.finish(options, time.time() - start)
+            with print_lock:
+                print(f"FAILED {fractal_hash}: {e}")
+            return
+        seconds = time.time() - start
+        if result.get("hash") and result["hash"] != fractal_hash:
+            with print_lock:
+                print(f"Warning: server stored {fractal_hash} as {result['hash']}; restarts will not skip it.")
+        manifest.record({"hash": fractal_hash, "url": result.get("url"), "cached": bool(result.get("cached")),
+                         "seconds": round(seconds, 3)})
+        stats.finish(options, seconds, result)
+        with print_lock:
+            done = stats.rendered + stats.cached + stats.failed
+            print(f"[{done}/{len(pending)}] {fractal_hash} {'cached' if result.get('cached') else 'rendered'} in {seconds:.2f}s")
+
+    start = time.time()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        futures = [executor.submit(render, h, options) for h, options in pending.items()]
+        for future in as_completed(futures):
+            future.result()
+    except KeyboardInterrupt:
+        print("\nInterrupted; finished fractals are in the manifest and will be skipped next time.")
+        executor.shutdown(wait=False, cancel_futures=True)
+    finally:
+        executor.shutdown(wait=True)
+        manifest.close()
+
+    report = stats.report(time.time() - start, skipped, duplicates)
+    print_batch_report(report)
+    if report_path:
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {report_path}")
+    return stats.failed
+
+def print_batch_report(report):
+    print("\n--- Batch Report ---")
+    print(f"Elapsed: {report['elapsed']:.1f}s")
+    print(f"Rendered: {report['rendered']}, served from cache: {report['cached']}, failed: {report['failed']}, "
+          f"skipped: {report['skipped']}, duplicates: {report['duplicates']}, 429 retries: {report['retries']}")
+    if report["fractalsPerSecond"] is not None:
+        print(f"Throughput: {report['fractalsPerSecond']:.2f} fractals/s, {report['megapixelsPerSecond']:.2f} rendered Mpixels/s")
+    if report["latency"]["p50"] is not None:
+        print(f"Latency: p50 {report['latency']['p50']:.2f}s, p90 {report['latency']['p90']:.2f}s, max {report['latency']['max']:.2f}s")
+
+def png_state(path):
+    """Walks the chunks of the PNG in `path`, checking each against its CRC.
+    Returns "complete" if they all check out up to a final IEND chunk,
+    "truncated" if the file is a sound but unfinished PNG (or is missing),
+    and "corrupt" otherwise, e.g. when a resumed download spliced the bytes
+    of two different images."""
+    try:
+        with open(path, "rb") as f:
+            signature = f.read(len(PNG_SIGNATURE))
+            if signature != PNG_SIGNATURE:
+                return "truncated" if PNG_SIGNATURE.startswith(signature) else "corrupt"
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    return "truncated"
+                length, chunk_type = struct.unpack(">I4s", header)
+                if length > PNG_MAX_CHUNK_LENGTH:
+                    return "corrupt"
+                crc = zlib.crc32(chunk_type)
+                remaining = length
+                while remaining:
+                    data = f.read(min(remaining, 1 << 20))
+                    if not data:
+                        return "truncated"
+                    crc = zlib.crc32(data, crc)
+                    remaining -= len(data)
+                stored = f.read(4)
+                if len(stored) < 4:
+                    return "truncated"
+                if struct.unpack(">I", stored)[0] != crc:
+                    return "corrupt"
+                if chunk_type == b"IEND":
+                    return "complete" if not f.read(1) else "corrupt"
+    except FileNotFoundError:
+        return "truncated"
+    except OSError:
+        return "corrupt"
+
+def is_complete_png(path):
+    return png_state(path) == "complete"
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def download_image(url, fractal_hash, out_dir):
+    """Downloads one image to <out_dir>/<hash>.png. Returns "present" if a
+    complete copy was already there, "resumed" or "downloaded" otherwise.
+
+    Bytes arrive in <hash>.png.part, which a later run continues with a
+    Range request. If-Range makes the server send the whole image instead
+    if the part belongs to different content. The ETag names the render
+    options, not the bytes, so a part continued from a different render of
+    the same options is caught by png_state's CRCs instead: it is thrown
+    away and the image downloaded whole.
+    """
+    path = os.path.join(out_dir, f"{fractal_hash}.png")
+    if is_complete_png(path):
+        return "present"
+    part = path + ".part"
+    etag = f'"{fractal_hash}"'
+
+    for attempt in range(2):
+        state = png_state(part)
+        if state == "complete":
+            os.replace(part, path)
+            return "resumed"
+        if state == "corrupt":
+            os.remove(part)
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        headers = {"Range": f"bytes={offset}-", "If-Range": etag} if offset else {}
+        with client.get(url, headers=headers, stream=True, timeout=(10, 300)) as r:
+            if r.status_code == 416 and attempt == 0:
+                os.remove(part)  # longer than the image: start again
+                continue
+            r.raise_for_status()
+            if r.headers.get("ETag", etag) != etag:
+                raise RuntimeError(f"server sent {r.headers['ETag']} for {fractal_hash}")
+            resumed = r.status_code == 206
+            with open(part, "ab" if resumed else "wb") as f:
+                for chunk in r.iter_content(chunk_size=1 << 16):
+                    f.write(chunk)
+        state = png_state(part)
+        if state == "complete":
+            os.replace(part, path)
+            return "resumed" if resumed else "downloaded"
+        if state == "corrupt" and resumed and attempt == 0:
+            continue  # the part was another render's: start again
+        if state == "corrupt":
+            os.remove(part)
+            raise RuntimeError(f"corrupt image for {fractal_hash}")
+        raise RuntimeError(f"incomplete image for {fractal_hash} ({os.path.getsize(part)} bytes kept for resuming)")
+    raise RuntimeError(f"could not download {fractal_hash}")
+
+def load_export_index(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def write_export_index(path, index):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp, path)
+
+def run_export(username, out_dir, admin=False, concurrency=8):
+    """Downloads every image in the user's gallery (or, with `admin`, every
+    gallery) into `out_dir` and writes index.json there, mapping each hash to
+    its parameters, gallery entries and the sha256 of the image bytes.
+
+    Images already in `out_dir` are kept if they are complete and match the
+    sha256 recorded by an earlier export. Returns the number of failures."""
+    endpoint = "/admin/gallery" if admin else "/gallery"
+    if not login(USERS[username]["username"], USERS[username]["password"]):
+        return 1
+    os.makedirs(out_dir, exist_ok=True)
+    index_path = os.path.join(out_dir, "index.json")
+    index = load_export_index(index_path)
+
+    counts = {"present": 0, "resumed": 0, "downloaded": 0, "failed": 0}
+    downloaded_bytes = [0]
+    lock = threading.Lock()
+    in_flight = threading.BoundedSemaphore(concurrency * 2)
+
+    def download(url, fractal_hash, expected_sha256):
+        path = os.path.join(out_dir, f"{fractal_hash}.png")
+        try:
+            outcome = download_image(url, fractal_hash, out_dir)
+            digest = file_sha256(path)
+            if outcome == "present" and expected_sha256 and digest != expected_sha256:
+                # Complete-looking but not the bytes exported last time
+                os.remove(path)
+                outcome = download_image(url, fractal_hash, out_dir)
+                digest = file_sha256(path)
+            size = os.path.getsize(path)
+        except (requests.exceptions.RequestException, OSError, RuntimeError) as e:
+            with lock:
+                counts["failed"] += 1
+                print(f"FAILED {fractal_hash}: {e}")
+            return
+        finally:
+            in_flight.release()
+        with lock:
+            counts[outcome] += 1
+            if outcome != "present":
+                downloaded_bytes[0] += size
+            index[fractal_hash].update(file=f"{fractal_hash}.png", bytes=size, sha256=digest)
+            done = sum(counts.values())
+            if done % 50 == 0:
+                print(f"{done} images: {counts['downloaded']} downloaded, {counts['resumed']} resumed, "
+                      f"{counts['present']} already present, {counts['failed']} failed")
+
+    start = time.time()
+    entries = 0
+    queued = set()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    interrupted = False
+    try:
+        cursor = None
+        while True:
+            page = fetch_page(endpoint, {"limit": EXPORT_PAGE_SIZE}, cursor)
+            for entry in page.get("data", []):
+                fractal_hash = entry.get("hash")
+                if not fractal_hash or not entry.get("url"):
+                    continue  # the fractal was deleted
+                entries += 1
+                options = row_options(entry)
+                if options_hash(options) != fractal_hash:
+                    print(f"Warning: parameters of gallery entry {entry.get('id')} do not hash to {fractal_hash}")
+                gallery_entry = {k: entry[k] for k in ("id", "user_id", "username", "added_at") if k in entry}
+                with lock:
+                    record = index.setdefault(fractal_hash, {})
+                    expected_sha256 = record.get("sha256")
+                    record["params"] = options
+                    known = [g for g in record.get("gallery", []) if g.get("id") != gallery_entry.get("id")]
+                    record["gallery"] = known + [gallery_entry]
+                if fractal_hash in queued:
+                    continue
+                queued.add(fractal_hash)
+                in_flight.acquire()
+                executor.submit(download, entry["url"], fractal_hash, expected_sha256)
+            cursor = page.get("nextCursor")
+            if not cursor:
+                break
+    except requests.exceptions.RequestException as e:
+        print_request_error("Failed to list the gallery", e)
+        with lock:
+            counts["failed"] += 1
+    except KeyboardInterrupt:
+        interrupted = True
+        print("\nInterrupted; partial downloads are kept and resumed next time.")
+        executor.shutdown(wait=False, cancel_futures=True)
+    finally:
+        executor.shutdown(wait=True)
+        write_export_index(index_path, index)
+
+    elapsed = time.time() - start
+    print("\n--- Export Report ---")
+    print(f"{entries} gallery entries, {len(queued)} distinct images in {elapsed:.1f}s{' (interrupted)' if interrupted else ''}")
+    print(f"Downloaded: {counts['downloaded']}, resumed: {counts['resumed']}, already present: {counts['present']}, failed: {counts['failed']}")
+    print(f"Transferred {downloaded_bytes[0] / 1e6:.1f} MB, {downloaded_bytes[0] / 1e6 / elapsed if elapsed else 0:.2f} MB/s")
+    print(f"Index written to {index_path}")
+    return counts["failed"]
+
+def level_tiles(z, center, radius):
+    """First and last (x, y) of the tiles on level z that overlap the square
+    of half-width `radius` around `center`."""
+    tiles = 2 ** z
+    size = 2 * TILE_EXTENT / tiles
+    first = [max(0, math.floor((c - radius + TILE_EXTENT) / size)) for c in center]
+    last = [min(tiles - 1, math.ceil((c + radius + TILE_EXTENT) / size) - 1) for c in center]
+    return first, last
+
+def pyramid_tiles(min_zoom, max_zoom, center, radius):
+    """(z, x, y) of every tile that overlaps the square of half-width `radius`
+    around `center`, on each level from min_zoom to max_zoom, coarsest first.
+    Generated lazily: deep pyramids are far too big to list."""
+    for z in range(min_zoom, max_zoom + 1):
+        first, last = level_tiles(z, center, radius)
+        for y in range(first[1], last[1] + 1):
+            for x in range(first[0], last[0] + 1):
+                yield z, x, y
+
+def pyramid_size(min_zoom, max_zoom, center, radius):
+    """Number of tiles pyramid_tiles yields."""
+    total = 0
+    for z in range(min_zoom, max_zoom + 1):
+        first, last = level_tiles(z, center, radius)
+        total += max(0, last[0] - first[0] + 1) * max(0, last[1] - first[1] + 1)
+    return total
+
+def fetch_tile(username, z, x, y, params):
+    """Requests one tile, retrying a full render queue (429) with the same
+    backoff as batch renders. Returns the response."""
+    for attempt in range(BATCH_RETRIES + 1):
+        r = client.get(f"/tiles/{z}/{x}/{y}.png", user=username, params=params, timeout=(10, 300))
+        if r.status_code != 429 or attempt == BATCH_RETRIES:
+            r.raise_for_status()
+            return r
+        try:
+            retry_after = float(r.headers.get("Retry-After", 0))
+        except ValueError:
+            retry_after = 0
+        delay = min(BATCH_BACKOFF_MAX_SECONDS, BATCH_BACKOFF_SECONDS * 2 ** attempt)
+        time.sleep(max(retry_after, delay * random.uniform(0.5, 1)))
+
+def run_prefetch(username, params, min_zoom, max_zoom, center=(0, 0), radius=TILE_EXTENT, concurrency=8, out_dir=None):
+    """Fetches the zoom pyramid of tiles around `center` (see pyramid_tiles),
+    `concurrency` at a time, so the server renders them into its tile cache.
+    With `out_dir`, tiles are also saved as <out_dir>/<z>/<x>/<y>.png and
+    ones already there are skipped. Returns the number of failures."""
+    if not login(USERS[username]["username"], USERS[username]["password"]):
+        return 1
+    if max_zoom > MAX_TILE_ZOOM:
+        print(f"The server has no tiles past level {MAX_TILE_ZOOM}; stopping there.")
+        max_zoom = MAX_TILE_ZOOM
+    total = pyramid_size(min_zoom, max_zoom, center, radius)
+    print(f"{total} tiles on levels {min_zoom}-{max_zoom} ({concurrency} at a time).")
+
+    counts = {"hit": 0, "miss": 0, "present": 0, "failed": 0}
+    lock = threading.Lock()
+    in_flight = threading.BoundedSemaphore(concurrency * 2)
+
+    def prefetch(z, x, y):
+        path = os.path.join(out_dir, str(z), str(x), f"{y}.png") if out_dir else None
+        try:
+            if path and is_complete_png(path):
+                outcome = "present"
+            else:
+                r = fetch_tile(username, z, x, y, params)
+                outcome = "hit" if r.headers.get("X-Tile-Cache") == "hit" else "miss"
+                if path:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    with open(path + ".part", "wb") as f:
+                        f.write(r.content)
+                    os.replace(path + ".part", path)
+        except (requests.exceptions.RequestException, OSError) as e:
+            with lock:
+                counts["failed"] += 1
+                print(f"FAILED {z}/{x}/{y}: {e}")
+            return
+        finally:
+            in_flight.release()
+        with lock:
+            counts[outcome] += 1
+            done = sum(counts.values())
+            if done % 50 == 0 or done == total:
+                print(f"[{done}/{total}] {counts['miss']} rendered, {counts['hit']} cached, "
+                      f"{counts['present']} already saved, {counts['failed']} failed")
+
+    start = time.time()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        # Submitted coarsest level first, so the overview is ready soonest,
+        # and only a few ahead of the workers
+        for tile in pyramid_tiles(min_zoom, max_zoom, center, radius):
+            in_flight.acquire()
+            executor.submit(prefetch, *tile)
+    except KeyboardInterrupt:
+        print("\nInterrupted; cached tiles will be served without rendering next time.")
+        executor.shutdown(wait=False, cancel_futures=True)
+    finally:
+        executor.shutdown(wait=True)
+
+    elapsed = time.time() - start
+    print("\n--- Prefetch Report ---")
+    print(f"Elapsed: {elapsed:.1f}s, {sum(counts.values()) / elapsed if elapsed else 0:.1f} tiles/s")
+    print(f"Rendered: {counts['miss']}, served from cache: {counts['hit']}, already saved: {counts['present']}, failed: {counts['failed']}")
+    return counts["failed"]
+
 def main_menu():
-    global BASE_URL
+    global BASE_URL, client
     ip_address = input("Enter the server IP address (leave empty for localhost): ")
     if not ip_address:
         ip_address = "localhost"
     BASE_URL = f"http://{ip_address}:3000/api"
+    client = ApiClient(BASE_URL)
     
 
     while True:
@@ -327,59 +946,8 @@ def main_menu():
             input("\nPress Enter to continue...")
             
         elif choice == "3":
-            current_limit = None
-            current_offset = 0
             print("\n--- View My Gallery ---")
-            limit_input = input(f"Enter limit (leave blank for default 5, current: {current_limit if current_limit is not None else 'default'}):")
-            offset_input = input(f"Enter offset (leave blank for current {current_offset}): ")
-            
-            limit = int(limit_input) if limit_input else current_limit
-            offset = int(offset_input) if offset_input else current_offset
-
-            if limit is None:
-                limit = 5
-
-            filters = None
-            sortBy = None
-            sortOrder = None
-            prompt_for_filters_my_gallery = True
-
-            while True:
-                result = view_data(view_type="my_gallery", limit=limit, offset=offset, filters=filters, sortBy=sortBy, sortOrder=sortOrder, prompt_for_filters=prompt_for_filters_my_gallery)
-                
-                if result:
-                    current_limit = result['limit']
-                    current_offset = result['offset']
-                    total_count = result['totalCount']
-                    filters = result['filters']
-                    sortBy = result['sortBy']
-                    sortOrder = result['sortOrder']
-                    prompt_for_filters_my_gallery = False
-                    
-                    has_more_pages = current_offset + len(result['data']) < total_count
-                    can_go_back = current_offset > 0
-
-                    if result['data'] and (has_more_pages or can_go_back):
-                        print("\nNavigation:")
-                        if can_go_back:
-                            print("  1. Previous Page")
-                        if has_more_pages:
-                            print("  2. Next Page")
-                        print("  Any other key to exit pagination.")
-
-                        nav_choice = input("Enter your choice: ")
-
-                        if nav_choice == '1' and can_go_back:
-                            clear_terminal()
-                            offset = max(0, offset - current_limit)
-                            continue
-                        elif nav_choice == '2' and has_more_pages:
-                            clear_terminal()
-                            offset += current_limit
-                            continue
-                    break
-                else:
-                    break
+            view_data(view_type="my_gallery", limit=prompt_limit())
             input("\nPress Enter to continue...")
         
         elif choice == "4":
@@ -412,174 +980,20 @@ def admin_menu():
         choice = input("Enter your choice: ")
 
         if choice == "1":
-            current_limit = None
-            current_offset = 0
             print("\n--- List All Users (Admin) ---")
-            limit_input = input(f"Enter limit (leave blank for default 5, current: {current_limit if current_limit is not None else 'default'}):")
-            offset_input = input(f"Enter offset (leave blank for current {current_offset}): ")
-                
-            limit = int(limit_input) if limit_input else current_limit
-            offset = int(offset_input) if offset_input else current_offset
-
-            if limit is None:
-                limit = 5
-
-            filters = None # Users don't have filters yet
-            sortBy = None # Users don't have sortBy yet
-            sortOrder = None # Users don't have sortOrder yet
-            prompt_for_filters_all_users = False # No filters for users
-
-            while True:
-                result = list_users(limit=limit, offset=offset)
-                
-                if result:
-                    current_limit = result['limit']
-                    current_offset = result['offset']
-                    total_count = result['totalCount']
-                    
-                    has_more_pages = current_offset + len(result['data']) < total_count
-                    can_go_back = current_offset > 0
-
-                    if result['data'] and (has_more_pages or can_go_back):
-                        print("\nNavigation:")
-                        if can_go_back:
-                            print("  1. Previous Page")
-                        if has_more_pages:
-                            print("  2. Next Page")
-                        print("  Any other key to exit pagination.")
-
-                        nav_choice = input("Enter your choice: ")
-
-                        if nav_choice == '1' and can_go_back:
-                            clear_terminal()
-                            offset = max(0, offset - current_limit)
-                            
-                            continue
-                        elif nav_choice == '2' and has_more_pages:
-                            clear_terminal()
-                            offset += current_limit
-                            
-                            continue
-                    break
-                else:
-                    break
+            list_users(limit=prompt_limit())
             input("\nPress Enter to continue...")
         elif choice == "2":
             clear_terminal()
             toggle_user_generation()
             input("\nPress Enter to continue...")
         elif choice == "3":
-            current_limit = None
-            current_offset = 0
             print("\n--- View All History (Admin) ---")
-            limit_input = input(f"Enter limit (leave blank for default 5, current: {current_limit if current_limit is not None else 'default'}):")
-            offset_input = input(f"Enter offset (leave blank for current {current_offset}): ")
-                
-            limit = int(limit_input) if limit_input else current_limit
-            offset = int(offset_input) if offset_input else current_offset
-
-            if limit is None:
-                limit = 5
-
-            filters = None
-            sortBy = None
-            sortOrder = None
-            prompt_for_filters_all_history = True
-
-            while True:
-                result = view_data(view_type="all_history", limit=limit, offset=offset, filters=filters, sortBy=sortBy, sortOrder=sortOrder, prompt_for_filters=prompt_for_filters_all_history)
-                
-                if result:
-                    current_limit = result['limit']
-                    current_offset = result['offset']
-                    total_count = result['totalCount']
-                    filters = result['filters']
-                    sortBy = result['sortBy']
-                    sortOrder = result['sortOrder']
-                    prompt_for_filters_all_history = False
-                    
-                    has_more_pages = current_offset + len(result['data']) < total_count
-                    can_go_back = current_offset > 0
-
-                    if result['data'] and (has_more_pages or can_go_back):
-                        print("\nNavigation:")
-                        if can_go_back:
-                            print("  1. Previous Page")
-                        if has_more_pages:
-                            print("  2. Next Page")
-                        print("  Any other key to exit pagination.")
-
-                        nav_choice = input("Enter your choice: ")
-
-                        if nav_choice == '1' and can_go_back:
-                            clear_terminal()
-                            offset = max(0, offset - current_limit)
-                            
-                            continue
-                        elif nav_choice == '2' and has_more_pages:
-                            clear_terminal()
-                            offset += current_limit
-                            
-                            continue
-                    break
-                else:
-                    break
+            view_data(view_type="all_history", limit=prompt_limit())
             input("\nPress Enter to continue...")
         elif choice == "4":
-            current_limit = None
-            current_offset = 0
             print("\n--- View All Gallery (Admin) ---")
-            limit_input = input(f"Enter limit (leave blank for default 5, current: {current_limit if current_limit is not None else 'default'}):")
-            offset_input = input(f"Enter offset (leave blank for current {current_offset}): ")
-                
-            limit = int(limit_input) if limit_input else current_limit
-            offset = int(offset_input) if offset_input else current_offset
-
-            if limit is None:
-                limit = 5
-
-            filters = None
-            sortBy = None
-            sortOrder = None
-            prompt_for_filters_all_gallery = True
-
-            while True:
-                result = view_data(view_type="all_gallery", limit=limit, offset=offset, filters=filters, sortBy=sortBy, sortOrder=sortOrder, prompt_for_filters=prompt_for_filters_all_gallery)
-                
-                if result:
-                    current_limit = result['limit']
-                    current_offset = result['offset']
-                    total_count = result['totalCount']
-                    filters = result['filters']
-                    sortBy = result['sortBy']
-                    sortOrder = result['sortOrder']
-                    prompt_for_filters_all_gallery = False
-                    
-                    has_more_pages = current_offset + len(result['data']) < total_count
-                    can_go_back = current_offset > 0
-
-                    if result['data'] and (has_more_pages or can_go_back):
-                        print("\nNavigation:")
-                        if can_go_back:
-                            print("  1. Previous Page")
-                        if has_more_pages:
-                            print("  2. Next Page")
-                        print("  Any other key to exit pagination.")
-
-                        nav_choice = input("Enter your choice: ")
-
-                        if nav_choice == '1' and can_go_back:
-                            clear_terminal()
-                            offset = max(0, offset - current_limit)
-                            continue
-                        elif nav_choice == '2' and has_more_pages:
-                            clear_terminal()
-                            offset += current_limit
-                            
-                            continue
-                    break
-                else:
-                    break
+            view_data(view_type="all_gallery", limit=prompt_limit())
             input("\nPress Enter to continue...")
         elif choice == "5":
             break
@@ -587,5 +1001,61 @@ def admin_menu():
             print("\nInvalid choice. Please try again.")
             input("Press Enter to continue...")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Client for the fractal API. Runs the interactive menu unless a subcommand is given.")
+    subcommands = parser.add_subparsers(dest="command")
+    batch = subcommands.add_parser("batch", help="Render every parameter set in a JSON, JSON lines or CSV file")
+    batch.add_argument("file", help="Parameter sets: a JSON list, JSON lines, or CSV with a header of option names (c.real/c_real, c.imag/c_imag for c)")
+    batch.add_argument("--host", default="localhost", help="Server IP address (default localhost)")
+    batch.add_argument("--user", choices=list(USERS.keys()), default="user", help="Account to render as (default user)")
+    batch.add_argument("--concurrency", type=int, default=4, help="Renders in flight at once (default 4)")
+    batch.add_argument("--manifest", help="Manifest of finished hashes (default <file>.done.jsonl)")
+    batch.add_argument("--poll", action="store_true", help="Poll job status instead of streaming progress events")
+    batch.add_argument("--report", help="Also write the throughput report to this JSON file")
+    export = subcommands.add_parser("export", help="Download a gallery's images and write a metadata index")
+    export.add_argument("out", nargs="?", default="gallery_export", help="Output directory (default ./gallery_export)")
+    export.add_argument("--host", default="localhost", help="Server IP address (default localhost)")
+    export.add_argument("--user", choices=list(USERS.keys()), default="user", help="Account whose gallery to export (default user)")
+    export.add_argument("--all", action="store_true", help="Export every user's gallery through /admin/gallery (needs --user admin)")
+    export.add_argument("--concurrency", type=int, default=8, help="Parallel downloads (default 8)")
+    tiles = subcommands.add_parser("tiles", help="Prefetch a zoom pyramid of map tiles into the server's tile cache")
+    tiles.add_argument("--host", default="localhost", help="Server IP address (default localhost)")
+    tiles.add_argument("--user", choices=list(USERS.keys()), default="user", help="Account to render as (default user)")
+    tiles.add_argument("--concurrency", type=int, default=8, help="Tiles in flight at once (default 8)")
+    tiles.add_argument("--min-zoom", type=int, default=0, help="Coarsest level (default 0, one tile for the whole set)")
+    tiles.add_argument("--max-zoom", type=int, default=4, help=f"Finest level (default 4, at most {MAX_TILE_ZOOM})")
+    tiles.add_argument("--center", type=float, nargs=2, default=(0, 0), metavar=("X", "Y"), help="Centre of the region to prefetch (default 0 0)")
+    tiles.add_argument("--radius", type=float, default=TILE_EXTENT, help=f"Half-width of the region to prefetch (default {TILE_EXTENT}, the whole set)")
+    tiles.add_argument("--iterations", type=int, help="Max iterations (default 500)")
+    tiles.add_argument("--power", type=float, help="Power (default 2)")
+    tiles.add_argument("--c-real", type=float, help="C real part (default 0.285)")
+    tiles.add_argument("--c-imag", type=float, help="C imaginary part (default 0.01)")
+    tiles.add_argument("--color-scheme", help="Colour scheme (default rainbow)")
+    tiles.add_argument("--out", help="Also save the tiles as <out>/<z>/<x>/<y>.png")
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "batch":
+        BASE_URL = f"http://{args.host}:3000/api"
+        concurrency = max(1, args.concurrency)
+        client = ApiClient(BASE_URL, pool_size=concurrency)
+        failed = run_batch(args.file, args.user, concurrency, args.manifest, args.poll, args.report)
+        sys.exit(1 if failed else 0)
+    if args.command == "export":
+        BASE_URL = f"http://{args.host}:3000/api"
+        concurrency = max(1, args.concurrency)
+        client = ApiClient(BASE_URL, pool_size=concurrency + 1)
+        failed = run_export(args.user, args.out, args.all, concurrency)
+        sys.exit(1 if failed else 0)
+    if args.command == "tiles":
+        BASE_URL = f"http://{args.host}:3000/api"
+        concurrency = max(1, args.concurrency)
+        client = ApiClient(BASE_URL, pool_size=concurrency)
+        params = {"maxIterations": args.iterations, "power": args.power, "c_real": args.c_real,
+                  "c_imag": args.c_imag, "colorScheme": args.color_scheme}
+        params = {k: v for k, v in params.items() if v is not None}
+        failed = run_prefetch(args.user, params, max(0, args.min_zoom), args.max_zoom, args.center, args.radius,
+                              concurrency, args.out)
+        sys.exit(1 if failed else 0)
     main_menu()
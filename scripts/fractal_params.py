@@ -0,0 +1,249 @@
+"""Fractal parameter handling shared by the Python tools.
+
+Mirrors how POST /api/generate normalises a request body into `options` and
+hashes them, so offline renders and clients agree with the server on the
+sha256 name a fractal is stored under.
+"""
+import csv
+import hashlib
+import json
+import math
+import re
+from decimal import Decimal
+
+DEFAULT_OPTIONS = {
+    "width": 1920,
+    "height": 1080,
+    "maxIterations": 500,
+    "power": 2,
+    "c": {"real": 0.285, "imag": 0.01},
+    "scale": 1,
+    "offsetX": 0,
+    "offsetY": 0,
+    "colorScheme": "rainbow",
+}
+
+# The server clamps maxIterations to 1..MAX_ITERATIONS and power to
+# -MAX_POWER..MAX_POWER
+MAX_ITERATIONS = 100000
+MAX_POWER = 16
+
+
+# Offsets given as plain decimal strings with more digits than a double holds
+# are kept as strings, cut to this many significant digits (see exactOffset
+# in perturbation.js)
+MAX_OFFSET_DIGITS = 330
+PLAIN_DECIMAL = re.compile(r"[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)")
+
+# The numeric prefixes parseInt and parseFloat read, after leading whitespace
+JS_INT_PREFIX = re.compile(r"([+-]?)(?:0[xX]([0-9a-fA-F]+)|([0-9]+))")
+JS_FLOAT_PREFIX = re.compile(r"[+-]?(?:Infinity|(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?)")
+
+
+def js_string(value):
+    """String(value) for the JSON values a request body can hold."""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return js_number(value) if math.isfinite(value) else ("NaN" if math.isnan(value) else ("-" if value < 0 else "") + "Infinity")
+    if value is None:
+        return "null"
+    return str(value)
+
+
+def js_parse_int(value):
+    """JavaScript's parseInt(value): the leading decimal (or 0x hex) digits
+    of String(value), ignoring the rest, or NaN if there are none."""
+    match = JS_INT_PREFIX.match(js_string(value).lstrip())
+    if not match:
+        return math.nan
+    sign, hex_digits, digits = match.groups()
+    number = int(hex_digits, 16) if hex_digits else int(digits)
+    return -number if sign == "-" else number
+
+
+def js_parse_float(value):
+    """JavaScript's parseFloat(value): the longest decimal literal at the
+    start of String(value), ignoring the rest, or NaN if there is none."""
+    match = JS_FLOAT_PREFIX.match(js_string(value).lstrip())
+    if not match:
+        return math.nan
+    return float(match.group().replace("Infinity", "inf"))
+
+
+def parse_int(value, default):
+    """`parseInt(value) || default`: falls back on 0 or garbage."""
+    number = js_parse_int(value)
+    if isinstance(number, float) or number == 0:
+        return default
+    return number
+
+
+def parse_float(value, default):
+    """`parseFloat(value) || default`: falls back on 0 or garbage."""
+    number = js_parse_float(value)
+    if math.isnan(number) or number == 0:
+        return default
+    return number
+
+
+def decimal_digits(text):
+    """(negative, significant digits, point) of a decimal literal, where
+    value = sign 0.<digits> * 10^point."""
+    sign, digits, exponent = Decimal(text).as_tuple()
+    digits = "".join(map(str, digits)).lstrip("0")
+    stripped = digits.rstrip("0")
+    return sign == 1, stripped, exponent + len(digits)
+
+
+def exact_offset(value):
+    """exactOffset: the canonical decimal string for an offset given as a
+    plain decimal string with more digits than the nearest double prints
+    with, else None."""
+    if not isinstance(value, str) or not PLAIN_DECIMAL.fullmatch(value):
+        return None
+    negative, digits, point = decimal_digits(value)
+    digits = digits[:MAX_OFFSET_DIGITS]
+    if point <= 0:
+        text = "0." + "0" * -point + digits
+    elif point >= len(digits):
+        text = digits + "0" * (point - len(digits))
+    else:
+        text = digits[:point] + "." + digits[point:]
+    text = ("-" if negative else "") + text
+
+    nearest = float(text)
+    if not digits or not math.isfinite(nearest):
+        return None
+    _, double_digits, double_point = decimal_digits(repr(abs(nearest)))
+    return None if (double_digits, double_point) == (digits, point) else text
+
+
+def parse_offset(value):
+    """`exactOffset(value) || parseFloat(value) || 0`."""
+    return exact_offset(value) or parse_float(value, 0)
+
+
+def fractal_options(body=None):
+    """Normalises a request body the way the generate route does, returning
+    the `options` dict (same keys, same order) that the server hashes."""
+    body = body or {}
+    c = body.get("c") or {}
+    return {
+        "width": parse_int(body.get("width"), DEFAULT_OPTIONS["width"]),
+        "height": parse_int(body.get("height"), DEFAULT_OPTIONS["height"]),
+        "maxIterations": min(max(parse_int(body.get("maxIterations"), DEFAULT_OPTIONS["maxIterations"]), 1), MAX_ITERATIONS),
+        "power": min(max(parse_float(body.get("power"), DEFAULT_OPTIONS["power"]), -MAX_POWER), MAX_POWER),
+        "c": {
+            "real": parse_float(c.get("real"), DEFAULT_OPTIONS["c"]["real"]),
+            "imag": parse_float(c.get("imag"), DEFAULT_OPTIONS["c"]["imag"]),
+        },
+        "scale": parse_float(body.get("scale"), DEFAULT_OPTIONS["scale"]),
+        "offsetX": parse_offset(body.get("offsetX")),
+        "offsetY": parse_offset(body.get("offsetY")),
+        "colorScheme": body.get("colorScheme") or DEFAULT_OPTIONS["colorScheme"],
+    }
+
+
+def js_number(value):
+    """Formats a number exactly like JavaScript's Number.prototype.toString."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise TypeError(f"not a number: {value!r}")
+    if isinstance(value, int):
+        value = float(value)
+    if not math.isfinite(value):
+        return "null"  # what JSON.stringify emits for NaN/Infinity
+    if value == 0:
+        return "0"
+    sign = "-" if value < 0 else ""
+    # repr gives the shortest round-tripping digits, as ECMAScript requires.
+    _, digits, exponent = Decimal(repr(abs(value))).normalize().as_tuple()
+    digits = "".join(str(d) for d in digits)
+    k = len(digits)
+    n = exponent + k  # position of the decimal point relative to the digits
+    if k <= n <= 21:
+        text = digits + "0" * (n - k)
+    elif 0 < n <= 21:
+        text = digits[:n] + "." + digits[n:]
+    elif -6 < n <= 0:
+        text = "0." + "0" * (-n) + digits
+    else:
+        mantissa = digits[0] + ("." + digits[1:] if k > 1 else "")
+        text = f"{mantissa}e{'+' if n - 1 >= 0 else '-'}{abs(n - 1)}"
+    return sign + text
+
+
+def to_js_json(value):
+    """JSON.stringify(value) for the dicts, strings and numbers used in options."""
+    if isinstance(value, dict):
+        return "{" + ",".join(f"{json.dumps(str(k))}:{to_js_json(v)}" for k, v in value.items()) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ",".join(to_js_json(v) for v in value) + "]"
+    if isinstance(value, str):
+        return json.dumps(value, ensure_ascii=False)
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return js_number(value)
+
+
+def options_hash(options):
+    """sha256 of JSON.stringify(options), the name the server stores the image under."""
+    return hashlib.sha256(to_js_json(options).encode("utf-8")).hexdigest()
+
+
+# CSV columns that hold the parts of `c`; "c.real" and "c_real" (as in the
+# fractals table) are both accepted.
+CSV_C_COLUMNS = {"c.real": "real", "c_real": "real", "c.imag": "imag", "c_imag": "imag"}
+
+
+def read_csv_parameter_sets(f):
+    """Reads request bodies from CSV with a header row of option names.
+    Empty cells are left out, so they take the server's defaults."""
+    bodies = []
+    for row in csv.DictReader(f):
+        body = {}
+        for column, value in row.items():
+            if column is None or value is None or not value.strip():
+                continue
+            column, value = column.strip(), value.strip()
+            if column in CSV_C_COLUMNS:
+                body.setdefault("c", {})[CSV_C_COLUMNS[column]] = value
+            else:
+                body[column] = value
+        if body:
+            bodies.append(body)
+    return bodies
+
+
+def read_parameter_sets(path):
+    """Reads request bodies from a CSV file (by extension), a JSON file
+    (object or list) or JSON lines. Workload entries of the form
+    {"payload": {...}} are unwrapped."""
+    with open(path, newline="") as f:
+        if path.lower().endswith(".csv"):
+            return read_csv_parameter_sets(f)
+        text = f.read()
+    try:
+        data = json.loads(text)
+        bodies = data if isinstance(data, list) else [data]
+    except ValueError:
+        bodies = [json.loads(line) for line in text.splitlines() if line.strip()]
+    return [b["payload"] if isinstance(b.get("payload"), dict) else b for b in bodies]
+
+
+def row_options(row):
+    """Rebuilds `options` from a fractals row (or a listing entry carrying its
+    columns), as rowOptions does on the server."""
+    return {
+        "width": row["width"],
+        "height": row["height"],
+        "maxIterations": row["iterations"],
+        "power": row["power"],
+        "c": {"real": row["c_real"], "imag": row["c_imag"]},
+        "scale": row["scale"],
+        "offsetX": row["offsetX"] if row.get("offsetX_decimal") is None else row["offsetX_decimal"],
+        "offsetY": row["offsetY"] if row.get("offsetY_decimal") is None else row["offsetY_decimal"],
+        "colorScheme": row["colorScheme"],
+    }
@@ -0,0 +1,333 @@
+"""Offline NumPy renderer producing the same images as generateFractal.
+
+Pixels are coloured through the same palette table as the server, so equal
+escape counts give byte-identical colours. Escape counts are iterated in polar
+form throughout, though, while the server multiplies out small integer powers;
+a few pixels right on the boundary of the set can come out differently (under
+0.1% of them, which `bench.js --golden` checks).
+
+Usable as a library (`render_fractal(options)` returns an RGBA array) or from
+the command line, where images are written as <sha256 of options>.png just
+like the server's ./fractals directory.
+"""
+import argparse
+import functools
+import multiprocessing
+import os
+import struct
+import sys
+import time
+import zlib
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from fractal_params import fractal_options, options_hash, read_parameter_sets
+
+ESCAPE_RADIUS_SQUARED = 4
+# Palette table resolution, as in src/fractalKernel.js
+COLOR_TABLE_STEPS = 16
+
+
+def map_range(value, start1, stop1, start2, stop2):
+    """Same arithmetic as `map` in fractalGenerator.js."""
+    return start2 + (stop2 - start2) * ((value - start1) / (stop1 - start1))
+
+
+def pixel_grid(options, rows=None, cols=None):
+    """Complex starting points for the given pixel rows/columns (default: the
+    whole image), shaped (len(rows), len(cols))."""
+    width, height = options["width"], options["height"]
+    # An offset may be a decimal string (see exact_offset); doubles are all
+    # this renderer resolves
+    scale, offset_x, offset_y = options["scale"], float(options["offsetX"]), float(options["offsetY"])
+    xs = np.arange(width, dtype=np.float64) if cols is None else np.asarray(cols, dtype=np.float64)
+    ys = np.arange(height, dtype=np.float64) if rows is None else np.asarray(rows, dtype=np.float64)
+    real = map_range(xs, 0, width, -scale + offset_x, scale + offset_x)
+    imag = map_range(ys, 0, height, -scale + offset_y, scale + offset_y)
+    return np.broadcast_to(real, (len(ys), len(xs))), np.broadcast_to(imag[:, None], (len(ys), len(xs)))
+
+
+def smooth_iterations(options, rows=None, cols=None):
+    """Smooth escape count `mu` per pixel, shaped (rows, cols).
+
+    Iterates z -> z^p + c in polar form (the server's fractional-power path;
+    its integer-power path agrees to within rounding), only over the pixels
+    that have not escaped yet. Pixels that never escape get
+    mu = maxIterations.
+    """
+    max_iterations = options["maxIterations"]
+    power = options["power"]
+    c_real, c_imag = options["c"]["real"], options["c"]["imag"]
+
+    grid_real, grid_imag = pixel_grid(options, rows, cols)
+    shape = grid_real.shape
+    z_real = grid_real.ravel().copy()
+    z_imag = grid_imag.ravel().copy()
+    live = np.arange(z_real.size)
+    mu = np.full(z_real.size, float(max_iterations))
+
+    with np.errstate(all="ignore"):
+        for n in range(max_iterations):
+            if live.size == 0:
+                break
+            r = np.sqrt(z_real * z_real + z_imag * z_imag)
+            theta = np.arctan2(z_imag, z_real)
+            r_p = np.power(r, power)
+            z_real = r_p * np.cos(power * theta) + c_real
+            z_imag = r_p * np.sin(power * theta) + c_imag
+
+            modulus_squared = z_real * z_real + z_imag * z_imag
+            escaped = modulus_squared > ESCAPE_RADIUS_SQUARED
+            if escaped.any():
+                modulus = np.sqrt(modulus_squared[escaped])
+                mu[live[escaped]] = n + 1 - np.log(np.log(modulus)) / np.log(power)
+                keep = ~escaped
+                live, z_real, z_imag = live[keep], z_real[keep], z_imag[keep]
+
+    return mu.reshape(shape)
+
+
+def js_round(value):
+    """Math.round: halves round towards +infinity."""
+    return np.floor(value + 0.5)
+
+
+def hue_to_rgb(p, q, t):
+    t = np.where(t < 0, t + 1, t)
+    t = np.where(t > 1, t - 1, t)
+    return np.where(t < 1 / 6, p + (q - p) * 6 * t,
+           np.where(t < 1 / 2, q,
+           np.where(t < 2 / 3, p + (q - p) * (2 / 3 - t) * 6, p)))
+
+
+def hsl_to_rgb(h, s, l):
+    """Vectorised `hslToRgb`; returns float channels already rounded to 0-255."""
+    h = h / 360
+    s = s / 100
+    l = l / 100
+    q = np.where(l < 0.5, l * (1 + s), l + s - l * s)
+    p = 2 * l - q
+    r = hue_to_rgb(p, q, h + 1 / 3)
+    g = hue_to_rgb(p, q, h)
+    b = hue_to_rgb(p, q, h - 1 / 3)
+    return js_round(r * 255), js_round(g * 255), js_round(b * 255)
+
+
+def get_color(mu, max_iterations, color_scheme):
+    """Vectorised `getColor` over an array of smooth counts; returns uint8 RGBA."""
+    with np.errstate(all="ignore"):
+        t = np.sqrt(mu / max_iterations)
+        if color_scheme == "grayscale":
+            gray = np.floor(t * 255)
+            channels = (gray, gray, gray)
+        elif color_scheme == "rainbow":
+            channels = hsl_to_rgb(map_range(t, 0, 1, 0, 360), 100, 50)
+        elif color_scheme == "fire":
+            channels = (np.floor(map_range(t, 0, 1, 0, 255)), np.floor(map_range(t, 0, 1, 0, 150)), np.zeros_like(t))
+        else:  # hsl
+            channels = hsl_to_rgb(map_range(t, 0, 1, 0, 360), 100, map_range(t, 0, 1, 20, 70))
+
+    rgba = np.empty(mu.shape + (4,), dtype=np.uint8)
+    inside = mu >= max_iterations
+    for i, channel in enumerate(channels):
+        # Uint8ClampedArray semantics: NaN stores as 0, values clamp to 0-255.
+        channel = np.nan_to_num(np.broadcast_to(channel, mu.shape), nan=0.0)
+        channel = np.clip(channel, 0, 255)
+        channel = np.where(inside, 0, channel)
+        rgba[..., i] = channel.astype(np.uint8)
+    rgba[..., 3] = 255
+    return rgba
+
+
+@functools.lru_cache(maxsize=8)
+def color_table(max_iterations, color_scheme):
+    """`getColorTable`: entry i is the colour of (i + 0.5) / COLOR_TABLE_STEPS,
+    and the extra last entry is the inside-set colour."""
+    entries = max_iterations * COLOR_TABLE_STEPS + 1
+    table = get_color((np.arange(entries) + 0.5) / COLOR_TABLE_STEPS, max_iterations, color_scheme)
+    table.flags.writeable = False
+    return table
+
+
+def color_index(mu, last_entry):
+    """Vectorised `colorIndex`. Indices the kernel can't look up (`| 0`
+    wrapping huge counts negative) come back as -1."""
+    with np.errstate(all="ignore"):
+        scaled = mu * COLOR_TABLE_STEPS
+        # ToInt32, as `| 0` does: infinities give 0, the rest wrap mod 2**32.
+        i = np.mod(np.where(np.isfinite(scaled), np.trunc(scaled), 0), 2 ** 32)
+        i = np.where(i >= 2 ** 31, -1, i)
+        return np.where(mu >= 0, np.minimum(i, last_entry), last_entry).astype(np.int64)
+
+
+def colorize(mu, max_iterations, color_scheme):
+    """Colours an array of smooth counts through the palette table, as
+    renderPixels does; returns uint8 RGBA."""
+    table = color_table(max_iterations, color_scheme)
+    index = color_index(mu, len(table) - 1)
+    rgba = table[index]
+    # table[entry] is undefined in the kernel, which stores as transparent black
+    rgba[index < 0] = 0
+    return rgba
+
+
+def render_fractal(options):
+    """Renders `options` (as produced by fractal_options) to an (height, width, 4) uint8 array."""
+    mu = smooth_iterations(options)
+    return colorize(mu, options["maxIterations"], options["colorScheme"])
+
+
+def png_bytes(rgba, compression_level=6):
+    """Encodes an (height, width, 4) uint8 array as an RGBA PNG."""
+    height, width, _ = rgba.shape
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    raw = np.empty((height, width * 4 + 1), dtype=np.uint8)
+    raw[:, 0] = 0  # filter type: None
+    raw[:, 1:] = rgba.reshape(height, width * 4)
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(raw.tobytes(), compression_level)) + chunk(b"IEND", b""))
+
+
+def image_tiles(width, height, tile_size):
+    """Splits the image into (x, y, w, h) tiles, row-major."""
+    return [(x, y, min(tile_size, width - x), min(tile_size, height - y))
+            for y in range(0, height, tile_size) for x in range(0, width, tile_size)]
+
+
+def order_by_cost(options, tiles):
+    """Most expensive tiles first, estimated from the escape count at each
+    tile's centre. Interior tiles run the full iteration budget and starting
+    them early keeps one of them from finishing last on its own."""
+    cols = sorted({x + w // 2 for x, _, w, _ in tiles})
+    rows = sorted({y + h // 2 for _, y, _, h in tiles})
+    centres = smooth_iterations(options, rows=rows, cols=cols)
+    cost = {(x, y): centres[rows.index(y + h // 2), cols.index(x + w // 2)] for x, y, w, h in tiles}
+    return sorted(tiles, key=lambda t: cost[(t[0], t[1])], reverse=True)
+
+
+# Per-process state for tile workers, set once by init_tile_worker.
+_tile_options = None
+_tile_buffer = None
+_tile_image = None
+
+
+def init_tile_worker(options, shm_name):
+    global _tile_options, _tile_buffer, _tile_image
+    _tile_options = options
+    _tile_buffer = shared_memory.SharedMemory(name=shm_name)
+    _tile_image = np.ndarray((options["height"], options["width"], 4), dtype=np.uint8, buffer=_tile_buffer.buf)
+
+
+def render_tile(tile):
+    """Renders one tile straight into the shared RGBA buffer."""
+    x, y, w, h = tile
+    start = time.perf_counter()
+    mu = smooth_iterations(_tile_options, rows=range(y, y + h), cols=range(x, x + w))
+    _tile_image[y:y + h, x:x + w] = colorize(mu, _tile_options["maxIterations"], _tile_options["colorScheme"])
+    return {"x": x, "y": y, "width": w, "height": h, "seconds": time.perf_counter() - start,
+            "worker": os.getpid(), "interior": float((mu >= _tile_options["maxIterations"]).mean())}
+
+
+def render_tiled(options, workers=None, tile_size=128, on_tile=None):
+    """Renders `options` across a process pool. Returns (rgba, tile_stats).
+
+    Tiles are handed out one at a time from a shared queue, so a worker that
+    finishes a cheap escaping tile immediately takes the next one instead of
+    waiting on a fixed partition. Workers write into one shared-memory RGBA
+    buffer, and the only copy is the final one out of it.
+    """
+    width, height = options["width"], options["height"]
+    tiles = order_by_cost(options, image_tiles(width, height, tile_size))
+    shm = shared_memory.SharedMemory(create=True, size=width * height * 4)
+    try:
+        tile_stats = []
+        with multiprocessing.Pool(workers or os.cpu_count(), initializer=init_tile_worker,
+                                  initargs=(options, shm.name)) as pool:
+            for stat in pool.imap_unordered(render_tile, tiles, chunksize=1):
+                tile_stats.append(stat)
+                if on_tile:
+                    on_tile(stat, len(tile_stats), len(tiles))
+        image = np.ndarray((height, width, 4), dtype=np.uint8, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+    return image, tile_stats
+
+
+def print_tile_report(tile_stats, elapsed, top=5):
+    busy = {}
+    for stat in tile_stats:
+        busy[stat["worker"]] = busy.get(stat["worker"], 0) + stat["seconds"]
+    total = sum(busy.values())
+    print(f"  {len(tile_stats)} tiles on {len(busy)} workers, {total:.2f}s of tile time in {elapsed:.2f}s wall "
+          f"({total / elapsed:.1f}x speedup over the tile time)")
+    for stat in sorted(tile_stats, key=lambda s: s["seconds"], reverse=True)[:top]:
+        print(f"  tile ({stat['x']},{stat['y']}) {stat['width']}x{stat['height']}: {stat['seconds']:.3f}s, "
+              f"{stat['interior'] * 100:.0f}% interior")
+
+
+def save_fractal(options, out_dir, compression_level=6, workers=1, tile_size=128, tile_report=False):
+    """Renders and writes <hash>.png into `out_dir`. Returns (path, seconds).
+    With more than one worker the render is tiled across processes."""
+    start = time.time()
+    if workers == 1:
+        rgba = render_fractal(options)
+    else:
+        rgba, tile_stats = render_tiled(options, workers=workers, tile_size=tile_size)
+    elapsed = time.time() - start
+    if workers != 1 and tile_report:
+        print_tile_report(tile_stats, elapsed)
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, f"{options_hash(options)}.png")
+    with open(path, "wb") as f:
+        f.write(png_bytes(rgba, compression_level))
+    return path, elapsed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Render fractals offline with NumPy, named like the server's ./fractals.")
+    parser.add_argument("--width", type=int)
+    parser.add_argument("--height", type=int)
+    parser.add_argument("--iterations", dest="maxIterations", type=int)
+    parser.add_argument("--power", type=float)
+    parser.add_argument("--real", type=float, help="Real part of c")
+    parser.add_argument("--imag", type=float, help="Imaginary part of c")
+    parser.add_argument("--scale", type=float)
+    parser.add_argument("--offset-x", dest="offsetX", type=float)
+    parser.add_argument("--offset-y", dest="offsetY", type=float)
+    parser.add_argument("--color", dest="colorScheme", choices=["rainbow", "grayscale", "fire", "hsl"])
+    parser.add_argument("--params", help="Render every parameter set in this JSON / JSON lines / CSV file instead")
+    parser.add_argument("--out", default="fractals", help="Output directory (default ./fractals)")
+    parser.add_argument("--compression", type=int, default=6, help="PNG zlib compression level 0-9 (default 6)")
+    parser.add_argument("--workers", type=int, default=1, help="Render tiles on this many processes (0 = one per CPU, default 1)")
+    parser.add_argument("--tile-size", type=int, default=128, help="Tile edge in pixels for multi-process renders (default 128)")
+    parser.add_argument("--tile-report", action="store_true", help="Print per-tile timings for multi-process renders")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.params:
+        bodies = read_parameter_sets(args.params)
+    else:
+        body = {k: v for k, v in vars(args).items()
+                if k in ("width", "height", "maxIterations", "power", "scale", "offsetX", "offsetY", "colorScheme") and v is not None}
+        body["c"] = {"real": args.real, "imag": args.imag}
+        bodies = [body]
+
+    for body in bodies:
+        options = fractal_options(body)
+        workers = args.workers if args.workers > 0 else os.cpu_count()
+        path, elapsed = save_fractal(options, args.out, args.compression, workers, args.tile_size, args.tile_report)
+        pixels = options["width"] * options["height"]
+        print(f"{path} ({options['width']}x{options['height']}, {options['maxIterations']} iterations) "
+              f"in {elapsed:.2f}s, {pixels / elapsed / 1e6:.2f} Mpixels/s")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,21 @@
+import argparse
+import csv
+import json
+import math
+import os
+import re
 import requests
+import threading
 import time
 import random
+from concurrent.futures import ThreadPoolExecutor
+
+from api_client import ApiClient
 
 BASE_URL = ""
-LOGIN_URL = ""
-FRACTAL_URL = ""
+API_URL = ""
+
+client = None
 
 USERS = {
     "user": {"username": "user", "password": "user"},
@@ -14,108 +25,621 @@ USERS = {
 
 COLOUR_SCHEMES = ["rainbow", "grayscale", "fire", "hsl"]
 
-def login(username, password):
-    """Logs in to the API and returns the JWT token."""
-    print(f"\nLogging in as {username}...")
+print_lock = threading.Lock()
+counter_lock = threading.Lock()
+request_count = 0
+pending_arrivals = 0
+
+LATENCY_BUCKETS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 180]
+
+METRIC_LINE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)$')
+METRIC_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+def parse_metrics(text):
+    """Parses Prometheus text exposition into {name: [(labels, value), ...]}."""
+    metrics = {}
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if not match or line.startswith("#"):
+            continue
+        name, labels, value = match.groups()
+        labels = {k: v.replace('\\"', '"').replace("\\\\", "\\") for k, v in METRIC_LABEL.findall(labels or "")}
+        metrics.setdefault(name, []).append((labels, float(value)))
+    return metrics
+
+def scrape_metrics():
+    """Fetches the server's /metrics, or returns None if it can't be read.
+    Sends METRICS_TOKEN from the environment if the server requires one."""
+    token = os.environ.get("METRICS_TOKEN")
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
     try:
-        resp = requests.post(LOGIN_URL, json={"username": username, "password": password})
-        if resp.status_code == 200:
-            token = resp.json().get('token')
-            print("Login successful.")
-            return token
-        else:
-            print(f"Login failed with status {resp.status_code}: {resp.text}")
-            return None
+        r = client.session.get(f"{BASE_URL}/metrics", headers=headers, timeout=10)
+        r.raise_for_status()
+        return parse_metrics(r.text)
     except requests.exceptions.RequestException as e:
-        print(f"Login request failed: {e}")
+        print(f"Could not scrape {BASE_URL}/metrics: {e}")
         return None
 
-def run_load_test(duration_seconds):
-    """Runs the load test for a given duration."""
-    start_time = time.time()
-    request_count = 0
+def metric_deltas(before, after, name, key_labels):
+    """Change in a counter (or histogram series) between two scrapes, keyed by
+    the tuple of `key_labels` values."""
+    def totals(metrics):
+        result = {}
+        for labels, value in metrics.get(name, []):
+            key = tuple(labels.get(label, "") for label in key_labels)
+            result[key] = result.get(key, 0) + value
+        return result
+    old, new = totals(before), totals(after)
+    return {key: value - old.get(key, 0) for key, value in new.items() if value - old.get(key, 0)}
 
-    loop_condition = True
-    while loop_condition:
-        selected_user_key = random.choice(list(USERS.keys()))
-        selected_user = USERS[selected_user_key]
-        jwt_token = login(selected_user["username"], selected_user["password"])
+def histogram_summary(before, after, name, key_labels):
+    """Per-series count, mean and bucket-estimated p50/p90/p99 of the
+    observations a histogram gained between two scrapes."""
+    counts = metric_deltas(before, after, f"{name}_count", key_labels)
+    sums = metric_deltas(before, after, f"{name}_sum", key_labels)
+    buckets = metric_deltas(before, after, f"{name}_bucket", key_labels + ["le"])
+    series = {}
+    for key, count in counts.items():
+        bounds = sorted((float(k[-1]), v) for k, v in buckets.items() if k[:-1] == key)
 
-        if not jwt_token:
-            print(f"Skipping request {request_count + 1} due to login failure.")
-            time.sleep(1)
-            continue
+        def quantile(q):
+            # Upper bound of the bucket holding the q-th observation
+            for bound, cumulative in bounds:
+                if cumulative >= q * count:
+                    return bound
+            return None
+
+        series["/".join(key) or "all"] = {"count": int(count), "mean": sums.get(key, 0) / count,
+                                          "p50": quantile(0.5), "p90": quantile(0.9), "p99": quantile(0.99)}
+    return series
+
+def server_summary(before, after):
+    """Server-side view of a run from /metrics scraped before and after it."""
+    iterations = sum(metric_deltas(before, after, "fractal_iterations_total", []).values())
+    iteration_seconds = sum(metric_deltas(before, after, "fractal_iteration_seconds_total", []).values())
+    gauge = lambda name: max((value for _, value in after.get(name, [])), default=None)
+    return {
+        "renders": histogram_summary(before, after, "fractal_render_duration_seconds", ["mode", "resolution", "iterations"]),
+        "iterations_per_second": iterations / iteration_seconds if iteration_seconds else None,
+        "cache_lookups": {k[0]: int(v) for k, v in metric_deltas(before, after, "fractal_cache_lookups_total", ["result"]).items()},
+        "render_failures": {k[0]: int(v) for k, v in metric_deltas(before, after, "fractal_render_failures_total", ["status"]).items()},
+        "admission_rejections": {k[0]: int(v) for k, v in metric_deltas(before, after, "fractal_admission_rejections_total", ["reason"]).items()},
+        "estimate_ratio": histogram_summary(before, after, "fractal_render_estimate_ratio", ["kind"]),
+        "cost_model_corrections": {labels["kind"]: value for labels, value in after.get("fractal_cost_model_correction", [])},
+        "http_responses": {k[0]: int(v) for k, v in metric_deltas(before, after, "http_responses_total", ["status"]).items()},
+        "queue_wait": histogram_summary(before, after, "fractal_render_queue_wait_seconds", []).get("all"),
+        "queue_depth_after": gauge("fractal_render_queue_depth"),
+        # The server resets its event-loop histogram on every scrape, so the
+        # second scrape covers exactly the run
+        "event_loop_lag": {labels["quantile"]: value for labels, value in after.get("nodejs_eventloop_lag_seconds", [])},
+        "event_loop_lag_max": gauge("nodejs_eventloop_lag_max_seconds"),
+        "db_queries": histogram_summary(before, after, "db_query_duration_seconds", ["method"]),
+    }
+
+def print_server_summary(server):
+    print("\n--- Server metrics ---")
+    for series, data in sorted(server["renders"].items()):
+        print(f"render {series}: {data['count']} renders, mean {data['mean']:.3f}s, p50<={data['p50']}s p90<={data['p90']}s")
+    if server["iterations_per_second"]:
+        print(f"iterations/s of render time: {server['iterations_per_second'] / 1e6:.1f}M")
+    print(f"cache lookups: {server['cache_lookups'] or 'none'}")
+    print(f"render failures by status: {server['render_failures'] or 'none'}")
+    print(f"admission rejections: {server['admission_rejections'] or 'none'}")
+    rejected = {k: v for k, v in server["http_responses"].items() if k in ("422", "429", "499")}
+    print(f"HTTP 422/429/499 responses: {rejected or 'none'}")
+    for kind, data in sorted(server["estimate_ratio"].items()):
+        correction = server["cost_model_corrections"].get(kind)
+        print(f"actual/predicted {kind}: {data['count']} renders, mean {data['mean']:.2f}, p50<={data['p50']} p90<={data['p90']}"
+              + (f"; correction now {correction:.2f}" if correction is not None else ""))
+    if server["queue_wait"]:
+        wait = server["queue_wait"]
+        print(f"queue wait: mean {wait['mean']:.3f}s, p90<={wait['p90']}s; depth at end {server['queue_depth_after']}")
+    if server["event_loop_lag"]:
+        lag = server["event_loop_lag"]
+        print(f"event-loop lag: p50 {lag.get('0.5', 0) * 1000:.1f}ms p99 {lag.get('0.99', 0) * 1000:.1f}ms "
+              f"max {(server['event_loop_lag_max'] or 0) * 1000:.1f}ms")
+    for method, data in sorted(server["db_queries"].items()):
+        print(f"db {method}: {data['count']} queries, mean {data['mean'] * 1000:.2f}ms, p99<={data['p99']}s")
+
+class LoadStats:
+    """Thread-safe collector of per-request results for a load test run."""
+
+    def __init__(self, window_seconds=10):
+        self.window_seconds = window_seconds
+        self.start_time = time.time()
+        self.records = []
+        self.server = None
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, status, latency, **extra):
+        """Records one completed request. `status` is the HTTP status code, or
+        "error" if no response was received."""
+        entry = {"endpoint": endpoint, "status": str(status), "latency": latency,
+                 "finished_at": time.time() - self.start_time, **extra}
+        with self.lock:
+            self.records.append(entry)
+
+    @staticmethod
+    def percentile(sorted_values, pct):
+        """Nearest-rank percentile of an already sorted list."""
+        if not sorted_values:
+            return None
+        rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+        return sorted_values[rank - 1]
+
+    def summary(self):
+        with self.lock:
+            records = list(self.records)
+        elapsed = time.time() - self.start_time
 
-        headers = {"Authorization": f"Bearer {jwt_token}"}
-
-        payload = {
-            "width": 1920,
-            "height": 1080,
-            "maxIterations": random.randint(250, 2500),
-            "power": random.randint(2, 3),
-            "scale": round(random.uniform(0.5, 1.5), 3),
-            "offsetX": round(random.uniform(-1, 1), 3),
-            "offsetY": round(random.uniform(-1, 1), 3),
-            "colorScheme": random.choice(COLOUR_SCHEMES),
-            "c": {
-                "real": round(random.uniform(-2, 2), 3),
-                "imag": round(random.uniform(-2, 2), 3)
+        endpoints = {}
+        for endpoint in sorted({r["endpoint"] for r in records}):
+            rows = [r for r in records if r["endpoint"] == endpoint]
+            latencies = sorted(r["latency"] for r in rows)
+            ok_latencies = sorted(r["latency"] for r in rows if r["status"] == "200")
+
+            statuses = {}
+            for r in rows:
+                statuses[r["status"]] = statuses.get(r["status"], 0) + 1
+
+            histogram = {}
+            for bound in LATENCY_BUCKETS:
+                histogram[f"<={bound}s"] = sum(1 for l in latencies if l <= bound)
+            histogram["+Inf"] = len(latencies)
+
+            windows = {}
+            for r in rows:
+                index = int(r["finished_at"] // self.window_seconds)
+                windows[index] = windows.get(index, 0) + 1
+            throughput = [
+                {"start": i * self.window_seconds, "requests": windows.get(i, 0),
+                 "per_second": windows.get(i, 0) / self.window_seconds}
+                for i in range(int(elapsed // self.window_seconds) + 1)
+            ]
+
+            cache = {}
+            for outcome in ("hit", "miss"):
+                cache_latencies = sorted(r["latency"] for r in rows if r.get("cache") == outcome)
+                if cache_latencies:
+                    cache[outcome] = {"count": len(cache_latencies), "latency": self.latency_summary(cache_latencies)}
+
+            endpoints[endpoint] = {
+                "count": len(rows),
+                "statuses": statuses,
+                "latency": self.latency_summary(latencies),
+                "latency_ok": self.latency_summary(ok_latencies),
+                "histogram": histogram,
+                "throughput": throughput,
+                "cache": cache,
             }
+        return {"duration_seconds": elapsed, "endpoints": endpoints, "estimates": self.estimate_summary(records),
+                "server": self.server}
+
+    def estimate_summary(self, records):
+        """Predicted against actual render time for the renders the server
+        reported both for, overall and by cost model kind."""
+        rows = [r for r in records if r.get("predicted_seconds") and r.get("actual_seconds") is not None]
+        summary = {}
+        for kind in ["all"] + sorted({r["estimate_kind"] for r in rows}):
+            ratios = sorted(r["actual_seconds"] / r["predicted_seconds"]
+                            for r in rows if kind == "all" or r["estimate_kind"] == kind)
+            summary[kind] = {
+                "count": len(ratios),
+                "ratio_p10": self.percentile(ratios, 10),
+                "ratio_p50": self.percentile(ratios, 50),
+                "ratio_p90": self.percentile(ratios, 90),
+                "within_2x": sum(1 for ratio in ratios if 0.5 <= ratio <= 2) / len(ratios),
+            }
+        return summary if rows else {}
+
+    def latency_summary(self, latencies):
+        return {
+            "p50": self.percentile(latencies, 50),
+            "p90": self.percentile(latencies, 90),
+            "p99": self.percentile(latencies, 99),
+            "max": latencies[-1] if latencies else None,
+            "mean": sum(latencies) / len(latencies) if latencies else None,
         }
 
+    def print_report(self):
+        summary = self.summary()
+        print(f"\n--- Results ({summary['duration_seconds']:.1f}s) ---")
+        for endpoint, data in summary["endpoints"].items():
+            lat = data["latency"]
+            statuses = ", ".join(f"{k}: {v}" for k, v in sorted(data["statuses"].items()))
+            print(f"{endpoint}: {data['count']} requests ({statuses})")
+            if lat["p50"] is not None:
+                print(f"  latency p50={lat['p50']:.3f}s p90={lat['p90']:.3f}s p99={lat['p99']:.3f}s max={lat['max']:.3f}s")
+            for outcome, cache_data in data["cache"].items():
+                cache_lat = cache_data["latency"]
+                print(f"  cache {outcome}: {cache_data['count']} requests, p50={cache_lat['p50']:.3f}s p99={cache_lat['p99']:.3f}s")
+            peak = max(data["throughput"], key=lambda w: w["requests"])
+            print(f"  throughput peak {peak['per_second']:.2f} req/s (window starting at {peak['start']}s)")
+        for kind, data in summary["estimates"].items():
+            print(f"render time actual/predicted ({kind}): {data['count']} renders, p10 {data['ratio_p10']:.2f} "
+                  f"p50 {data['ratio_p50']:.2f} p90 {data['ratio_p90']:.2f}, {data['within_2x'] * 100:.0f}% within 2x")
+        if summary["server"]:
+            print_server_summary(summary["server"])
+
+    def write(self, path, config=None):
+        """Writes results to `path`: one row per request for .csv, otherwise a
+        JSON document with the run config, the summary and every request."""
+        with self.lock:
+            records = list(self.records)
+        if path.endswith(".csv"):
+            fields = sorted({key for r in records for key in r} | {"endpoint", "status", "latency", "finished_at"})
+            with open(path, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=fields)
+                writer.writeheader()
+                writer.writerows(records)
+        else:
+            with open(path, "w") as f:
+                json.dump({"config": config or {}, "summary": self.summary(), "requests": records}, f, indent=2)
+        print(f"Results written to {path}")
+
+stats = LoadStats()
+
+def log(message):
+    """Prints a message without interleaving output from other virtual users."""
+    with print_lock:
+        print(message)
+
+def next_request_number():
+    global request_count
+    with counter_lock:
         request_count += 1
-        print(f'\nRequest {request_count} (as {selected_user["username"]}) with payload {payload}\n')
+        return request_count
+
+def record_login(username, status, seconds):
+    """ApiClient hook: logins are reported as their own endpoint, separate from render time."""
+    stats.record("login", status, seconds, user=username)
+    if status == 200:
+        log(f"Logged in as {username} in {seconds:.2f}s.")
+    else:
+        log(f"Login as {username} failed with status {status}.")
+
+def random_payload(rng=random):
+    """Builds a random /api/generate payload."""
+    return {
+        "width": 1920,
+        "height": 1080,
+        "maxIterations": rng.randint(250, 2500),
+        "power": rng.randint(2, 3),
+        "scale": round(rng.uniform(0.5, 1.5), 3),
+        "offsetX": round(rng.uniform(-1, 1), 3),
+        "offsetY": round(rng.uniform(-1, 1), 3),
+        "colorScheme": rng.choice(COLOUR_SCHEMES),
+        "c": {
+            "real": round(rng.uniform(-2, 2), 3),
+            "imag": round(rng.uniform(-2, 2), 3)
+        }
+    }
+
+def load_workload(path):
+    """Reads a recorded workload: one JSON object per line with a "payload"
+    (the /api/generate body) and optionally the "user" who sent it. Lines
+    without a payload are skipped."""
+    entries = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            if isinstance(entry, dict) and isinstance(entry.get("payload"), dict):
+                entries.append(entry)
+    return entries
+
+class Workload:
+    """Deterministic source of (user, payload) pairs.
+
+    Fresh payloads come from the recorded `entries` in order (then random
+    ones once they run out, or cycling if there is no `repeat_ratio`). With a
+    `repeat_ratio`, that fraction of requests instead re-sends a payload
+    already issued in this run, which the server answers from its cache.
+    """
+
+    def __init__(self, entries=None, seed=None, repeat_ratio=None):
+        self.entries = entries or []
+        self.rng = random.Random(seed)
+        self.repeat_ratio = repeat_ratio
+        self.position = 0
+        self.issued = []
+        self.lock = threading.Lock()
+
+    def next(self):
+        """Returns (user_key, payload, repeat) where `repeat` says whether the
+        payload was deliberately taken from earlier in the run."""
+        with self.lock:
+            if self.repeat_ratio and self.issued and self.rng.random() < self.repeat_ratio:
+                _, payload = self.rng.choice(self.issued)
+                return self.rng.choice(list(USERS.keys())), payload, True
 
-        req_start = time.time()
+            if self.position < len(self.entries) or (self.entries and not self.repeat_ratio):
+                entry = self.entries[self.position % len(self.entries)]
+                self.position += 1
+                user_key = entry.get("user") if entry.get("user") in USERS else self.rng.choice(list(USERS.keys()))
+                payload = entry["payload"]
+            else:
+                user_key = self.rng.choice(list(USERS.keys()))
+                payload = random_payload(self.rng)
+            self.issued.append((user_key, payload))
+            return user_key, payload, False
+
+class WorkloadRecorder:
+    """Appends every generate request of a run to a workload file that
+    --workload can replay."""
+
+    def __init__(self, path, start_time):
+        self.file = open(path, "a")
+        self.start_time = start_time
+        self.lock = threading.Lock()
+
+    def record(self, user_key, payload, status, cached):
+        line = json.dumps({"user": user_key, "payload": payload, "offset": round(time.time() - self.start_time, 3),
+                           "status": status, "cached": cached})
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+workload = Workload()
+recorder = None
+use_jobs = False
+poll_jobs = False
+
+def arrival_done(future):
+    global pending_arrivals
+    with counter_lock:
+        pending_arrivals -= 1
+
+def send_request(scheduled_at=None):
+    """Sends one generate request as a random user.
+
+    The user's token comes from the client's cache; any login it triggers is
+    recorded separately and not counted in the request's latency. In open-loop
+    mode `scheduled_at` is the arrival time assigned by the dispatcher, and
+    latency is measured from it rather than from the moment a worker picked
+    the request up, so client-side queueing is not hidden.
+    """
+    selected_user_key, payload, repeat = workload.next()
+    selected_user = USERS[selected_user_key]
+    queue_delay = time.time() - scheduled_at if scheduled_at is not None else 0
+
+    try:
+        client.token(selected_user["username"], selected_user["password"])
+    except requests.exceptions.RequestException as e:
+        log(f"Skipping request due to login failure: {e}")
+        return False
+
+    number = next_request_number()
+    log(f'\nRequest {number} (as {selected_user["username"]}) with payload {payload}\n')
+
+    req_start = time.time() - queue_delay
+    try:
+        if use_jobs:
+            status, data, text = generate_via_job(selected_user["username"], payload)
+        else:
+            resp = client.post("/generate", user=selected_user["username"], json=payload, timeout=180)
+            status, text = resp.status_code, resp.text
+            try:
+                data = resp.json() if status == 200 else None
+            except ValueError:
+                data = None
+        req_time = time.time() - req_start
+        cached = None
+        estimate = {}
+
+        if status == 200:
+            if data is not None:
+                cached = data.get('cached')
+                estimate = data.get('estimate') or {}
+                fractal_url = data.get('url')
+                fractal_hash = data.get('hash')
+                if fractal_url:
+                    log(f"Request {number} done in {req_time:.2f}s. Fractal URL: {fractal_url}\n")
+                elif fractal_hash:
+                    log(f"Request {number} done in {req_time:.2f}s. Fractal Hash: {fractal_hash}\n")
+                else:
+                    log(f"Request {number} done in {req_time:.2f}s. Unexpected JSON response: {data}\n")
+            else:
+                log(f"Request {number} done in {req_time:.2f}s. Response not JSON, size={len(text)} \n")
+        elif status == 422:
+            log(f"Request {number} refused (predicted over the render time limit) after {req_time:.2f}s\n")
+        elif status == 429:
+            log(f"Request {number} rejected (render queue full) after {req_time:.2f}s\n")
+        elif status == 499:
+            log(f"Request {number} aborted (time limit exceeded) after {req_time:.2f}s\n")
+        elif status == 403:
+            log(f"Request {number} failed with status {status}: Fractal generation disabled for {selected_user['username']}. Content: {text}\n")
+        else:
+            log(f"Request {number} failed with status {status}, content: {text}\n")
+
+        cache = None if cached is None else ("hit" if cached else "miss")
+        stats.record("generate", status, req_time, user=selected_user_key, cache=cache, repeat=repeat,
+                     estimate_kind=estimate.get("kind"), predicted_seconds=estimate.get("seconds"),
+                     eta_seconds=estimate.get("etaSeconds"), actual_seconds=estimate.get("actualSeconds"))
+        if recorder:
+            recorder.record(selected_user_key, payload, status, cached)
+
+    except requests.exceptions.RequestException as e:
+        req_time = time.time() - req_start
+        stats.record("generate", "error", req_time, user=selected_user_key, repeat=repeat)
+        log(f"Request {number} failed after {req_time:.2f}s: {e}")
+    return True
+
+def generate_via_job(username, payload):
+    """Submits `payload` as a render job and waits for it to finish.
+
+    Returns (status, data, text) shaped like a synchronous /generate call: a
+    finished job counts as 200 with the fractal as data, a failed one takes
+    the HTTP status the server recorded for the failure.
+    """
+    resp = client.submit_job(payload, username)
+    if resp.status_code != 202:
+        return resp.status_code, None, resp.text
+    job = client.wait_for_job(resp.json()["id"], username, stream=not poll_jobs)
+    if job["status"] == "failed":
+        return job["error"]["status"], None, job["error"]["message"]
+    return 200, job["result"], ""
+
+def virtual_user(stop_event):
+    """Closed-loop virtual user: sends the next request as soon as the last one returns."""
+    while not stop_event.is_set():
+        if not send_request():
+            stop_event.wait(1)
+
+def dispatch_arrivals(executor, users, rate, stop_event, poisson=False):
+    """Open-loop dispatcher: schedules arrivals at `rate` requests/s regardless of
+    how long earlier requests take. Arrivals are queued on the executor if every
+    virtual user is busy, and their latency then includes that wait."""
+    global pending_arrivals
+    next_arrival = time.time()
+    backlog_warned = False
+    while not stop_event.is_set():
+        delay = next_arrival - time.time()
+        if delay > 0 and stop_event.wait(delay):
+            break
+        with counter_lock:
+            pending_arrivals += 1
+            backlog = pending_arrivals - users
+        executor.submit(send_request, next_arrival).add_done_callback(arrival_done)
+        interval = random.expovariate(rate) if poisson else 1.0 / rate
+        next_arrival += interval
+
+        if backlog > 0 and not backlog_warned:
+            log(f"Warning: all virtual users busy, {backlog} arrival(s) waiting. Latencies include client-side queueing.")
+            backlog_warned = True
+
+def probe_responsiveness(stop_event, interval):
+    """Times a cheap API call (GET /queue) every `interval` seconds while the
+    load runs. Renders happen off the event loop, so this latency is a
+    client-side view of the server's event-loop lag."""
+    probe_user = USERS["admin"]
+    while not stop_event.wait(interval):
+        start = time.time()
         try:
-            resp = requests.post(FRACTAL_URL, json=payload, headers=headers, timeout=180)
-            req_time = time.time() - req_start
-
-            if resp.status_code == 200:
-                try:
-                    data = resp.json()
-                    fractal_url = data.get('url')
-                    fractal_hash = data.get('hash')
-                    if fractal_url:
-                        print(f"Request {request_count} done in {req_time:.2f}s. Fractal URL: {fractal_url}\n")
-                    elif fractal_hash:
-                        print(f"Request {request_count} done in {req_time:.2f}s. Fractal Hash: {fractal_hash}\n")
-                    else:
-                        print(f"Request {request_count} done in {req_time:.2f}s. Unexpected JSON response: {data}\n")
-                except ValueError:
-                    print(f"Request {request_count} done in {req_time:.2f}s. Response not JSON, size={len(resp.content)} \n")
-            elif resp.status_code == 499:
-                print(f"Request {request_count} aborted (time limit exceeded) after {req_time:.2f}s\n")
-            elif resp.status_code == 403:
-                print(f"Request {request_count} failed with status {resp.status_code}: Fractal generation disabled for {selected_user['username']}. Content: {resp.text}\n")
+            client.token(probe_user["username"], probe_user["password"])
+            start = time.time()
+            r = client.get("/queue", user=probe_user["username"], timeout=30)
+            stats.record("probe", r.status_code, time.time() - start)
+        except requests.exceptions.RequestException:
+            stats.record("probe", "error", time.time() - start)
+
+def run_load_test(duration_seconds, users=1, rate=None, poisson=False, output=None, record_path=None, probe_interval=None):
+    """Runs the load test for a given duration.
+
+    With no `rate`, `users` virtual users each send requests back to back
+    (closed loop; `users=1` is the original serial behaviour). With a `rate`,
+    requests arrive at that many per second independent of response times
+    (open loop), served by up to `users` concurrent connections. With a
+    `probe_interval`, server responsiveness is sampled alongside.
+    """
+    global recorder
+    start_time = time.time()
+    stats.start_time = start_time
+    if record_path:
+        recorder = WorkloadRecorder(record_path, start_time)
+    stop_event = threading.Event()
+
+    metrics_before = scrape_metrics()
+    mode = f"open loop at {rate} req/s" if rate else "closed loop"
+    print(f"\nStarting load test with {users} virtual user(s), {mode}.")
+
+    if probe_interval:
+        threading.Thread(target=probe_responsiveness, args=(stop_event, probe_interval), daemon=True).start()
+
+    with ThreadPoolExecutor(max_workers=users) as executor:
+        if rate:
+            dispatcher = threading.Thread(target=dispatch_arrivals, args=(executor, users, rate, stop_event, poisson), daemon=True)
+            dispatcher.start()
+        else:
+            for _ in range(users):
+                executor.submit(virtual_user, stop_event)
+
+        try:
+            if duration_seconds is not None:
+                stop_event.wait(duration_seconds)
             else:
-                print(f"Request {request_count} failed with status {resp.status_code}, content: {resp.text}\n")
+                while not stop_event.is_set():
+                    stop_event.wait(1)
+        except KeyboardInterrupt:
+            print("\nStopping load test...")
+        stop_event.set()
+        if rate:
+            dispatcher.join()
+            executor.shutdown(wait=True, cancel_futures=True)
 
-        except requests.exceptions.RequestException as e:
-            req_time = time.time() - req_start
-            print(f"Request {request_count} failed after {req_time:.2f}s: {e}")
-        
-        if duration_seconds is not None:
-            if time.time() - start_time >= duration_seconds:
-                loop_condition = False
+    metrics_after = scrape_metrics() if metrics_before is not None else None
+    if metrics_after is not None:
+        stats.server = server_summary(metrics_before, metrics_after)
+
+    if recorder:
+        recorder.close()
+        print(f"Recorded workload to {record_path}")
 
     total_duration_minutes = (time.time() - start_time) / 60
     print(f"\nSent {request_count} requests in {total_duration_minutes:.1f} minutes.")
 
+    stats.print_report()
+    if output:
+        config = {"users": users, "rate": rate, "poisson": poisson, "duration_seconds": duration_seconds,
+                  "base_url": BASE_URL, "started_at": start_time, "repeat_ratio": workload.repeat_ratio,
+                  "replayed_entries": len(workload.entries)}
+        stats.write(output, config)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load test the fractal generation API.")
+    parser.add_argument("--host", help="Server IP address (prompted for if omitted)")
+    parser.add_argument("--duration", type=float, help="Duration in minutes (prompted for if omitted)")
+    parser.add_argument("--users", type=int, default=1, help="Number of concurrent virtual users (default 1)")
+    parser.add_argument("--rate", type=float, help="Fixed arrival rate in requests/s (open loop). Omit for closed loop.")
+    parser.add_argument("--poisson", action="store_true", help="Use exponentially distributed inter-arrival times with --rate")
+    parser.add_argument("--workload", help="Replay payloads from a recorded workload file (JSON lines)")
+    parser.add_argument("--record", help="Append every generate request of this run to a workload file")
+    parser.add_argument("--seed", type=int, help="Random seed for users, payloads and repeats (default: unseeded)")
+    parser.add_argument("--repeat-ratio", type=float, help="Fraction of requests (0-1) that repeat an earlier payload of the run, i.e. cache hits")
+    parser.add_argument("--window", type=float, default=10, help="Throughput window size in seconds (default 10)")
+    parser.add_argument("--jobs", action="store_true", help="Submit renders as asynchronous jobs (/jobs) and wait for each to finish")
+    parser.add_argument("--poll", action="store_true", help="With --jobs, poll job status instead of streaming progress events")
+    parser.add_argument("--probe-interval", type=float, help="Time GET /queue every this many seconds to gauge server event-loop lag")
+    parser.add_argument("--output", help="Write results to this file (.csv for per-request rows, otherwise JSON)")
+    args = parser.parse_args()
+    if args.repeat_ratio is not None and not 0 <= args.repeat_ratio <= 1:
+        parser.error("--repeat-ratio must be between 0 and 1")
+    return args
+
 if __name__ == "__main__":
-    ip_address = input("Enter the server IP address (leave empty for localhost): ")
+    args = parse_args()
+
+    ip_address = args.host
+    if ip_address is None:
+        ip_address = input("Enter the server IP address (leave empty for localhost): ")
     if not ip_address:
         ip_address = "localhost"
     BASE_URL = f"http://{ip_address}:3000"
-    LOGIN_URL = f"{BASE_URL}/api/auth/login"
-    FRACTAL_URL = f"{BASE_URL}/api/generate"
+    API_URL = f"{BASE_URL}/api"
 
-    duration_input = input("Enter the duration in minutes (leave empty for indefinite): ")
     duration_seconds = None
-    if duration_input:
-        try:
-            duration_seconds = int(duration_input) * 60
-        except ValueError:
-            print("Invalid duration. Running indefinitely.")
+    if args.duration is not None:
+        duration_seconds = args.duration * 60
+    else:
+        duration_input = input("Enter the duration in minutes (leave empty for indefinite): ")
+        if duration_input:
+            try:
+                duration_seconds = int(duration_input) * 60
+            except ValueError:
+                print("Invalid duration. Running indefinitely.")
 
-    run_load_test(duration_seconds)
+    stats.window_seconds = args.window
+    if args.seed is not None:
+        random.seed(args.seed)
+    entries = load_workload(args.workload) if args.workload else None
+    if args.workload:
+        print(f"Loaded {len(entries)} workload entries from {args.workload}")
+    workload = Workload(entries, seed=args.seed, repeat_ratio=args.repeat_ratio)
+    use_jobs, poll_jobs = args.jobs, args.poll
+    client = ApiClient(API_URL, pool_size=max(10, args.users), on_login=record_login)
+    run_load_test(duration_seconds, users=max(1, args.users), rate=args.rate, poisson=args.poisson, output=args.output, record_path=args.record, probe_interval=args.probe_interval)
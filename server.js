@@ -6,28 +6,36 @@
  */
 require('dotenv').config();
 const express = require('express');
-const fs = require('fs');
 const cors = require('cors');
 const authRouter = require('./src/routes/auth').router;
 const fractalRouter = require('./src/routes/fractal');
+const jobsRouter = require('./src/routes/jobs');
 const historyRouter = require('./src/routes/history');
 const adminRouter = require('./src/routes/admin');
+const imagesRouter = require('./src/routes/images');
+const tilesRouter = require('./src/routes/tiles');
+const metricsRouter = require('./src/routes/metrics');
+const { countResponses } = require('./src/metrics');
+const { loadImageStore } = require('./src/imageStore');
+const { loadTileStore } = require('./src/tileStore');
 
 const app = express();
 const port = process.env.PORT || 3000;
 
+app.use(countResponses);
 app.use(cors());
 app.use(express.json());
-app.use('/fractals', express.static('fractals'));
+app.use('/fractals', imagesRouter);
+app.use('/metrics', metricsRouter);
 
-const fractalsDir = './fractals';
-if (!fs.existsSync(fractalsDir)){
-    fs.mkdirSync(fractalsDir);
-}
+loadImageStore();
+loadTileStore();
 
 app.use('/api/auth', authRouter);
 app.use('/api', fractalRouter);
+app.use('/api', jobsRouter);
 app.use('/api', historyRouter);
+app.use('/api', tilesRouter);
 app.use('/api/admin', adminRouter);
 
 app.listen(port, () => {
@@ -0,0 +1,116 @@
+const { renderPixels, renderShortcuts, multipliesPower, getColorTable } = require('./fractalKernel');
+const { usesPerturbation, renderPerturbed } = require('./perturbation');
+const { getEstimatePool } = require('./renderPool');
+
+// Render cost model: predicts how long a render worker will take on a set of
+// options before it is queued, so requests that can't finish in time are
+// turned away up front instead of after burning RENDER_MAX_SECONDS of CPU.
+//
+// The view is rendered on a coarse grid of at most SAMPLE_COLUMNS x
+// SAMPLE_ROWS points with the same kernel the worker will use, on a worker
+// of the estimate pool so the main loop never iterates. The steps it takes
+// per point, times the image's pixels, predict the iterations, and
+//
+//     seconds = iterations * secondsPerIteration[kind] + pixels * SECONDS_PER_PIXEL
+//
+// where kind separates kernels whose steps cost very different amounts, and
+// kernels that multiply out z^p pay for every multiply beyond z^2. The
+// per-kind rates start from bench.js figures and are corrected after every
+// render by how far off the prediction was (see calibrate).
+const SAMPLE_COLUMNS = 24;
+const SAMPLE_ROWS = 24;
+// A sample that takes longer than this means the render is far too expensive
+const SAMPLE_MAX_MS = 1000;
+
+// Seconds per z -> z^p + c step, by kernel, at p = 2 for those that
+// multiply out z^p
+const SECONDS_PER_ITERATION = {
+    quadratic: 5e-9,
+    integer: 5e-9,
+    fractional: 1.7e-7,
+    perturbation: 1.2e-8
+};
+// Seconds per step for each complex multiply beyond z^2
+const SECONDS_PER_EXTRA_MULTIPLY = {
+    integer: 3e-9,
+    perturbation: 4e-9
+};
+// Colouring, field packing and PNG encoding, per pixel
+const SECONDS_PER_PIXEL = 6e-8;
+// Recolouring a cached field, per pixel
+const RECOLOR_SECONDS_PER_PIXEL = 3e-8;
+
+// Weight of the newest render in the running correction, and its bounds
+const CALIBRATION_WEIGHT = 0.2;
+const CALIBRATION_LIMITS = [0.1, 10];
+
+// Multiplier on the base rates, by kind, learned from finished renders
+const corrections = Object.fromEntries(Object.keys(SECONDS_PER_ITERATION).map(kind => [kind, 1]));
+
+function kernelKind(options) {
+    if (usesPerturbation(options)) return 'perturbation';
+    if (options.power === 2) return 'quadratic';
+    return multipliesPower(options.power) ? 'integer' : 'fractional';
+}
+
+function secondsPerIteration(kind, power) {
+    return SECONDS_PER_ITERATION[kind] + (SECONDS_PER_EXTRA_MULTIPLY[kind] || 0) * (power - 2);
+}
+
+// Renders the coarse sample of `options` and resolves to the steps it took,
+// or to null if it ran past SAMPLE_MAX_MS. Runs on a render worker.
+async function sampleIterations(options) {
+    const { width, height } = options;
+    const kind = kernelKind(options);
+    // renderPixels maps the same square of the plane onto any image size,
+    // so the coarse grid covers exactly the requested view
+    const render = kind === 'perturbation' ? renderPerturbed : renderPixels;
+    // Build the colour table (or find it cached) before the clock starts, so
+    // only iterating counts against SAMPLE_MAX_MS
+    getColorTable(options.colorScheme, options.maxIterations);
+    const sample = await render({
+        ...options, ...renderShortcuts, width: Math.min(width, SAMPLE_COLUMNS), height: Math.min(height, SAMPLE_ROWS), maxTime: SAMPLE_MAX_MS
+    });
+    return sample ? sample.iterations : null;
+}
+
+// Predicts the render of `options`. Resolves to { kind, iterations, seconds };
+// seconds is Infinity if even the sample ran out of time. Rejects with a
+// QUEUE_FULL error if the estimate pool is saturated.
+async function estimateRender(options) {
+    const { width, height } = options;
+    const kind = kernelKind(options);
+    const sampled = await getEstimatePool().run({ ...options, sample: true });
+    if (sampled === null) {
+        return { kind, iterations: Infinity, seconds: Infinity };
+    }
+
+    const pixels = width * height;
+    const samplePoints = Math.min(width, SAMPLE_COLUMNS) * Math.min(height, SAMPLE_ROWS);
+    const iterations = Math.round(sampled / samplePoints * pixels);
+    const seconds = (iterations * secondsPerIteration(kind, options.power) + pixels * SECONDS_PER_PIXEL) * corrections[kind];
+    return { kind, iterations, seconds };
+}
+
+// Predicted seconds to recolour a cached field for `options`
+function estimateRecolor({ width, height }) {
+    return { kind: 'recolor', iterations: 0, seconds: width * height * RECOLOR_SECONDS_PER_PIXEL };
+}
+
+// Moves the correction for the estimate's kind toward the ratio of the
+// actual to the predicted time, geometrically so over- and underestimates
+// weigh the same. Returns that ratio.
+function calibrate(estimate, actualSeconds) {
+    const ratio = actualSeconds / estimate.seconds;
+    if (!(estimate.kind in corrections) || !isFinite(ratio) || ratio <= 0) return ratio;
+    const [low, high] = CALIBRATION_LIMITS;
+    const corrected = corrections[estimate.kind] * ratio ** CALIBRATION_WEIGHT;
+    corrections[estimate.kind] = Math.min(high, Math.max(low, corrected));
+    return ratio;
+}
+
+function costModelStatus() {
+    return { corrections: { ...corrections } };
+}
+
+module.exports = { kernelKind, sampleIterations, estimateRender, estimateRecolor, calibrate, costModelStatus };
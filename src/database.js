@@ -1,83 +1,84 @@
 const sqlite3 = require('sqlite3').verbose();
 const bcrypt = require('bcryptjs');
 
+const { TABLES, ADDED_COLUMNS, INDEXES, PRAGMAS } = require('./schema.js');
+
 const DBSOURCE = "fractal.db";
 
+// PRAGMA optimize runs ANALYZE on the tables this connection's queries have
+// used once their planner statistics are missing or stale. Without them
+// SQLite can pick a poor index, e.g. for the filtered /fractals listing.
+// The statistics are stored in the database, so they outlive restarts.
+const OPTIMIZE_INTERVAL_MS = 15 * 60 * 1000;
+
+// Brings a table created by an older version up to date. SQLite has no ADD
+// COLUMN IF NOT EXISTS, so a column that is already there is an error to
+// ignore.
+function addColumns(table) {
+    for (const column of ADDED_COLUMNS[table]) {
+        db.run(`ALTER TABLE ${table} ADD COLUMN ${column}`, (err) => {
+            if (err && !/duplicate column name/.test(err.message)) {
+                console.error(`Error adding column to ${table}:`, err.message);
+            }
+        });
+    }
+}
+
+function createIndexes(table) {
+    for (const sql of INDEXES[table]) {
+        db.run(sql, (err) => {
+            if (err) {
+                console.error(`Error creating index on ${table}:`, err.message);
+            }
+        });
+    }
+}
+
 const db = new sqlite3.Database(DBSOURCE, (err) => {
     if (err) {
         console.error(err.message);
         throw err;
     } else {
         console.log('Connected to the SQLite database.');
-        const fractalsTable = `
-        CREATE TABLE IF NOT EXISTS fractals (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            hash TEXT UNIQUE NOT NULL,
-            width INTEGER NOT NULL,
-            height INTEGER NOT NULL,
-            iterations INTEGER NOT NULL,
-            power REAL NOT NULL,
-            c_real REAL NOT NULL,
-            c_imag REAL NOT NULL,
-            scale REAL NOT NULL,
-            offsetX REAL NOT NULL,
-            offsetY REAL NOT NULL,
-            colorScheme TEXT NOT NULL,
-            image_path TEXT NOT NULL,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )`;
-
-        const historyTable = `
-        CREATE TABLE IF NOT EXISTS history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            fractal_id INTEGER NOT NULL,
-            generated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (fractal_id) REFERENCES fractals (id)
-        )`;
-
-        const galleryTable = `
-        CREATE TABLE IF NOT EXISTS gallery (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            fractal_id INTEGER NOT NULL,
-            fractal_hash TEXT NOT NULL,
-            added_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(user_id, fractal_hash),
-            FOREIGN KEY (fractal_id) REFERENCES fractals (id)
-        )`;
-
-        const usersTable = `
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            role TEXT DEFAULT 'user',
-            can_generate_fractals INTEGER DEFAULT 1
-        )`;
+        db.exec(PRAGMAS.join(';\n'), (err) => {
+            if (err) {
+                console.error("Error setting database pragmas:", err.message);
+            }
+        });
+        setInterval(() => {
+            db.exec('PRAGMA optimize', (err) => {
+                if (err) {
+                    console.error("Error optimizing database:", err.message);
+                }
+            });
+        }, OPTIMIZE_INTERVAL_MS).unref();
 
-        db.run(fractalsTable, (err) => {
+        db.run(TABLES.fractals, (err) => {
             if (err) {
             } else {
                 console.log("Fractals table created");
+                addColumns('fractals');
+                createIndexes('fractals');
             }
         });
 
-        db.run(historyTable, (err) => {
+        db.run(TABLES.history, (err) => {
             if (err) {
             } else {
                 console.log("History table created");
+                createIndexes('history');
             }
         });
 
-        db.run(galleryTable, (err) => {
+        db.run(TABLES.gallery, (err) => {
             if (err) {
             } else {
                 console.log("Gallery table created");
+                createIndexes('gallery');
             }
         });
 
-        db.run(usersTable, (err) => {
+        db.run(TABLES.users, (err) => {
             if (err) {
                 console.error("Error creating users table:", err.message);
             } else {
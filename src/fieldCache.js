@@ -0,0 +1,67 @@
+const crypto = require('crypto');
+const zlib = require('zlib');
+const { createIndexField } = require('./fractalKernel');
+
+// In-memory cache of rendered index fields (per-pixel colour-table indices,
+// see fractalKernel's createIndexField), keyed by geometry only. A request
+// that differs from an earlier render only in colour scheme is recoloured
+// from the stored field instead of being rendered again. Fields are kept
+// deflated and evicted least recently used once FIELD_CACHE_MB is exceeded.
+const DEFAULT_BUDGET_MB = 256;
+
+const budgetMb = parseFloat(process.env.FIELD_CACHE_MB);
+const budgetBytes = (isNaN(budgetMb) ? DEFAULT_BUDGET_MB : budgetMb) * 1024 * 1024;
+
+const fields = new Map();
+let totalBytes = 0;
+
+// Everything in the render options except the colour scheme
+function geometryKey(options) {
+    const { colorScheme, ...geometry } = options;
+    return crypto.createHash('sha256').update(JSON.stringify(geometry)).digest('hex');
+}
+
+function packField(field) {
+    return zlib.deflateSync(Buffer.from(field.buffer, field.byteOffset, field.byteLength), { level: 1 });
+}
+
+function unpackField(packed, maxIterations) {
+    const bytes = zlib.inflateSync(packed);
+    const elementSize = createIndexField(maxIterations, 0).BYTES_PER_ELEMENT;
+    // Copy into a fresh field so the typed array is aligned
+    const field = createIndexField(maxIterations, bytes.length / elementSize);
+    new Uint8Array(field.buffer).set(bytes);
+    return field;
+}
+
+function getField(options) {
+    const key = geometryKey(options);
+    const packed = fields.get(key);
+    if (!packed) return null;
+    // Refresh LRU position
+    fields.delete(key);
+    fields.set(key, packed);
+    return packed;
+}
+
+function putField(options, packed) {
+    if (packed.length > budgetBytes) return;
+    const key = geometryKey(options);
+    if (fields.has(key)) {
+        totalBytes -= fields.get(key).length;
+        fields.delete(key);
+    }
+    fields.set(key, packed);
+    totalBytes += packed.length;
+    for (const [oldKey, oldPacked] of fields) {
+        if (totalBytes <= budgetBytes) break;
+        fields.delete(oldKey);
+        totalBytes -= oldPacked.length;
+    }
+}
+
+function fieldCacheStatus() {
+    return { entries: fields.size, bytes: totalBytes, budgetBytes };
+}
+
+module.exports = { geometryKey, packField, unpackField, getField, putField, fieldCacheStatus };
@@ -1,132 +1,85 @@
 const { createCanvas } = require('canvas');
-
-// Map value ranges
-function map(value, start1, stop1, start2, stop2) {
-    return start2 + (stop2 - start2) * ((value - start1) / (stop1 - start1));
+const { renderPixels, colorField, renderShortcuts, PROGRESSIVE_STEPS } = require('./fractalKernel');
+const { usesPerturbation, renderPerturbed } = require('./perturbation');
+
+// zlib level for PNG encoding, 0 (fastest, largest) to 9 (slowest, smallest)
+const envLevel = parseInt(process.env.PNG_COMPRESSION_LEVEL);
+const compressionLevel = isNaN(envLevel) ? 6 : Math.min(9, Math.max(0, envLevel));
+
+// Encodes the canvas as PNG on libuv's thread pool instead of blocking
+function encodePng(canvas) {
+    return new Promise((resolve, reject) => {
+        canvas.toBuffer((err, buffer) => err ? reject(err) : resolve(buffer), 'image/png', { compressionLevel });
+    });
 }
 
-// HSL to RGB
-function hslToRgb(h, s, l) {
-    h /= 360; s /= 100; l /= 100;
-    let r, g, b;
-    if (s === 0) {
-        r = g = b = l;
-    } else {
-        const hue2rgb = (p, q, t) => {
-            if (t < 0) t += 1;
-            if (t > 1) t -= 1;
-            if (t < 1 / 6) return p + (q - p) * 6 * t;
-            if (t < 1 / 2) return q;
-            if (t < 2 / 3) return p + (q - p) * (2 / 3 - t) * 6;
-            return p;
-        };
-        const q = l < 0.5 ? l * (1 + s) : l + s - l * s;
-        const p = 2 * l - q;
-        r = hue2rgb(p, q, h + 1 / 3);
-        g = hue2rgb(p, q, h);
-        b = hue2rgb(p, q, h - 1 / 3);
-    }
-    return [Math.round(r * 255), Math.round(g * 255), Math.round(b * 255), 255];
-}
+// Encodes the pixels of `data` (width x height RGBA) that lie on the grid of
+// every `step`th row and column, i.e. the image scaled down by `step`
+function encodeStage(data, width, height, step) {
+    const stageWidth = Math.ceil(width / step);
+    const stageHeight = Math.ceil(height / step);
+    const canvas = createCanvas(stageWidth, stageHeight);
+    const ctx = canvas.getContext('2d');
+    const imageData = ctx.createImageData(stageWidth, stageHeight);
 
-// Color function with smoother mapping
-function getColor(n, max, scheme) {
-    if (n >= max) return [0, 0, 0, 255]; // inside set = black
-    const t = Math.sqrt(n / max);
-    switch (scheme) {
-        case "grayscale":
-            const gray = Math.floor(t * 255);
-            return [gray, gray, gray, 255];
-        case "rainbow":
-            const hueR = map(t, 0, 1, 0, 360);
-            return hslToRgb(hueR, 100, 50);
-        case "fire":
-            return [Math.floor(map(t, 0, 1, 0, 255)), Math.floor(map(t, 0, 1, 0, 150)), 0, 255];
-        default: // HSL
-            const hue = map(t, 0, 1, 0, 360);
-            const light = map(t, 0, 1, 20, 70);
-            return hslToRgb(hue, 100, light);
+    const source = new Uint32Array(data.buffer, data.byteOffset, width * height);
+    const target = new Uint32Array(imageData.data.buffer, imageData.data.byteOffset, stageWidth * stageHeight);
+    for (let y = 0, i = 0; y < stageHeight; y++) {
+        for (let x = 0, idx = y * step * width; x < stageWidth; x++, i++, idx += step) {
+            target[i] = source[idx];
+        }
     }
-}
 
-// Iteration function: z -> z^p + c
-function iterate(z, c, power) {
-    const r = Math.sqrt(z.real * z.real + z.imag * z.imag);
-    const theta = Math.atan2(z.imag, z.real);
-    const rP = Math.pow(r, power);
-    return {
-        real: rP * Math.cos(power * theta) + c.real,
-        imag: rP * Math.sin(power * theta) + c.imag
-    };
+    ctx.putImageData(imageData, 0, 0);
+    return encodePng(canvas).then(image => ({ step, width: stageWidth, height: stageHeight, image }));
 }
 
-// Main generator with smooth coloring and optional debug callback
-async function generateFractal({
-    width = 800,
-    height = 600,
-    maxIterations = 500,
-    power = 2,
-    c = { real: 0.285, imag: 0.01 },
-    scale = 1.5,
-    offsetX = 0,
-    offsetY = 0,
-    colorScheme = "rainbow",
-    maxTime = 120000, // max time in ms (2 minutes)
-    debugLog = null
-}) {
+// Main generator with smooth coloring and optional debug callback.
+// Deep zooms are rendered by perturbation (see perturbation.js).
+// options.onRendered, if given, is called with { iterations } once the
+// pixels are done, before PNG encoding.
+// With options.progressive the plain kernel renders in PROGRESSIVE_STEPS
+// passes, and options.onStage is called with { step, width, height, image }
+// (a PNG scaled down by `step`) for each pass before the last, in order and
+// before the full image is returned. Deep zooms have no stages.
+async function generateFractal(options) {
+    const { width = 800, height = 600 } = options;
     const canvas = createCanvas(width, height);
     const ctx = canvas.getContext('2d');
     const imageData = ctx.createImageData(width, height);
-    const data = imageData.data;
-
-    const startTime = Date.now();
-
-    for (let x = 0; x < width; x++) {
-        for (let y = 0; y < height; y++) {
-
-            // Check time limit
-            if (Date.now() - startTime > maxTime) {
-                if (debugLog) debugLog('Time limit reached, aborting fractal generation.');
-                return null;
-            }
-
-            let z = {
-                real: map(x, 0, width, -scale + offsetX, scale + offsetX),
-                imag: map(y, 0, height, -scale + offsetY, scale + offsetY)
-            };
 
-            let n = 0;
-            while (n < maxIterations) {
-                z = iterate(z, c, power);
-                if ((z.real * z.real + z.imag * z.imag) > 4) break;
-                n++;
-            }
-
-            // Smooth iteration count
-            let mu = n;
-            if (n < maxIterations) {
-                mu = n + 1 - Math.log(Math.log(Math.sqrt(z.real * z.real + z.imag * z.imag))) / Math.log(power);
-            }
-
-            const color = getColor(mu, maxIterations, colorScheme);
-            const idx = (y * width + x) * 4;
-            data[idx] = color[0];
-            data[idx + 1] = color[1];
-            data[idx + 2] = color[2];
-            data[idx + 3] = color[3];
+    const perturbed = usesPerturbation({ ...options, width, height });
+    const render = perturbed ? renderPerturbed : renderPixels;
+    // Stages are encoded while the next pass renders
+    let stages = Promise.resolve();
+    const progressive = options.progressive && !perturbed ? {
+        steps: PROGRESSIVE_STEPS,
+        onStage: (step) => {
+            if (step === 1 || !options.onStage) return;
+            const stage = encodeStage(imageData.data, width, height, step);
+            stages = stages.then(() => stage).then(options.onStage);
         }
+    } : {};
+    const result = await render({ ...options, width, height, data: imageData.data, ...renderShortcuts, ...progressive });
+    await stages;
+    if (!result) return null;
+    if (options.onRendered) options.onRendered({ iterations: result.iterations });
 
-        // Debug progress per column
-        if (debugLog && x % 100 === 0) {
-            debugLog(`Progress: x=${x}/${width}`);
-        }
+    ctx.putImageData(imageData, 0, 0);
+    return encodePng(canvas);
+}
 
-        // Yield to event loop to handle async tasks
-        await new Promise(resolve => setImmediate(resolve));
-    }
+// Colours a previously rendered index field (see renderPixels' `field`) with
+// options.colorScheme, without iterating again
+function recolorFractal({ width, height, maxIterations, colorScheme, field }) {
+    const canvas = createCanvas(width, height);
+    const ctx = canvas.getContext('2d');
+    const imageData = ctx.createImageData(width, height);
+
+    colorField(field, colorScheme, maxIterations, imageData.data);
 
     ctx.putImageData(imageData, 0, 0);
-    return canvas.toBuffer('image/png');
+    return encodePng(canvas);
 }
 
-module.exports = { generateFractal };
+module.exports = { generateFractal, recolorFractal };
@@ -0,0 +1,543 @@
+// Pixel kernel for generateFractal. Kept free of the canvas dependency so it
+// can be benchmarked and compared against golden images on its own.
+
+// Map value ranges
+function map(value, start1, stop1, start2, stop2) {
+    return start2 + (stop2 - start2) * ((value - start1) / (stop1 - start1));
+}
+
+// HSL to RGB
+function hslToRgb(h, s, l) {
+    h /= 360; s /= 100; l /= 100;
+    let r, g, b;
+    if (s === 0) {
+        r = g = b = l;
+    } else {
+        const hue2rgb = (p, q, t) => {
+            if (t < 0) t += 1;
+            if (t > 1) t -= 1;
+            if (t < 1 / 6) return p + (q - p) * 6 * t;
+            if (t < 1 / 2) return q;
+            if (t < 2 / 3) return p + (q - p) * (2 / 3 - t) * 6;
+            return p;
+        };
+        const q = l < 0.5 ? l * (1 + s) : l + s - l * s;
+        const p = 2 * l - q;
+        r = hue2rgb(p, q, h + 1 / 3);
+        g = hue2rgb(p, q, h);
+        b = hue2rgb(p, q, h - 1 / 3);
+    }
+    return [Math.round(r * 255), Math.round(g * 255), Math.round(b * 255), 255];
+}
+
+// Color function with smoother mapping
+function getColor(n, max, scheme) {
+    if (n >= max) return [0, 0, 0, 255]; // inside set = black
+    const t = Math.sqrt(n / max);
+    switch (scheme) {
+        case "grayscale":
+            const gray = Math.floor(t * 255);
+            return [gray, gray, gray, 255];
+        case "rainbow":
+            const hueR = map(t, 0, 1, 0, 360);
+            return hslToRgb(hueR, 100, 50);
+        case "fire":
+            return [Math.floor(map(t, 0, 1, 0, 255)), Math.floor(map(t, 0, 1, 0, 150)), 0, 255];
+        default: // HSL
+            const hue = map(t, 0, 1, 0, 360);
+            const light = map(t, 0, 1, 20, 70);
+            return hslToRgb(hue, 100, light);
+    }
+}
+
+// Palette lookup tables. Entry i holds getColor((i + 0.5) / COLOR_TABLE_STEPS),
+// i.e. the smooth count is quantised to 1/COLOR_TABLE_STEPS of an iteration.
+// The extra last entry is the inside-set colour. Tables are built once per
+// (colorScheme, maxIterations) and kept in an LRU cache across renders,
+// bounded by bytes since a table takes 64 bytes per iteration.
+const COLOR_TABLE_STEPS = 16;
+const COLOR_TABLE_CACHE_BYTES = 64 * 1024 * 1024;
+const colorTables = new Map();
+let colorTableBytes = 0;
+
+function getColorTable(colorScheme, maxIterations) {
+    const key = `${colorScheme}:${maxIterations}`;
+    let table = colorTables.get(key);
+    if (table) {
+        // Refresh LRU position
+        colorTables.delete(key);
+        colorTables.set(key, table);
+        return table;
+    }
+
+    const entries = maxIterations * COLOR_TABLE_STEPS + 1;
+    table = new Uint32Array(entries);
+    const bytes = new Uint8Array(table.buffer);
+    for (let i = 0; i < entries; i++) {
+        const color = getColor((i + 0.5) / COLOR_TABLE_STEPS, maxIterations, colorScheme);
+        bytes[i * 4] = color[0];
+        bytes[i * 4 + 1] = color[1];
+        bytes[i * 4 + 2] = color[2];
+        bytes[i * 4 + 3] = color[3];
+    }
+
+    colorTables.set(key, table);
+    colorTableBytes += table.byteLength;
+    // The new table stays even if it alone is over the budget
+    while (colorTableBytes > COLOR_TABLE_CACHE_BYTES && colorTables.size > 1) {
+        const [oldestKey, oldest] = colorTables.entries().next().value;
+        colorTables.delete(oldestKey);
+        colorTableBytes -= oldest.byteLength;
+    }
+    return table;
+}
+
+// Table entry for a smooth count; negative or non-finite counts are drawn as
+// inside the set, as getColor's NaN channels were.
+function colorIndex(mu, lastEntry) {
+    if (!(mu >= 0)) return lastEntry;
+    const i = (mu * COLOR_TABLE_STEPS) | 0;
+    return i < lastEntry ? i : lastEntry;
+}
+
+// Typed array for a field of colour-table indices: 16-bit while every index
+// fits, which keeps stored fields small.
+function createIndexField(maxIterations, pixels) {
+    return maxIterations * COLOR_TABLE_STEPS < 65536 ? new Uint16Array(pixels) : new Uint32Array(pixels);
+}
+
+// Colours an RGBA buffer from a field of colour-table indices, as written by
+// renderPixels. The indices only depend on the geometry and maxIterations,
+// so one field can be recoloured with any scheme.
+function colorField(field, colorScheme, maxIterations, data = new Uint8ClampedArray(field.length * 4)) {
+    const table = getColorTable(colorScheme, maxIterations);
+    const lastEntry = table.length - 1;
+    if (data.byteOffset % 4 === 0) {
+        const pixels = new Uint32Array(data.buffer, data.byteOffset, field.length);
+        for (let i = 0; i < field.length; i++) {
+            pixels[i] = table[Math.min(field[i], lastEntry)];
+        }
+    } else {
+        const tableBytes = new Uint8Array(table.buffer);
+        for (let i = 0; i < field.length; i++) {
+            const e = Math.min(field[i], lastEntry) * 4;
+            data.set(tableBytes.subarray(e, e + 4), i * 4);
+        }
+    }
+    return data;
+}
+
+// Integer powers up to this are raised by repeated complex multiplication,
+// which costs power - 1 multiplies per step; higher ones, like fractional
+// powers, use the polar form, whose cost doesn't grow with the power.
+const MAX_MULTIPLY_POWER = 8;
+
+// Whether escapeTime raises z to `power` by repeated multiplication
+function multipliesPower(power) {
+    return Number.isInteger(power) && power >= 2 && power <= MAX_MULTIPLY_POWER;
+}
+
+// Escape-time loop for z -> z^p + c starting from (zr, zi). Writes the number
+// of steps that stayed bounded and the final |z|^2 into out[0] and out[1].
+// Uses plain scalars throughout: complex multiplication for small integer
+// powers (see MAX_MULTIPLY_POWER), the polar form otherwise.
+function escapeTime(zr, zi, cr, ci, power, maxIterations, out) {
+    let n = 0;
+    let zr2 = zr * zr;
+    let zi2 = zi * zi;
+
+    if (power === 2) {
+        while (n < maxIterations) {
+            zi = 2 * zr * zi + ci;
+            zr = zr2 - zi2 + cr;
+            zr2 = zr * zr;
+            zi2 = zi * zi;
+            if (zr2 + zi2 > 4) break;
+            n++;
+        }
+    } else if (power > 2 && multipliesPower(power)) {
+        while (n < maxIterations) {
+            let pr = zr;
+            let pi = zi;
+            for (let k = 1; k < power; k++) {
+                const t = pr * zr - pi * zi;
+                pi = pr * zi + pi * zr;
+                pr = t;
+            }
+            zr = pr + cr;
+            zi = pi + ci;
+            zr2 = zr * zr;
+            zi2 = zi * zi;
+            if (zr2 + zi2 > 4) break;
+            n++;
+        }
+    } else {
+        while (n < maxIterations) {
+            const rP = Math.pow(Math.sqrt(zr2 + zi2), power);
+            const theta = power * Math.atan2(zi, zr);
+            zr = rP * Math.cos(theta) + cr;
+            zi = rP * Math.sin(theta) + ci;
+            zr2 = zr * zr;
+            zi2 = zi * zi;
+            if (zr2 + zi2 > 4) break;
+            n++;
+        }
+    }
+
+    out[0] = n;
+    out[1] = zr2 + zi2;
+}
+
+// Periodicity checking (Brent): the orbit is compared against a saved point
+// that is replaced at iterations PERIOD_CHECK_START, 2x that, 4x that, ...
+// An orbit that comes back to within PERIOD_TOLERANCE of the saved point has
+// settled onto an attracting cycle and will never escape, so the pixel is
+// inside the set without running to maxIterations. The check costs about a
+// third more per step, so renderPixels only uses it after a pixel that was
+// inside the set, where the next one most likely is too.
+const PERIOD_CHECK_START = 16;
+const PERIOD_TOLERANCE = 1e-13;
+
+// escapeTime with periodicity checking: out[0] is set to maxIterations as
+// soon as the orbit is found to be periodic, and out[2] to the number of
+// steps actually computed.
+function escapeTimePeriodic(zr, zi, cr, ci, power, maxIterations, out) {
+    let n = 0;
+    let zr2 = zr * zr;
+    let zi2 = zi * zi;
+    let savedR = zr;
+    let savedI = zi;
+    let nextSave = PERIOD_CHECK_START;
+    let periodic = false;
+
+    if (power === 2) {
+        while (n < maxIterations) {
+            zi = 2 * zr * zi + ci;
+            zr = zr2 - zi2 + cr;
+            zr2 = zr * zr;
+            zi2 = zi * zi;
+            if (zr2 + zi2 > 4) break;
+            n++;
+            if (Math.abs(zr - savedR) + Math.abs(zi - savedI) < PERIOD_TOLERANCE) { periodic = true; break; }
+            if (n === nextSave) { savedR = zr; savedI = zi; nextSave *= 2; }
+        }
+    } else if (power > 2 && multipliesPower(power)) {
+        while (n < maxIterations) {
+            let pr = zr;
+            let pi = zi;
+            for (let k = 1; k < power; k++) {
+                const t = pr * zr - pi * zi;
+                pi = pr * zi + pi * zr;
+                pr = t;
+            }
+            zr = pr + cr;
+            zi = pi + ci;
+            zr2 = zr * zr;
+            zi2 = zi * zi;
+            if (zr2 + zi2 > 4) break;
+            n++;
+            if (Math.abs(zr - savedR) + Math.abs(zi - savedI) < PERIOD_TOLERANCE) { periodic = true; break; }
+            if (n === nextSave) { savedR = zr; savedI = zi; nextSave *= 2; }
+        }
+    } else {
+        while (n < maxIterations) {
+            const rP = Math.pow(Math.sqrt(zr2 + zi2), power);
+            const theta = power * Math.atan2(zi, zr);
+            zr = rP * Math.cos(theta) + cr;
+            zi = rP * Math.sin(theta) + ci;
+            zr2 = zr * zr;
+            zi2 = zi * zi;
+            if (zr2 + zi2 > 4) break;
+            n++;
+            if (Math.abs(zr - savedR) + Math.abs(zi - savedI) < PERIOD_TOLERANCE) { periodic = true; break; }
+            if (n === nextSave) { savedR = zr; savedI = zi; nextSave *= 2; }
+        }
+    }
+
+    out[0] = periodic ? maxIterations : n;
+    out[1] = zr2 + zi2;
+    out[2] = n;
+}
+
+// Mariani-Silver subdivision: a rectangle whose border pixels are all inside
+// the set is filled as inside without iterating it, otherwise it is split in
+// four. For integer powers the escaping region is connected, so it can't sit
+// inside such a border without crossing it; as a guard against channels
+// thinner than a pixel, the SUBDIVISION_PROBES points inside the rectangle
+// must be inside the set too. Escaping pixels are never filled, since their
+// smooth colours differ even at equal escape counts.
+const SUBDIVISION_TILE = 64; // rectangles start as tiles of this size
+const SUBDIVISION_MIN_SIZE = 6; // rectangles narrower than this are rendered pixel by pixel
+const SUBDIVISION_PROBES = [[0.5, 0.5], [0.25, 0.25], [0.75, 0.25], [0.25, 0.75], [0.75, 0.75]];
+
+// Pixel state while subdividing
+const UNRENDERED = 0;
+const ESCAPED = 1;
+const INSIDE = 2;
+
+// Writes colour-table entry `entry` for pixel `idx` to the render's field
+// and pixel buffer
+function setEntry(render, idx, entry) {
+    if (render.field) render.field[idx] = entry;
+    if (render.pixels) {
+        render.pixels[idx] = render.table[entry];
+    } else {
+        const o = idx * 4;
+        const e = entry * 4;
+        render.data[o] = render.tableBytes[e];
+        render.data[o + 1] = render.tableBytes[e + 1];
+        render.data[o + 2] = render.tableBytes[e + 2];
+        render.data[o + 3] = render.tableBytes[e + 3];
+    }
+}
+
+// Renders pixel (x, y) and returns whether it is inside the set
+function renderPoint(render, x, y, idx) {
+    const { width, height, scale, offsetX, offsetY, c, power, maxIterations, escape } = render;
+    const zr = map(x, 0, width, -scale + offsetX, scale + offsetX);
+    const zi = map(y, 0, height, -scale + offsetY, scale + offsetY);
+    if (render.periodicity && render.lastInside) {
+        escapeTimePeriodic(zr, zi, c.real, c.imag, power, maxIterations, escape);
+    } else {
+        escapeTime(zr, zi, c.real, c.imag, power, maxIterations, escape);
+        escape[2] = escape[0];
+    }
+    const n = escape[0];
+    render.lastInside = n >= maxIterations;
+
+    // Smooth iteration count
+    let mu = n;
+    if (!render.lastInside) {
+        render.iterations += n + 1;
+        mu = n + 1 - Math.log(Math.log(Math.sqrt(escape[1]))) / render.logPower;
+    } else {
+        render.iterations += escape[2];
+    }
+
+    setEntry(render, idx, colorIndex(mu, render.lastEntry));
+    return render.lastInside;
+}
+
+function isInside(render, x, y) {
+    const idx = y * render.width + x;
+    if (render.state[idx] === UNRENDERED) {
+        render.state[idx] = renderPoint(render, x, y, idx) ? INSIDE : ESCAPED;
+    }
+    return render.state[idx] === INSIDE;
+}
+
+// Renders the rectangle with corners (x0, y0) and (x1, y1), inclusive. A
+// band of tiles can take long, so the time limit is checked per rectangle
+// too; once it has passed, render.expired is set and nothing more is done.
+function renderRect(render, x0, y0, x1, y1) {
+    if (render.expired || Date.now() > render.deadline) {
+        render.expired = true;
+        return;
+    }
+    if (x1 - x0 < SUBDIVISION_MIN_SIZE || y1 - y0 < SUBDIVISION_MIN_SIZE) {
+        for (let y = y0; y <= y1; y++) {
+            for (let x = x0; x <= x1; x++) isInside(render, x, y);
+        }
+        return;
+    }
+
+    // Every border pixel is rendered, so shared edges are all memoized
+    let inside = true;
+    for (let x = x0; x <= x1; x++) {
+        if (!isInside(render, x, y0)) inside = false;
+        if (!isInside(render, x, y1)) inside = false;
+    }
+    for (let y = y0 + 1; y < y1; y++) {
+        if (!isInside(render, x0, y)) inside = false;
+        if (!isInside(render, x1, y)) inside = false;
+    }
+    for (let i = 0; inside && i < SUBDIVISION_PROBES.length; i++) {
+        const [fx, fy] = SUBDIVISION_PROBES[i];
+        inside = isInside(render, x0 + Math.round((x1 - x0) * fx), y0 + Math.round((y1 - y0) * fy));
+    }
+
+    if (inside) {
+        const { width, state, lastEntry } = render;
+        for (let y = y0 + 1; y < y1; y++) {
+            for (let x = x0 + 1, idx = y * width + x; x < x1; x++, idx++) {
+                if (state[idx] === UNRENDERED) {
+                    state[idx] = INSIDE;
+                    setEntry(render, idx, lastEntry);
+                }
+            }
+        }
+        return;
+    }
+
+    const mx = (x0 + x1) >> 1;
+    const my = (y0 + y1) >> 1;
+    renderRect(render, x0, y0, mx, my);
+    renderRect(render, mx, y0, x1, my);
+    renderRect(render, x0, my, mx, y1);
+    renderRect(render, mx, my, x1, y1);
+}
+
+// The shortcuts the server renders with, from RENDER_PERIODICITY and
+// RENDER_SUBDIVISION (on unless set to 0)
+const renderShortcuts = {
+    periodicity: process.env.RENDER_PERIODICITY !== '0',
+    subdivision: process.env.RENDER_SUBDIVISION !== '0'
+};
+
+// Grid steps of a progressive render: a 1/8-scale preview, then passes that
+// at 1/4 and full scale that add the pixels missing from the grid before
+const PROGRESSIVE_STEPS = [8, 4, 1];
+
+// Pixels on the grid of every `step`th row and column
+function gridPixels(width, height, step) {
+    return Math.ceil(width / step) * Math.ceil(height / step);
+}
+
+// Fills an RGBA buffer with the fractal, smooth-coloured. If `field` is given
+// (see createIndexField) the colour-table index of every pixel is written to
+// it as well. `periodicity` and `subdivision` switch on the two shortcuts for
+// pixels inside the set described above; without them every pixel is
+// iterated in full, which is the reference the shortcuts are checked against.
+//
+// `steps` renders in passes over ever finer grids (see PROGRESSIVE_STEPS),
+// each dividing the one before and the last 1. A pass computes only the
+// pixels that are new on its grid, so the passes together cost what one
+// full render does and end with the same image. After each pass,
+// onStage(step) is called: every pixel at a multiple of `step` in both
+// directions is final from then on.
+//
+// Resolves to { data, iterations } where iterations is the total number of
+// z -> z^p + c steps taken, or to null if maxTime ran out.
+async function renderPixels({
+    width = 800,
+    height = 600,
+    maxIterations = 500,
+    power = 2,
+    c = { real: 0.285, imag: 0.01 },
+    scale = 1.5,
+    offsetX = 0,
+    offsetY = 0,
+    colorScheme = "rainbow",
+    maxTime = 120000, // max time in ms (2 minutes)
+    debugLog = null,
+    onProgress = null, // called with (done, total) roughly every 1% of rows: rows for one pass, pixels for several
+    data = new Uint8ClampedArray(width * height * 4),
+    field = null,
+    periodicity = false,
+    subdivision = false,
+    steps = [1],
+    onStage = null
+}) {
+    const startTime = Date.now();
+    // An offset may be a decimal string (see exactOffset in perturbation.js);
+    // digits beyond a double's only matter to deep zooms
+    offsetX = Number(offsetX);
+    offsetY = Number(offsetY);
+    const logPower = Math.log(power);
+    const escape = new Float64Array(3);
+    const table = getColorTable(colorScheme, maxIterations);
+    const lastEntry = table.length - 1;
+    const useSubdivision = subdivision && Number.isInteger(power);
+    const state = useSubdivision ? new Uint8Array(width * height) : null;
+    const render = {
+        width, height, scale, offsetX, offsetY, c, power, maxIterations, periodicity, logPower, escape, table, lastEntry,
+        tableBytes: new Uint8Array(table.buffer),
+        data,
+        // Write whole pixels through a 32-bit view when the buffer is aligned for one
+        pixels: data.byteOffset % 4 === 0 ? new Uint32Array(data.buffer, data.byteOffset, width * height) : null,
+        field,
+        state,
+        lastInside: false,
+        iterations: 0,
+        deadline: startTime + maxTime,
+        expired: false
+    };
+    const progressStep = Math.max(1, Math.floor(height / 100));
+    let previous = 0;
+
+    for (const step of steps) {
+        // Subdivision works a band of tiles at a time, the other passes one
+        // grid row at a time
+        const subdivide = useSubdivision && step === 1;
+        const bandHeight = subdivide ? SUBDIVISION_TILE : step;
+        // Pixels finished by earlier passes, for progress across passes
+        const pixelsBefore = previous ? gridPixels(width, height, previous) : 0;
+        const passPixels = gridPixels(width, height, step) - pixelsBefore;
+
+        for (let y0 = 0; y0 < height; y0 += bandHeight) {
+            const y1 = Math.min(height, y0 + bandHeight);
+
+            // Check time limit once per band of rows (and per rectangle in
+            // renderRect)
+            if (Date.now() - startTime > maxTime) {
+                if (debugLog) debugLog('Time limit reached, aborting fractal generation.');
+                return null;
+            }
+
+            if (subdivide) {
+                for (let x0 = 0; x0 < width; x0 += SUBDIVISION_TILE) {
+                    renderRect(render, x0, y0, Math.min(width, x0 + SUBDIVISION_TILE) - 1, y1 - 1);
+                }
+                if (render.expired) {
+                    if (debugLog) debugLog('Time limit reached, aborting fractal generation.');
+                    return null;
+                }
+            } else {
+                let inside = false;
+                for (let y = y0; y < y1; y += step) {
+                    const zi = map(y, 0, height, -scale + offsetY, scale + offsetY);
+                    // On rows an earlier pass covered, skip the columns it computed
+                    const done = previous && y % previous === 0 ? previous : 0;
+                    for (let x = 0, idx = y * width; x < width; x += step, idx += step) {
+                        if (done && x % done === 0) continue;
+                        const zr = map(x, 0, width, -scale + offsetX, scale + offsetX);
+                        if (periodicity && inside) {
+                            escapeTimePeriodic(zr, zi, c.real, c.imag, power, maxIterations, escape);
+                        } else {
+                            escapeTime(zr, zi, c.real, c.imag, power, maxIterations, escape);
+                            escape[2] = escape[0];
+                        }
+                        const n = escape[0];
+                        inside = n >= maxIterations;
+                        if (state) state[idx] = inside ? INSIDE : ESCAPED;
+
+                        // Smooth iteration count
+                        let mu = n;
+                        if (n < maxIterations) {
+                            render.iterations += n + 1;
+                            mu = n + 1 - Math.log(Math.log(Math.sqrt(escape[1]))) / logPower;
+                        } else {
+                            render.iterations += escape[2];
+                        }
+                        setEntry(render, idx, colorIndex(mu, lastEntry));
+                    }
+                }
+            }
+
+            // Debug progress
+            if (debugLog && Math.floor(y0 / 100) !== Math.floor(y1 / 100)) {
+                debugLog(`Progress: y=${y1}/${height}${steps.length > 1 ? ` (step ${step})` : ''}`);
+            }
+            if (onProgress && (y1 % progressStep < bandHeight || y1 === height)) {
+                if (steps.length > 1) {
+                    onProgress(pixelsBefore + Math.round(passPixels * y1 / height), width * height);
+                } else {
+                    onProgress(y1, height);
+                }
+            }
+
+            // Yield to event loop to handle async tasks
+            await new Promise(resolve => setImmediate(resolve));
+        }
+
+        if (onStage) onStage(step);
+        previous = step;
+    }
+
+    return { data, iterations: render.iterations };
+}
+
+module.exports = {
+    map, hslToRgb, getColor, getColorTable, colorIndex, createIndexField, colorField, escapeTime, multipliesPower, renderPixels,
+    renderShortcuts, PROGRESSIVE_STEPS
+};
@@ -0,0 +1,386 @@
+const crypto = require('crypto');
+const { getRenderPool } = require('./renderPool');
+const { getField, putField } = require('./fieldCache');
+const { fractalsDir, hasImage, saveImage } = require('./imageStore');
+const { hasTile, saveTile } = require('./tileStore');
+const { estimateRender, estimateRecolor, calibrate } = require('./costModel');
+const { exactOffset } = require('./perturbation');
+const {
+    renderLabels, renderDuration, iterationsTotal, iterationSeconds, cacheLookups, tileLookups, renderFailures, renderEstimateRatio,
+    admissionRejections
+} = require('./metrics');
+const Fractal = require('./models/fractal.model.js');
+const History = require('./models/history.model.js');
+const Gallery = require('./models/gallery.model.js');
+
+// Admission limits: a render predicted to take longer than RENDER_MAX_SECONDS
+// is refused (and one that runs over it anyway is aborted), as is one that
+// would finish more than RENDER_MAX_WAIT_SECONDS from now
+const envMaxSeconds = parseFloat(process.env.RENDER_MAX_SECONDS);
+const maxRenderSeconds = isNaN(envMaxSeconds) ? 120 : envMaxSeconds;
+const envMaxWait = parseFloat(process.env.RENDER_MAX_WAIT_SECONDS);
+const maxWaitSeconds = isNaN(envMaxWait) ? 300 : envMaxWait;
+
+// Error carrying the HTTP status the routes should answer with, and
+// optionally the seconds after which a retry could succeed
+function httpError(status, message, retryAfter = null) {
+    const err = new Error(message);
+    err.status = status;
+    if (retryAfter !== null) err.retryAfter = retryAfter;
+    return err;
+}
+
+// Iteration budgets are clamped to this. Colour tables take 64 bytes per
+// iteration (see getColorTable), and no image with more fits the render
+// time limit anyway.
+const MAX_ITERATIONS = 100000;
+// Powers are clamped to +-MAX_POWER. Beyond it the set only gets more
+// uniformly round, and every step of a sample or render stays cheap.
+const MAX_POWER = 16;
+
+// A number, or a decimal string for a deep zoom's centre that has more
+// digits than a double holds (see exactOffset)
+function parseOffset(value) {
+    return exactOffset(value) || parseFloat(value) || 0;
+}
+
+// Normalise a request body into render options. The hash of these options
+// identifies the fractal, so keys and defaults must stay stable.
+function parseOptions(body) {
+    const c = body.c || {};
+    return {
+        width: parseInt(body.width) || 1920,
+        height: parseInt(body.height) || 1080,
+        maxIterations: Math.min(Math.max(parseInt(body.maxIterations) || 500, 1), MAX_ITERATIONS),
+        power: Math.min(Math.max(parseFloat(body.power) || 2, -MAX_POWER), MAX_POWER),
+        c: {
+            real: parseFloat(c.real) || 0.285,
+            imag: parseFloat(c.imag) || 0.01
+        },
+        scale: parseFloat(body.scale) || 1,
+        offsetX: parseOffset(body.offsetX),
+        offsetY: parseOffset(body.offsetY),
+        colorScheme: body.colorScheme || 'rainbow',
+    };
+}
+
+function hashOptions(options) {
+    return crypto.createHash('sha256').update(JSON.stringify(options)).digest('hex');
+}
+
+// Log the fractal to the user's history and add it to their gallery (if not already there)
+function recordForUser(userId, fractalId, hash) {
+    History.createHistoryEntry(userId, fractalId, (err) => {
+        if (err) {
+            console.error("Failed to log history", err);
+        }
+    });
+    Gallery.addToGallery(userId, fractalId, hash, (err) => {
+        if (err) {
+            console.error("Failed to add to gallery", err);
+        }
+    });
+}
+
+function recordRender(options, mode, { seconds, iterations }) {
+    renderDuration.observe(renderLabels(options, mode), seconds);
+    if (mode === 'render') {
+        iterationsTotal.inc({}, iterations);
+        iterationSeconds.inc({}, seconds);
+    }
+}
+
+// Predicts the render (or recolour) of `options` and checks it against the
+// admission limits. Resolves to the estimate with etaSeconds, the predicted
+// wait plus render time; rejects with a 422 or 429 httpError.
+async function admitRender(options, field) {
+    let estimate;
+    try {
+        estimate = field ? estimateRecolor(options) : await estimateRender(options);
+    } catch (err) {
+        if (err.code !== 'QUEUE_FULL') throw err;
+        admissionRejections.inc({ reason: 'backlog' });
+        throw httpError(429, 'Too many renders are being estimated. Try again later.', 1);
+    }
+    if (estimate.seconds > maxRenderSeconds) {
+        admissionRejections.inc({ reason: 'too_slow' });
+        const predicted = isFinite(estimate.seconds) ? `about ${Math.ceil(estimate.seconds)}s` : 'far too long';
+        throw httpError(422, `This fractal would take ${predicted} to render, over the ${maxRenderSeconds}s limit. `
+            + 'Try fewer iterations or a smaller image.');
+    }
+
+    const waitSeconds = getRenderPool().waitSeconds();
+    if (waitSeconds + estimate.seconds > maxWaitSeconds) {
+        admissionRejections.inc({ reason: 'backlog' });
+        throw httpError(429, 'The render queue is too busy for this fractal. Try again later.', Math.ceil(waitSeconds));
+    }
+    return { ...estimate, etaSeconds: waitSeconds + estimate.seconds };
+}
+
+// Renders the image for `options` on the render pool. If the same geometry
+// was rendered before in another colour scheme, the cached index field is
+// recoloured instead. The render is admitted first (see admitRender) and
+// hooks.onEstimate called with the estimate. With hooks.progressive a full
+// render is done in passes and hooks.onStage gets each preview stage (see
+// generateFractal). hooks.cacheField = false keeps the render's field out
+// of the field cache. Resolves to { image, estimate } where the estimate also
+// carries actualSeconds; rejects with an httpError.
+async function renderImage(options, hooks) {
+    const field = getField(options);
+    let estimate = await admitRender(options, field);
+    if (hooks.onEstimate) hooks.onEstimate(estimate);
+
+    let result;
+    try {
+        const task = field ? { ...options, field } : {
+            ...options, maxTime: maxRenderSeconds * 1000, progressive: !!hooks.progressive, cacheField: hooks.cacheField !== false
+        };
+        result = await getRenderPool().run(task, { ...hooks, cost: estimate.seconds });
+    } catch (err) {
+        if (err.code === 'QUEUE_FULL') {
+            renderFailures.inc({ status: 429 });
+            throw httpError(429, 'The render queue is full. Try again later.');
+        }
+        console.error(err);
+        renderFailures.inc({ status: 500 });
+        throw httpError(500, 'Fractal generation failed');
+    }
+
+    if (!result) {
+        renderFailures.inc({ status: 499 });
+        throw httpError(499, 'Fractal generation aborted due to time limit.');
+    }
+    recordRender(options, field ? 'recolor' : 'render', result.stats);
+    renderEstimateRatio.observe({ kind: estimate.kind }, calibrate(estimate, result.stats.seconds));
+    estimate = { ...estimate, actualSeconds: result.stats.seconds };
+    if (result.field) {
+        putField(options, result.field);
+    }
+    return { image: result.image, estimate };
+}
+
+// Renders the fractal for `options` (see renderImage), saves the image and,
+// unless the row already exists (`fractalId`, when an evicted image is
+// rendered again), its fractals row. Resolves to { fractalId, estimate };
+// rejects with an httpError.
+async function renderAndStore(options, hash, hooks, fractalId = null) {
+    const { image, estimate } = await renderImage(options, hooks);
+
+    let imagePath;
+    try {
+        imagePath = await saveImage(hash, image);
+    } catch (err) {
+        console.error("Failed to write fractal image", err);
+        throw httpError(500, "Failed to save fractal.");
+    }
+    if (fractalId) {
+        return { fractalId, estimate };
+    }
+
+    const fractalData = { ...options, hash, imagePath };
+
+    const result = await new Promise((resolve, reject) => {
+        Fractal.createFractal(fractalData, (err, result) => {
+            if (err) {
+                console.error("Failed to save fractal to DB", err);
+                return reject(httpError(500, "Failed to save fractal."));
+            }
+            resolve(result);
+        });
+    });
+    return { fractalId: result.id, estimate };
+}
+
+// Renders currently in progress, by options hash. Identical requests that
+// arrive while a render is running wait for it instead of rendering again;
+// each waiter's onEstimate/onStart/onProgress/onStage hooks are fed from the
+// shared render. A render is progressive if the request that started it was;
+// later waiters only get the stages it produces.
+const inFlight = new Map();
+
+function joinRender(options, hash, { onEstimate = null, onStart = null, onProgress = null, onStage = null, progressive = false }, fractalId = null) {
+    let render = inFlight.get(hash);
+    if (!render) {
+        render = { waiters: [], estimate: null, started: false, progress: null, stages: [] };
+        render.promise = renderAndStore(options, hash, {
+            progressive,
+            onEstimate: (estimate) => {
+                render.estimate = estimate;
+                render.waiters.forEach(w => w.onEstimate && w.onEstimate(estimate));
+            },
+            onStart: () => {
+                render.started = true;
+                render.waiters.forEach(w => w.onStart && w.onStart());
+            },
+            onProgress: (progress) => {
+                render.progress = progress;
+                render.waiters.forEach(w => w.onProgress && w.onProgress(progress));
+            },
+            onStage: (stage) => {
+                render.stages.push(stage);
+                render.waiters.forEach(w => w.onStage && w.onStage(stage));
+            }
+        }, fractalId).finally(() => inFlight.delete(hash));
+        inFlight.set(hash, render);
+    } else {
+        // Catch a late joiner up with the render's state
+        if (render.estimate && onEstimate) onEstimate(render.estimate);
+        if (render.started && onStart) onStart();
+        if (render.progress && onProgress) onProgress(render.progress);
+        if (onStage) render.stages.forEach(onStage);
+    }
+    render.waiters.push({ onEstimate, onStart, onProgress, onStage });
+    return render.promise;
+}
+
+// Whether a render of `options` is already running (a new request for it
+// will join that render rather than take a queue slot)
+function isRendering(options) {
+    return inFlight.has(hashOptions(options));
+}
+
+// Render options for a fractals row
+function rowOptions(row) {
+    return {
+        width: row.width,
+        height: row.height,
+        maxIterations: row.iterations,
+        power: row.power,
+        c: { real: row.c_real, imag: row.c_imag },
+        scale: row.scale,
+        offsetX: row.offsetX_decimal ?? row.offsetX,
+        offsetY: row.offsetY_decimal ?? row.offsetY,
+        colorScheme: row.colorScheme,
+    };
+}
+
+// Makes sure the image for `hash` is in the image store, rendering it again
+// if it was evicted. Resolves to false if there is no such fractal.
+function ensureImage(hash) {
+    if (hasImage(hash)) {
+        return Promise.resolve(true);
+    }
+    return new Promise((resolve, reject) => {
+        Fractal.findFractalByHash(hash, (err, row) => {
+            if (err) {
+                return reject(httpError(500, "Database error"));
+            }
+            if (!row) {
+                return resolve(false);
+            }
+            if (hasImage(hash)) {
+                return resolve(true);
+            }
+            joinRender(rowOptions(row), hash, {}, row.id).then(() => resolve(true), reject);
+        });
+    });
+}
+
+// Finds or renders the fractal for `options` on behalf of `user`.
+// Resolves to { fractal, hash, cached, estimate }, where estimate (null for
+// a stored image) holds the predicted and actual render seconds; rejects
+// with an httpError. onEstimate / onStart / onProgress / onStage are called
+// as the render, if one is needed, is admitted, starts and progresses;
+// hooks.progressive asks for preview stages.
+function produceFractal(user, options, hooks = {}) {
+    const hash = hashOptions(options);
+
+    if (inFlight.has(hash)) {
+        cacheLookups.inc({ result: 'inflight' });
+        return joinRender(options, hash, hooks).then(({ fractalId, estimate }) => {
+            recordForUser(user.id, fractalId, hash);
+            return { fractal: { ...options, hash }, hash, cached: false, estimate };
+        });
+    }
+
+    return new Promise((resolve, reject) => {
+        Fractal.findFractalByHash(hash, (err, row) => {
+            if (err) {
+                return reject(httpError(500, "Database error"));
+            }
+
+            if (row) {
+                recordForUser(user.id, row.id, row.hash);
+                if (hasImage(hash)) {
+                    cacheLookups.inc({ result: 'hit' });
+                    return resolve({ fractal: row, hash, cached: true, estimate: null });
+                }
+                // The image was evicted from the store; render it again
+                cacheLookups.inc({ result: 'evicted' });
+                return joinRender(options, hash, hooks, row.id).then(({ estimate }) => {
+                    resolve({ fractal: row, hash, cached: false, estimate });
+                }, reject);
+            }
+
+            // Fractal does not exist, generate it (or wait for a render of it
+            // that started during the lookup)
+            cacheLookups.inc({ result: 'miss' });
+            joinRender(options, hash, hooks).then(({ fractalId, estimate }) => {
+                recordForUser(user.id, fractalId, hash);
+                resolve({ fractal: { ...options, hash }, hash, cached: false, estimate });
+            }, reject);
+        });
+    });
+}
+
+// Map tiles: zoom level z splits the square [-TILE_EXTENT, TILE_EXTENT]^2 of
+// the plane, which holds the whole Julia set, into 2^z x 2^z tiles of
+// TILE_SIZE pixels, (0, 0) at the top left. Tiles of a level abut exactly,
+// so a pan or zoom only needs the tiles it newly exposes. Past
+// MAX_TILE_ZOOM tile centres are no longer exact doubles.
+const TILE_SIZE = 256;
+const TILE_EXTENT = 2;
+const MAX_TILE_ZOOM = 48;
+
+// Render options for tile (z, x, y) of the fractal given by `params`
+// (maxIterations, power, c_real, c_imag and colorScheme, defaulting as for
+// /generate), or null if there is no such tile
+function tileOptions(params, z, x, y) {
+    if (![z, x, y].every(Number.isInteger) || z < 0 || z > MAX_TILE_ZOOM) return null;
+    const tiles = 2 ** z;
+    if (x < 0 || y < 0 || x >= tiles || y >= tiles) return null;
+    const scale = TILE_EXTENT / tiles;
+    return parseOptions({
+        width: TILE_SIZE,
+        height: TILE_SIZE,
+        maxIterations: params.maxIterations,
+        power: params.power,
+        c: { real: params.c_real, imag: params.c_imag },
+        scale,
+        offsetX: (2 * x + 1) * scale - TILE_EXTENT,
+        offsetY: (2 * y + 1) * scale - TILE_EXTENT,
+        colorScheme: params.colorScheme
+    });
+}
+
+// Tile renders in progress, by options hash
+const tilesInFlight = new Map();
+
+// Finds the tile for `options` (see tileOptions) in the tile store or
+// renders it there. Tiles are not recorded in the database or any gallery,
+// nor their fields cached: a map view asks for dozens of tiles at once, which
+// would push out the fields of whole images.
+// Resolves to { hash, cached }; rejects with an httpError.
+function produceTile(options) {
+    const hash = hashOptions(options);
+    if (hasTile(hash)) {
+        tileLookups.inc({ result: 'hit' });
+        return Promise.resolve({ hash, cached: true });
+    }
+
+    let render = tilesInFlight.get(hash);
+    if (render) {
+        tileLookups.inc({ result: 'inflight' });
+    } else {
+        tileLookups.inc({ result: 'miss' });
+        render = renderImage(options, { cacheField: false })
+            .then(({ image }) => saveTile(hash, image))
+            .finally(() => tilesInFlight.delete(hash));
+        tilesInFlight.set(hash, render);
+    }
+    return render.then(() => ({ hash, cached: false }));
+}
+
+module.exports = {
+    fractalsDir, httpError, parseOptions, hashOptions, isRendering, ensureImage, produceFractal, TILE_SIZE, tileOptions, produceTile
+};
@@ -0,0 +1,155 @@
+const fs = require('fs');
+const path = require('path');
+const Gallery = require('./models/gallery.model.js');
+
+// Managed store for the rendered PNGs in ./fractals. An in-memory index of
+// every image (size, last access, hit count) is loaded once at startup, so
+// requests don't stat the disk. When the store grows past IMAGE_STORE_MB,
+// images no gallery references are evicted, least recently used first (or
+// least frequently used with IMAGE_STORE_POLICY=lfu), down to
+// LOW_WATER_FRACTION of the budget. An evicted image keeps its fractals row
+// and is rendered again the next time it is requested.
+//
+// An image is saved before its fractals and gallery rows are written, so
+// for EVICTION_GRACE_MS after saving it is never evicted. Otherwise a fresh
+// render, not yet referenced and with no hits, would be the first to go and
+// the URL just handed to the client would need another render.
+const fractalsDir = './fractals';
+const DEFAULT_BUDGET_MB = 1024;
+const LOW_WATER_FRACTION = 0.9;
+const EVICTION_GRACE_MS = 60 * 1000;
+
+const budgetMb = parseFloat(process.env.IMAGE_STORE_MB);
+const budgetBytes = (isNaN(budgetMb) ? DEFAULT_BUDGET_MB : budgetMb) * 1024 * 1024;
+const policy = process.env.IMAGE_STORE_POLICY === 'lfu' ? 'lfu' : 'lru';
+
+const images = new Map(); // hash -> { size, lastAccess, hits, savedAt }
+let totalBytes = 0;
+let evicting = false;
+let evictPending = false; // a call was skipped while evicting
+let retryTimer = null;
+
+function imagePath(hash) {
+    return `${fractalsDir}/${hash}.png`;
+}
+
+// Builds the index from the files on disk. Call once before serving.
+function loadImageStore() {
+    fs.mkdirSync(fractalsDir, { recursive: true });
+    images.clear();
+    totalBytes = 0;
+    for (const name of fs.readdirSync(fractalsDir)) {
+        if (name.endsWith('.tmp')) {
+            // Left over from a write interrupted by a crash
+            fs.unlinkSync(path.join(fractalsDir, name));
+            continue;
+        }
+        if (!name.endsWith('.png')) continue;
+        const stat = fs.statSync(path.join(fractalsDir, name));
+        images.set(name.slice(0, -4), { size: stat.size, lastAccess: stat.mtimeMs, hits: 0, savedAt: 0 });
+        totalBytes += stat.size;
+    }
+    console.log(`Image store: ${images.size} images, ${(totalBytes / 1024 / 1024).toFixed(1)} MB`);
+    evictIfNeeded();
+}
+
+function hasImage(hash) {
+    return images.has(hash);
+}
+
+// Records an access to the image; returns false if it isn't in the store
+function touchImage(hash) {
+    const entry = images.get(hash);
+    if (!entry) return false;
+    entry.lastAccess = Date.now();
+    entry.hits++;
+    return true;
+}
+
+// Writes the image and adds it to the index. The file is written under a
+// temporary name and renamed, so it is never served half-written.
+// Resolves to the image's path.
+async function saveImage(hash, buffer) {
+    const file = imagePath(hash);
+    const tmpFile = `${file}.${process.pid}.tmp`;
+    await fs.promises.writeFile(tmpFile, buffer);
+    await fs.promises.rename(tmpFile, file);
+
+    const previous = images.get(hash);
+    if (previous) totalBytes -= previous.size;
+    images.set(hash, { size: buffer.length, lastAccess: Date.now(), hits: previous ? previous.hits : 0, savedAt: Date.now() });
+    totalBytes += buffer.length;
+    evictIfNeeded();
+    return file;
+}
+
+function removeImage(hash, callback = () => {}) {
+    const entry = images.get(hash);
+    if (entry) {
+        images.delete(hash);
+        totalBytes -= entry.size;
+    }
+    fs.unlink(imagePath(hash), (err) => callback(err && err.code !== 'ENOENT' ? err : null));
+}
+
+// Eviction order for the configured policy: coldest first
+function evictionOrder(a, b) {
+    if (policy === 'lfu' && a[1].hits !== b[1].hits) return a[1].hits - b[1].hits;
+    return a[1].lastAccess - b[1].lastAccess;
+}
+
+function evictIfNeeded() {
+    if (totalBytes <= budgetBytes) return;
+    if (evicting) {
+        evictPending = true;
+        return;
+    }
+    evicting = true;
+    evictPending = false;
+
+    Gallery.getReferencedHashes((err, referenced) => {
+        if (err) {
+            console.error("Image store eviction failed to read gallery", err);
+            return finishEviction();
+        }
+
+        const target = budgetBytes * LOW_WATER_FRACTION;
+        const settled = Date.now() - EVICTION_GRACE_MS;
+        const unreferenced = [...images].filter(([hash]) => !referenced.has(hash));
+        const candidates = unreferenced.filter(([, entry]) => entry.savedAt < settled).sort(evictionOrder);
+        let evicted = 0;
+        for (const [hash] of candidates) {
+            if (totalBytes <= target) break;
+            removeImage(hash, (err) => {
+                if (err) console.error("Failed to evict image", hash, err);
+            });
+            evicted++;
+        }
+        if (totalBytes > budgetBytes) {
+            console.warn(`Image store over budget: ${(totalBytes / 1024 / 1024).toFixed(1)} MB of gallery and recently saved images`);
+            if (candidates.length < unreferenced.length && !retryTimer) {
+                // Try again once the images saved just now have settled
+                retryTimer = setTimeout(() => {
+                    retryTimer = null;
+                    evictIfNeeded();
+                }, EVICTION_GRACE_MS).unref();
+            }
+        }
+        if (evicted > 0) {
+            console.log(`Image store evicted ${evicted} images (${policy})`);
+        }
+        finishEviction();
+    });
+}
+
+// Ends an eviction pass, checking again if images were saved during it
+function finishEviction() {
+    evicting = false;
+    if (evictPending) evictIfNeeded();
+}
+
+function imageStoreStatus() {
+    return { images: images.size, bytes: totalBytes, budgetBytes, policy };
+}
+
+module.exports = { fractalsDir, imagePath, loadImageStore, hasImage, touchImage, saveImage, removeImage, imageStoreStatus };
@@ -0,0 +1,79 @@
+const crypto = require('crypto');
+const { EventEmitter } = require('events');
+
+// In-memory registry of asynchronous render jobs. Finished jobs are kept for
+// JOB_TTL_MS so clients can still fetch the result, then dropped. A
+// progressive job also keeps the PNG of every preview stage of its render
+// (see generateFractal) until then.
+const JOB_TTL_MS = 10 * 60 * 1000;
+const FINISHED_STATUSES = ['done', 'failed'];
+
+const jobs = new Map();
+
+function createJob(userId, options) {
+    const job = {
+        id: crypto.randomUUID(),
+        userId,
+        options,
+        status: 'queued',
+        progress: 0,
+        estimate: null,
+        stages: [],
+        result: null,
+        error: null,
+        createdAt: Date.now(),
+        startedAt: null,
+        finishedAt: null,
+        events: new EventEmitter()
+    };
+    jobs.set(job.id, job);
+    return job;
+}
+
+function getJob(id) {
+    return jobs.get(id) || null;
+}
+
+function isFinished(job) {
+    return FINISHED_STATUSES.includes(job.status);
+}
+
+// Applies changes to a job and notifies subscribers (SSE streams).
+function updateJob(job, changes) {
+    Object.assign(job, changes);
+    if (isFinished(job) && !job.finishedAt) {
+        job.finishedAt = Date.now();
+        setTimeout(() => jobs.delete(job.id), JOB_TTL_MS).unref();
+    }
+    job.events.emit('update', job);
+}
+
+// The preview stage of a job rendered at 1/`step` scale, or null
+function getStage(job, step) {
+    return job.stages.find(stage => stage.step === step) || null;
+}
+
+// Subscribes to updates until the job finishes. Returns an unsubscribe function.
+function subscribe(job, listener) {
+    job.events.on('update', listener);
+    return () => job.events.removeListener('update', listener);
+}
+
+// Public representation of a job, as returned by the API. `baseUrl` (the
+// API root) makes the stage image URLs absolute.
+function jobView(job, baseUrl = '') {
+    return {
+        id: job.id,
+        status: job.status,
+        progress: job.progress,
+        estimate: job.estimate,
+        stages: job.stages.map(({ step, width, height }) => ({ step, width, height, url: `${baseUrl}/api/jobs/${job.id}/stages/${step}` })),
+        result: job.result,
+        error: job.error,
+        createdAt: job.createdAt,
+        startedAt: job.startedAt,
+        finishedAt: job.finishedAt
+    };
+}
+
+module.exports = { createJob, getJob, getStage, updateJob, subscribe, isFinished, jobView };
@@ -0,0 +1,177 @@
+const { monitorEventLoopDelay } = require('perf_hooks');
+
+// In-process metrics served by GET /metrics in the Prometheus text format.
+// Counters and histograms are updated where the work happens; gauges are
+// read from their source (render pool, caches) when /metrics is scraped.
+
+const registry = [];
+
+// Label set -> series key, with label names in a fixed order
+function seriesKey(labelNames, labels) {
+    return labelNames.map(name => String(labels[name] ?? '')).join('\u0000');
+}
+
+function formatLabels(labelNames, values, extra = '') {
+    const pairs = labelNames.map((name, i) => `${name}="${values[i].replace(/\\/g, '\\\\').replace(/"/g, '\\"').replace(/\n/g, '\\n')}"`);
+    if (extra) pairs.push(extra);
+    return pairs.length ? `{${pairs.join(',')}}` : '';
+}
+
+class Counter {
+    constructor(name, help, labelNames = []) {
+        Object.assign(this, { name, help, labelNames, type: 'counter', series: new Map() });
+        registry.push(this);
+    }
+
+    inc(labels = {}, amount = 1) {
+        const key = seriesKey(this.labelNames, labels);
+        this.series.set(key, (this.series.get(key) || 0) + amount);
+    }
+
+    lines() {
+        return [...this.series].map(([key, value]) =>
+            `${this.name}${formatLabels(this.labelNames, key.split('\u0000'))} ${value}`);
+    }
+}
+
+class Gauge {
+    // `collect` returns the value, or an array of [labels, value] pairs
+    constructor(name, help, collect, labelNames = []) {
+        Object.assign(this, { name, help, collect, labelNames, type: 'gauge' });
+        registry.push(this);
+    }
+
+    lines() {
+        const value = this.collect();
+        const series = Array.isArray(value) ? value : [[{}, value]];
+        return series.map(([labels, v]) =>
+            `${this.name}${formatLabels(this.labelNames, this.labelNames.map(name => String(labels[name])))} ${v}`);
+    }
+}
+
+class Histogram {
+    constructor(name, help, labelNames, buckets) {
+        Object.assign(this, { name, help, labelNames, buckets, type: 'histogram', series: new Map() });
+        registry.push(this);
+    }
+
+    observe(labels, value) {
+        const key = seriesKey(this.labelNames, labels);
+        let series = this.series.get(key);
+        if (!series) {
+            series = { counts: new Array(this.buckets.length).fill(0), sum: 0, count: 0 };
+            this.series.set(key, series);
+        }
+        const i = this.buckets.findIndex(bound => value <= bound);
+        if (i !== -1) series.counts[i]++;
+        series.sum += value;
+        series.count++;
+    }
+
+    // Starts a timer; the returned function observes the elapsed seconds
+    startTimer(labels) {
+        const start = process.hrtime.bigint();
+        return () => this.observe(labels, Number(process.hrtime.bigint() - start) / 1e9);
+    }
+
+    lines() {
+        const lines = [];
+        for (const [key, { counts, sum, count }] of this.series) {
+            const values = key.split('\u0000');
+            let cumulative = 0;
+            this.buckets.forEach((bound, i) => {
+                cumulative += counts[i];
+                lines.push(`${this.name}_bucket${formatLabels(this.labelNames, values, `le="${bound}"`)} ${cumulative}`);
+            });
+            lines.push(`${this.name}_bucket${formatLabels(this.labelNames, values, 'le="+Inf"')} ${count}`);
+            lines.push(`${this.name}_sum${formatLabels(this.labelNames, values)} ${sum}`);
+            lines.push(`${this.name}_count${formatLabels(this.labelNames, values)} ${count}`);
+        }
+        return lines;
+    }
+}
+
+// Upper bound label for `value` in `bounds`, or "+Inf"
+function bucketLabel(value, bounds, suffix = '') {
+    const bound = bounds.find(b => value <= b);
+    return bound === undefined ? '+Inf' : `${bound}${suffix}`;
+}
+
+// Renders are grouped by image size (megapixels, up to the bound) and
+// maxIterations (up to the bound), so a histogram's series compare like work
+const RESOLUTION_BUCKETS_MP = [0.5, 1, 2.1, 4, 8.3, 16];
+const ITERATION_BUCKETS = [250, 500, 1000, 2500, 5000, 10000];
+
+function renderLabels(options, mode) {
+    return {
+        mode,
+        resolution: bucketLabel(options.width * options.height / 1e6, RESOLUTION_BUCKETS_MP, 'MP'),
+        iterations: bucketLabel(options.maxIterations, ITERATION_BUCKETS)
+    };
+}
+
+const renderDuration = new Histogram('fractal_render_duration_seconds',
+    'Time a render worker spent on a fractal, including PNG encoding. mode is render or recolor (from a cached field).',
+    ['mode', 'resolution', 'iterations'], [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]);
+const renderQueueWait = new Histogram('fractal_render_queue_wait_seconds',
+    'Time a render waited in the queue for a free worker.', [], [0.001, 0.01, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60]);
+const iterationsTotal = new Counter('fractal_iterations_total', 'z -> z^p + c steps computed by full renders.');
+const iterationSeconds = new Counter('fractal_iteration_seconds_total', 'Worker time spent on full renders, for fractal_iterations_per_second.');
+new Gauge('fractal_iterations_per_second', 'Iterations per second of render worker time, averaged since startup.',
+    () => {
+        const seconds = iterationSeconds.series.get('') || 0;
+        return seconds ? (iterationsTotal.series.get('') || 0) / seconds : 0;
+    });
+const cacheLookups = new Counter('fractal_cache_lookups_total',
+    'Generate requests by outcome: hit (stored image), evicted (row found, image rendered again), miss (rendered), inflight (joined a running render).',
+    ['result']);
+const tileLookups = new Counter('fractal_tile_lookups_total',
+    'Tile requests by outcome: hit (in the tile store), miss (rendered), inflight (joined a running render).', ['result']);
+const renderFailures = new Counter('fractal_render_failures_total',
+    'Renders that failed, by the HTTP status reported (429 queue full, 499 time limit, 500 error).', ['status']);
+const renderEstimateRatio = new Histogram('fractal_render_estimate_ratio',
+    'Actual over predicted render time, by cost model kind. 1 is a perfect prediction.',
+    ['kind'], [0.25, 0.5, 0.67, 0.8, 1, 1.25, 1.5, 2, 4]);
+const admissionRejections = new Counter('fractal_admission_rejections_total',
+    'Renders turned away before queueing: too_slow (predicted over RENDER_MAX_SECONDS) or backlog (predicted wait over RENDER_MAX_WAIT_SECONDS).',
+    ['reason']);
+const httpResponses = new Counter('http_responses_total', 'HTTP responses sent, by status code.', ['status']);
+const dbQueryDuration = new Histogram('db_query_duration_seconds', 'SQLite query time through the prepared statement cache, by method.',
+    ['method'], [0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1]);
+
+// Event-loop delay as sampled by perf_hooks, reset after every scrape so
+// each scrape reports the interval since the previous one. The sampling
+// timer's own interval is subtracted, leaving how late it fired.
+const EVENT_LOOP_RESOLUTION_MS = 10;
+const eventLoopDelay = monitorEventLoopDelay({ resolution: EVENT_LOOP_RESOLUTION_MS });
+eventLoopDelay.enable();
+
+function eventLoopLag(nanoseconds) {
+    return eventLoopDelay.count ? Math.max(0, nanoseconds / 1e9 - EVENT_LOOP_RESOLUTION_MS / 1000) : 0;
+}
+
+new Gauge('nodejs_eventloop_lag_seconds', 'Event-loop lag since the previous scrape, by quantile.',
+    () => [0.5, 0.9, 0.99].map(q => [{ quantile: q }, eventLoopLag(eventLoopDelay.percentile(q * 100))]), ['quantile']);
+new Gauge('nodejs_eventloop_lag_max_seconds', 'Longest event-loop lag since the previous scrape.',
+    () => eventLoopLag(eventLoopDelay.max));
+
+// Express middleware counting responses by status code
+function countResponses(req, res, next) {
+    res.on('finish', () => httpResponses.inc({ status: res.statusCode }));
+    next();
+}
+
+// The exposition text for every registered metric
+function metricsText() {
+    const lines = [];
+    for (const metric of registry) {
+        lines.push(`# HELP ${metric.name} ${metric.help}`, `# TYPE ${metric.name} ${metric.type}`, ...metric.lines());
+    }
+    eventLoopDelay.reset();
+    return lines.join('\n') + '\n';
+}
+
+module.exports = {
+    Counter, Gauge, Histogram, renderLabels, renderDuration, renderQueueWait, iterationsTotal, iterationSeconds,
+    cacheLookups, tileLookups, renderFailures, renderEstimateRatio, admissionRejections, dbQueryDuration, countResponses, metricsText
+};
@@ -1,28 +1,32 @@
-const db = require('../database.js');
+const statements = require('../statements.js');
 
 exports.findFractalByHash = (hash, callback) => {
     const sql = "SELECT * FROM fractals WHERE hash = ?";
-    db.get(sql, [hash], callback);
+    statements.get(sql, [hash], callback);
 };
 
 exports.createFractal = (data, callback) => {
     const now = Date.now(); // Get current timestamp
-    const sql = `INSERT INTO fractals (hash, width, height, iterations, power, c_real, c_imag, scale, offsetX, offsetY, colorScheme, image_path, created_at)
-                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)`;
-    const params = [data.hash, data.width, data.height, data.maxIterations, data.power, data.c.real, data.c.imag, data.scale, data.offsetX, data.offsetY, data.colorScheme, data.imagePath, now];
-    db.run(sql, params, function(err) {
+    // A decimal-string offset is stored whole in its _decimal column, and as
+    // the nearest double for filtering and sorting
+    const decimal = (offset) => typeof offset === 'string' ? offset : null;
+    const sql = `INSERT INTO fractals (hash, width, height, iterations, power, c_real, c_imag, scale, offsetX, offsetY, colorScheme, image_path, created_at, offsetX_decimal, offsetY_decimal)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)`;
+    const params = [data.hash, data.width, data.height, data.maxIterations, data.power, data.c.real, data.c.imag, data.scale, Number(data.offsetX), Number(data.offsetY), data.colorScheme, data.imagePath, now,
+        decimal(data.offsetX), decimal(data.offsetY)];
+    statements.run(sql, params, function(err) {
         callback(err, { id: this.lastID });
     });
 };
 
 exports.getFractalImagePath = (id, callback) => {
     const sql = "SELECT image_path FROM fractals WHERE id = ?";
-    db.get(sql, [id], callback);
+    statements.get(sql, [id], callback);
 };
 
 exports.deleteFractal = (id, callback) => {
     const sql = "DELETE FROM fractals WHERE id = ?";
-    db.run(sql, [id], callback);
+    statements.run(sql, [id], callback);
 };
 
 exports.getAllFractals = ({ limit, offset, filters, sortBy, sortOrder }, callback) => {
@@ -59,7 +63,7 @@ exports.getAllFractals = ({ limit, offset, filters, sortBy, sortOrder }, callbac
 
     const countSql = `SELECT COUNT(*) as totalCount FROM fractals` + (filterClauses.length > 0 ? " WHERE " + filterClauses.join(" AND ") : "");
 
-    db.get(countSql, params, (err, row) => {
+    statements.get(countSql, params, (err, row) => {
         if (err) {
             return callback(err);
         }
@@ -68,7 +72,7 @@ exports.getAllFractals = ({ limit, offset, filters, sortBy, sortOrder }, callbac
         sql += " LIMIT ? OFFSET ?";
         params.push(limit, offset);
 
-        db.all(sql, params, (err, rows) => {
+        statements.all(sql, params, (err, rows) => {
             callback(err, rows, totalCount);
         });
     });
@@ -76,11 +80,11 @@ exports.getAllFractals = ({ limit, offset, filters, sortBy, sortOrder }, callbac
 
 exports.getFractalById = (id, callback) => {
     const sql = "SELECT * FROM fractals WHERE id = ?";
-    db.get(sql, [id], callback);
+    statements.get(sql, [id], callback);
 };
 
 exports.searchFractals = (query, callback) => {
     const sql = "SELECT * FROM fractals WHERE hash LIKE ? OR colorScheme LIKE ?";
     const searchTerm = `%${query}%`;
-    db.all(sql, [searchTerm, searchTerm], callback);
+    statements.all(sql, [searchTerm, searchTerm], callback);
 };
\ No newline at end of file
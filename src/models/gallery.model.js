@@ -1,12 +1,18 @@
-const db = require('../database.js');
+const statements = require('../statements.js');
 const User = require('../users.js');
+const { pageClauses, finishPage, pageCount } = require('../pagination.js');
+
+// Sort columns as written in the gallery/fractals join
+function gallerySortColumn(column) {
+    return ['id', 'user_id', 'added_at'].includes(column) ? `g.${column}` : `f.${column}`;
+}
 
 exports.addToGallery = (userId, fractalId, fractalHash, callback) => {
     const sql = "INSERT OR IGNORE INTO gallery (user_id, fractal_id, fractal_hash) VALUES (?, ?, ?)";
-    db.run(sql, [userId, fractalId, fractalHash], callback);
+    statements.run(sql, [userId, fractalId, fractalHash], callback);
 };
 
-exports.getGalleryForUser = (userId, filters, sortBy, sortOrder, limit, offset, callback) => {
+exports.getGalleryForUser = (userId, filters, sortBy, sortOrder, page, callback) => {
     let whereClauses = [`g.user_id = ?`];
     let params = [userId];
 
@@ -61,28 +67,38 @@ exports.getGalleryForUser = (userId, filters, sortBy, sortOrder, limit, offset,
     const sortColumn = validSortColumns.includes(sortBy) ? sortBy : 'added_at';
     const order = (sortOrder && sortOrder.toUpperCase() === 'ASC') ? 'ASC' : 'DESC';
 
+    let clauses;
+    try {
+        clauses = pageClauses(page, { column: gallerySortColumn(sortColumn), idColumn: 'g.id', sortKey: sortColumn, order });
+    } catch (err) {
+        return callback(err);
+    }
+    const pageWhereSql = clauses.where ? `${whereSql} AND ${clauses.where}` : whereSql;
+
     const countSql = `SELECT COUNT(*) as totalCount FROM gallery g JOIN fractals f ON g.fractal_id = f.id ${whereSql}`;
-    db.get(countSql, params, (err, countRow) => {
+    const countKey = `gallery:${userId}:${JSON.stringify(params)}:${whereSql}`;
+    const countGallery = (cb) => statements.get(countSql, params, (err, countRow) => cb(err, countRow && countRow.totalCount));
+    pageCount(page, countKey, countGallery, (err, totalCount) => {
         if (err) {
             console.error('getGalleryForUser: Error in countSql:', err);
             return callback(err);
         }
-        const totalCount = countRow.totalCount;
 
         const dataSql = `
-            SELECT g.id, g.fractal_id, f.hash, f.width, f.height, f.iterations, f.power, f.c_real, f.c_imag, f.scale, f.offsetX, f.offsetY, f.colorScheme, g.added_at, g.fractal_hash
+            SELECT g.id, g.fractal_id, f.hash, f.width, f.height, f.iterations, f.power, f.c_real, f.c_imag, f.scale, f.offsetX, f.offsetY, f.offsetX_decimal, f.offsetY_decimal, f.colorScheme, g.added_at, g.fractal_hash
             FROM gallery g
             JOIN fractals f ON g.fractal_id = f.id
-            ${whereSql}
-            ORDER BY ${sortColumn} ${order}
-            LIMIT ? OFFSET ?
+            ${pageWhereSql}
+            ORDER BY ${clauses.orderBy}
+            ${clauses.limitSql}
         `; // Changed to iterations
-        db.all(dataSql, [...params, limit, offset], (err, rows) => {
+        statements.all(dataSql, [...params, ...clauses.params, ...clauses.limitParams], (err, rows) => {
             if (err) {
                 console.error('getGalleryForUser: Error in dataSql:', err);
                 return callback(err);
             }
-            callback(null, rows, totalCount);
+            const result = finishPage(rows, page, { sortKey: sortColumn, order });
+            callback(null, result.rows, totalCount, result.nextCursor);
         });
     });
 };
@@ -97,7 +113,7 @@ exports.getGalleryEntry = (id, userId, isAdmin, callback) => {
         sql = "SELECT fractal_id, fractal_hash FROM gallery WHERE id = ? AND user_id = ?";
         params = [id, userId];
     }
-    db.get(sql, params, callback);
+    statements.get(sql, params, callback);
 };
 
 exports.deleteGalleryEntry = (id, userId, isAdmin, callback) => {
@@ -110,15 +126,23 @@ exports.deleteGalleryEntry = (id, userId, isAdmin, callback) => {
         sql = "DELETE FROM gallery WHERE id = ? AND user_id = ?";
         params = [id, userId];
     }
-    db.run(sql, params, callback);
+    statements.run(sql, params, callback);
 };
 
 exports.countGalleryByFractalHash = (fractalHash, callback) => {
     const sql = "SELECT COUNT(*) as count FROM gallery WHERE fractal_hash = ?";
-    db.get(sql, [fractalHash], callback);
+    statements.get(sql, [fractalHash], callback);
 };
 
-exports.getAllGallery = (filters, sortBy, sortOrder, limit, offset, callback) => {
+exports.getReferencedHashes = (callback) => {
+    const sql = "SELECT DISTINCT fractal_hash FROM gallery";
+    statements.all(sql, [], (err, rows) => {
+        if (err) return callback(err);
+        callback(null, new Set(rows.map(row => row.fractal_hash)));
+    });
+};
+
+exports.getAllGallery = (filters, sortBy, sortOrder, page, callback) => {
     let whereClauses = [];
     let params = [];
 
@@ -173,39 +197,43 @@ exports.getAllGallery = (filters, sortBy, sortOrder, limit, offset, callback) =>
     const sortColumn = validSortColumns.includes(sortBy) ? sortBy : 'added_at';
     const order = (sortOrder && sortOrder.toUpperCase() === 'ASC') ? 'ASC' : 'DESC';
 
+    let clauses;
+    try {
+        clauses = pageClauses(page, { column: gallerySortColumn(sortColumn), idColumn: 'g.id', sortKey: sortColumn, order });
+    } catch (err) {
+        return callback(err);
+    }
+    const pageWhereSql = clauses.where ? (whereSql ? `${whereSql} AND ${clauses.where}` : `WHERE ${clauses.where}`) : whereSql;
+
     const countSql = `SELECT COUNT(*) as totalCount FROM gallery g JOIN fractals f ON g.fractal_id = f.id ${whereSql}`;
-    db.get(countSql, params, (err, countRow) => {
+    const countKey = `gallery:all:${JSON.stringify(params)}:${whereSql}`;
+    const countGallery = (cb) => statements.get(countSql, params, (err, countRow) => cb(err, countRow && countRow.totalCount));
+    pageCount(page, countKey, countGallery, (err, totalCount) => {
         if (err) return callback(err);
-        const totalCount = countRow.totalCount;
 
         const dataSql = `
-            SELECT g.id, g.user_id, f.hash, f.width, f.height, f.iterations, f.power, f.c_real, f.c_imag, f.scale, f.offsetX, f.offsetY, f.colorScheme, g.added_at, g.fractal_hash
+            SELECT g.id, g.user_id, f.hash, f.width, f.height, f.iterations, f.power, f.c_real, f.c_imag, f.scale, f.offsetX, f.offsetY, f.offsetX_decimal, f.offsetY_decimal, f.colorScheme, g.added_at, g.fractal_hash
             FROM gallery g
             JOIN fractals f ON g.fractal_id = f.id
-            ${whereSql}
-            ORDER BY ${sortColumn} ${order}
+            ${pageWhereSql}
+            ORDER BY ${clauses.orderBy}
+            ${clauses.limitSql}
         `; // Changed to iterations
-        let query = dataSql;
-        let queryParams = [...params];
-
-        if (limit > 0) {
-            query += ' LIMIT ? OFFSET ?';
-            queryParams.push(limit, offset);
-        }
 
-        db.all(query, queryParams, (err, rows) => {
+        statements.all(dataSql, [...params, ...clauses.params, ...clauses.limitParams], (err, rows) => {
             if (err) return callback(err);
-            callback(null, rows, totalCount); // Directly return rows, no user mapping here
+            const result = finishPage(rows, page, { sortKey: sortColumn, order });
+            callback(null, result.rows, totalCount, result.nextCursor); // Directly return rows, no user mapping here
         });
     });
 };
 
 exports.deleteGalleryForUser = (userId, callback) => {
     const sql = "DELETE FROM gallery WHERE user_id = ?";
-    db.run(sql, [userId], callback);
+    statements.run(sql, [userId], callback);
 };
 
 exports.countByUserId = (userId, callback) => {
     const sql = "SELECT COUNT(*) as count FROM gallery WHERE user_id = ?";
-    db.get(sql, [userId], callback);
+    statements.get(sql, [userId], callback);
 };
\ No newline at end of file
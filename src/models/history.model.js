@@ -1,43 +1,58 @@
-const db = require('../database.js');
+const statements = require('../statements.js');
 const User = require('../users.js'); // Keep this import, though not directly used in getAllHistory anymore
+const { pageClauses, finishPage, pageCount } = require('../pagination.js');
 
 exports.getHistoryForUser = (userId, callback) => {
     const sql = `
-        SELECT h.id, f.hash, f.width, f.height, f.iterations, f.power, f.c_real, f.c_imag, f.scale, f.offsetX, f.offsetY, f.colorScheme, h.generated_at
+        SELECT h.id, f.hash, f.width, f.height, f.iterations, f.power, f.c_real, f.c_imag, f.scale, f.offsetX, f.offsetY, f.offsetX_decimal, f.offsetY_decimal, f.colorScheme, h.generated_at
         FROM history h
         JOIN fractals f ON h.fractal_id = f.id
         WHERE h.user_id = ?
         ORDER BY h.generated_at DESC
     `;
-    db.all(sql, [userId], callback);
+    statements.all(sql, [userId], callback);
 };
 
 exports.createHistoryEntry = (userId, fractalId, callback) => {
     const sql = "INSERT INTO history (user_id, fractal_id) VALUES (?, ?)";
-    db.run(sql, [userId, fractalId], callback);
+    statements.run(sql, [userId, fractalId], callback);
 };
 
 exports.getHistoryEntry = (id, userId, callback) => {
     const sql = "SELECT fractal_id FROM history WHERE id = ? AND user_id = ?";
-    db.get(sql, [id, userId], callback);
+    statements.get(sql, [id, userId], callback);
 };
 
 exports.deleteHistoryEntry = (id, callback) => {
     const sql = "DELETE FROM history WHERE id = ?";
-    db.run(sql, [id], callback);
+    statements.run(sql, [id], callback);
 };
 
 exports.getHistoryEntryByUserAndFractal = (userId, fractalId, callback) => {
     const sql = "SELECT generated_at FROM history WHERE user_id = ? AND fractal_id = ?";
-    db.get(sql, [userId, fractalId], callback);
+    statements.get(sql, [userId, fractalId], callback);
 };
 
 exports.countHistoryByFractalId = (fractalId, callback) => {
     const sql = "SELECT COUNT(*) as count FROM history WHERE fractal_id = ?";
-    db.get(sql, [fractalId], callback);
+    statements.get(sql, [fractalId], callback);
 };
 
-exports.getAllHistory = (filters, sortBy, sortOrder, limit, offset, callback) => {
+// The fractals columns are NULL in history rows of deleted fractals, and a
+// keyset comparison against NULL is never true, so those rows would drop out
+// of cursor pages. They are sorted by a value below any real one instead.
+const DELETED_TEXT = "''";
+const DELETED_NUMBER = '-1e308';
+
+// Sort expressions getAllHistory accepts, as written in its history/fractals join
+const HISTORY_SORT_COLUMNS = {
+    id: 'h.id', user_id: 'h.user_id', fractal_id: 'h.fractal_id', generated_at: 'h.generated_at',
+    hash: `COALESCE(f.hash, ${DELETED_TEXT})`, colorScheme: `COALESCE(f.colorScheme, ${DELETED_TEXT})`,
+    ...Object.fromEntries(['width', 'height', 'iterations', 'power', 'c_real', 'c_imag', 'scale', 'offsetX', 'offsetY']
+        .map(column => [column, `COALESCE(f.${column}, ${DELETED_NUMBER})`]))
+};
+
+exports.getAllHistory = (filters, sortBy, sortOrder, page, callback) => {
     let whereClauses = [];
     let params = [];
 
@@ -48,34 +63,41 @@ exports.getAllHistory = (filters, sortBy, sortOrder, limit, offset, callback) =>
 
     const whereSql = whereClauses.length > 0 ? `WHERE ` + whereClauses.join(` AND `) : ``;
 
+    const sortColumn = HISTORY_SORT_COLUMNS[sortBy] ? sortBy : 'generated_at';
+    const order = (sortOrder && sortOrder.toUpperCase() === 'ASC') ? 'ASC' : 'DESC';
+
+    let clauses;
+    try {
+        clauses = pageClauses(page, { column: HISTORY_SORT_COLUMNS[sortColumn], idColumn: 'h.id', sortKey: sortColumn, order });
+    } catch (err) {
+        return callback(err);
+    }
+    const pageWhereSql = clauses.where ? (whereSql ? `${whereSql} AND ${clauses.where}` : `WHERE ${clauses.where}`) : whereSql;
+
     const countSql = `SELECT COUNT(*) as totalCount FROM history h ${joinSql} ${whereSql}`;
-    db.get(countSql, params, (err, row) => {
+    const countHistory = (cb) => statements.get(countSql, params, (err, row) => cb(err, row && row.totalCount));
+    pageCount(page, `history:all:${whereSql}`, countHistory, (err, totalCount) => {
         if (err) return callback(err);
-        const totalCount = row.totalCount;
 
         const dataSql = `
-            SELECT h.id, h.user_id, h.fractal_id, f.hash, f.width, f.height, f.iterations, f.power, f.c_real, f.c_imag, f.scale, f.offsetX, f.offsetY, f.colorScheme, h.generated_at
+            SELECT h.id, h.user_id, h.fractal_id, f.hash, f.width, f.height, f.iterations, f.power, f.c_real, f.c_imag, f.scale, f.offsetX, f.offsetY, f.offsetX_decimal, f.offsetY_decimal, f.colorScheme, h.generated_at,
+                ${HISTORY_SORT_COLUMNS[sortColumn]} AS sort_value
             FROM history h
             ${joinSql}
-            ${whereSql}
-            ORDER BY ${sortBy} ${sortOrder}
+            ${pageWhereSql}
+            ORDER BY ${clauses.orderBy}
+            ${clauses.limitSql}
         `;
-        let query = dataSql;
-        let queryParams = [...params];
-
-        if (limit > 0) {
-            query += ' LIMIT ? OFFSET ?';
-            queryParams.push(limit, offset);
-        }
 
-        db.all(query, queryParams, (err, rows) => {
+        statements.all(dataSql, [...params, ...clauses.params, ...clauses.limitParams], (err, rows) => {
             if (err) return callback(err);
-            callback(null, rows, totalCount);
+            const result = finishPage(rows, page, { sortKey: sortColumn, valueKey: 'sort_value', order });
+            callback(null, result.rows.map(({ sort_value, ...row }) => row), totalCount, result.nextCursor);
         });
     });
 };
 
 exports.countByUserId = (userId, callback) => {
     const sql = "SELECT COUNT(*) as count FROM history WHERE user_id = ?";
-    db.get(sql, [userId], callback);
+    statements.get(sql, [userId], callback);
 };
\ No newline at end of file
@@ -0,0 +1,126 @@
+// Keyset (cursor) pagination for the listing queries.
+//
+// A cursor holds the sort column, direction, and the sort value and id of
+// the last row on the previous page. The next page starts strictly after
+// that (value, id) pair, so page N costs the same as page 1, unlike OFFSET,
+// which reads and discards every earlier row.
+//
+// A listing pages by cursor when the request carries `cursor` (empty for
+// the first page). Its total count is then only computed when `count=1` is
+// given, and is cached for COUNT_CACHE_TTL_MS. Offset requests work as
+// before and also get a nextCursor.
+
+const COUNT_CACHE_TTL_MS = 30 * 1000;
+const COUNT_CACHE_SIZE = 1000;
+
+const counts = new Map(); // key -> { count, expiresAt }
+
+function encodeCursor(cursor) {
+    return Buffer.from(JSON.stringify(cursor)).toString('base64url');
+}
+
+function decodeCursor(value) {
+    try {
+        const cursor = JSON.parse(Buffer.from(value, 'base64url').toString());
+        if (cursor && typeof cursor.s === 'string' && (cursor.o === 'ASC' || cursor.o === 'DESC') && 'v' in cursor && Number.isInteger(cursor.id)) {
+            return cursor;
+        }
+    } catch (err) {
+        // Fall through: not a cursor we issued
+    }
+    return null;
+}
+
+// Reads limit/offset/cursor/count from a request's query string.
+// Returns { limit, offset, cursor, keyset, withCount }, or null if the
+// cursor is malformed. `limit` is null for "no limit".
+function parsePage(query, { defaultLimit, allowUnlimited = false }) {
+    let limit = parseInt(query.limit);
+    if (allowUnlimited && limit === 0) {
+        limit = null;
+    } else if (isNaN(limit) || limit <= 0) {
+        limit = defaultLimit;
+    }
+
+    const keyset = query.cursor !== undefined;
+    let cursor = null;
+    if (keyset && query.cursor !== '') {
+        cursor = decodeCursor(query.cursor);
+        if (!cursor) return null;
+    }
+
+    return {
+        limit,
+        offset: keyset ? 0 : (parseInt(query.offset) || 0),
+        cursor,
+        keyset,
+        withCount: keyset ? ['1', 'true'].includes(query.count) : true
+    };
+}
+
+// SQL pieces for one page sorted on `column` (as written in the query) with
+// `idColumn` as tie-breaker. `sortKey` names the sort value in result rows.
+// Returns { where, params, orderBy, limitSql, limitParams } where `where`
+// is null on the first page; throws if the cursor was made for another sort.
+function pageClauses(page, { column, idColumn, sortKey, order }) {
+    const byId = column === idColumn;
+    const clauses = { where: null, params: [], orderBy: byId ? `${idColumn} ${order}` : `${column} ${order}, ${idColumn} ${order}`, limitSql: '', limitParams: [] };
+
+    if (page.cursor) {
+        if (page.cursor.s !== sortKey || page.cursor.o !== order) {
+            const err = new Error('Cursor does not match the requested sort order.');
+            err.status = 400;
+            throw err;
+        }
+        const comparison = order === 'ASC' ? '>' : '<';
+        clauses.where = byId ? `${idColumn} ${comparison} ?` : `(${column}, ${idColumn}) ${comparison} (?, ?)`;
+        clauses.params = byId ? [page.cursor.id] : [page.cursor.v, page.cursor.id];
+    }
+
+    if (page.limit) {
+        // One extra row tells whether there is a next page
+        clauses.limitSql = page.offset ? 'LIMIT ? OFFSET ?' : 'LIMIT ?';
+        clauses.limitParams = page.offset ? [page.limit + 1, page.offset] : [page.limit + 1];
+    }
+    return clauses;
+}
+
+// Trims the extra row fetched by pageClauses and returns
+// { rows, nextCursor } (nextCursor null on the last page). The sort value is
+// read from `valueKey` in the rows, by default the sortKey column.
+function finishPage(rows, page, { sortKey, valueKey = sortKey, idKey = 'id', order }) {
+    if (!page.limit || rows.length <= page.limit) {
+        return { rows, nextCursor: null };
+    }
+    rows = rows.slice(0, page.limit);
+    const last = rows[rows.length - 1];
+    return { rows, nextCursor: encodeCursor({ s: sortKey, o: order, v: last[valueKey], id: last[idKey] }) };
+}
+
+// Calls back with the count for `key`, running `countFn(cb)` at most once
+// per COUNT_CACHE_TTL_MS. Counts may therefore lag by that long.
+function cachedCount(key, countFn, callback) {
+    const cached = counts.get(key);
+    if (cached && cached.expiresAt > Date.now()) {
+        return callback(null, cached.count);
+    }
+    countFn((err, count) => {
+        if (err) return callback(err);
+        counts.delete(key);
+        counts.set(key, { count, expiresAt: Date.now() + COUNT_CACHE_TTL_MS });
+        if (counts.size > COUNT_CACHE_SIZE) {
+            counts.delete(counts.keys().next().value);
+        }
+        callback(null, count);
+    });
+}
+
+// Total count for a page request: exact for offset paging, cached for
+// cursor paging, and null when a cursor request didn't ask for it
+function pageCount(page, key, countFn, callback) {
+    if (!page.withCount) return callback(null, null);
+    if (page.keyset) return cachedCount(key, countFn, callback);
+    countFn(callback);
+}
+
+module.exports = { parsePage, pageClauses, finishPage, pageCount };
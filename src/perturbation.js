@@ -0,0 +1,277 @@
+// Deep-zoom rendering by perturbation. Below a pixel spacing of about 1e-13
+// plain doubles can no longer tell neighbouring pixels apart, so instead one
+// reference orbit is iterated in fixed-point BigInt arithmetic at the centre
+// of the view and every pixel is iterated as a double-precision offset
+// (delta) from it:
+//
+//     z = Z_n + d,   d' = (Z_n + d)^p - Z_n^p = d * sum_{k<p} z^k Z_n^(p-1-k)
+//
+// which for p = 2 is d' = d * (2 Z_n + d). The delta only needs precision
+// relative to its own size, so doubles suffice however deep the zoom.
+//
+// A delta goes wrong ("glitches") when the pixel's orbit passes much closer
+// to the critical point 0 than the reference does, i.e. |z| < |d|, and it
+// can't continue once the reference has escaped. In both cases the pixel is
+// rebased onto a second reference, the orbit of the critical point itself
+// (W_0 = 0), with d = z, and carries on from W_0.
+//
+// Only integer powers have this expansion, and it costs p - 1 complex
+// multiplies per step, so it is used for the powers escapeTime multiplies
+// out (see multipliesPower); other powers and shallow views use the plain
+// kernel. Deltas are doubles, so views are limited to a scale
+// of about 1e-300, or 1e-150 when centred exactly on 0 (where d' = d^2).
+//
+// The centre itself need not be a double: an offset given as a decimal
+// string with more digits than a double holds is kept as that string (see
+// exactOffset) and read into the reference orbit's fixed point exactly.
+const { map, getColorTable, colorIndex, multipliesPower } = require('./fractalKernel');
+
+// Perturbation is used once the pixel step falls below this (about 2000
+// ulps of a coordinate of magnitude 1)
+const DEEP_ZOOM_PIXEL_STEP = 2 ** -42;
+// Fixed-point bits kept beyond those needed to resolve one pixel
+const GUARD_BITS = 64;
+// Significant digits kept of a decimal offset: enough to place the centre
+// to well within a pixel at the deepest scale deltas allow
+const MAX_OFFSET_DIGITS = 330;
+
+// Whether `options` should be rendered by perturbation
+function usesPerturbation({ width = 800, height = 600, scale = 1.5, power = 2 }) {
+    return multipliesPower(power) && 2 * scale / Math.max(width, height) < DEEP_ZOOM_PIXEL_STEP;
+}
+
+// Exact fixed-point value of a double, scaled by 2^bits
+function toFixed(value, bits) {
+    if (value === 0) return 0n;
+    const view = new DataView(new ArrayBuffer(8));
+    view.setFloat64(0, value);
+    const high = view.getUint32(0);
+    const exponent = (high >>> 20) & 0x7ff;
+    let mantissa = (BigInt(high & 0xfffff) << 32n) | BigInt(view.getUint32(4));
+    if (exponent) mantissa |= 1n << 52n;
+    const shift = (exponent || 1) - 1075 + bits;
+    const fixed = shift >= 0 ? mantissa << BigInt(shift) : mantissa >> BigInt(-shift);
+    return value < 0 ? -fixed : fixed;
+}
+
+// Sign, significant digits (no leading or trailing zeros) and decimal point
+// position of a decimal literal, i.e. value = sign 0.<digits> * 10^point
+function splitDecimal(text) {
+    const [, sign, whole, fraction = '', exponent = '0'] = /^([+-]?)(\d*)(?:\.(\d*))?(?:e([+-]?\d+))?$/.exec(text);
+    const digits = (whole + fraction).replace(/0+$/, '');
+    const significant = digits.replace(/^0+/, '');
+    return {
+        negative: sign === '-',
+        digits: significant,
+        point: whole.length + Number(exponent) - (digits.length - significant.length)
+    };
+}
+
+// The canonical form of `value` if it is a plain decimal string (no
+// exponent) with digits beyond those of the nearest double as String()
+// prints it, else null. Such offsets are kept as strings, written like
+// '-0.5' or '12.25' with no redundant zeros and cut to MAX_OFFSET_DIGITS
+// significant digits. Every other offset is parsed into a double, so
+// options that fit in doubles keep the hash they always had.
+function exactOffset(value) {
+    if (typeof value !== 'string' || !/^[+-]?(\d+\.?\d*|\.\d+)$/.test(value)) return null;
+    const { negative, digits: allDigits, point } = splitDecimal(value);
+    const digits = allDigits.slice(0, MAX_OFFSET_DIGITS);
+    let text;
+    if (point <= 0) {
+        text = '0.' + '0'.repeat(-point) + digits;
+    } else if (point >= digits.length) {
+        text = digits + '0'.repeat(point - digits.length);
+    } else {
+        text = digits.slice(0, point) + '.' + digits.slice(point);
+    }
+    text = (negative ? '-' : '') + text;
+
+    const nearest = parseFloat(text);
+    if (!digits || !isFinite(nearest)) return null;
+    const double = splitDecimal(String(Math.abs(nearest)));
+    return double.digits === digits && double.point === point ? null : text;
+}
+
+// Fixed-point value of an offset, a double or an exactOffset string,
+// scaled by 2^bits (truncated, as toFixed does)
+function offsetToFixed(value, bits) {
+    if (typeof value !== 'string') return toFixed(value, bits);
+    const [, sign, whole, fraction = ''] = /^(-?)(\d+)(?:\.(\d+))?$/.exec(value);
+    const fixed = (BigInt(whole + fraction) << BigInt(bits)) / 10n ** BigInt(fraction.length);
+    return sign ? -fixed : fixed;
+}
+
+// Nearest double to a fixed-point value scaled by 2^bits
+function toDouble(fixed, bits) {
+    if (bits <= 1000) return Number(fixed) * 2 ** -bits;
+    return Number(fixed >> BigInt(bits - 1000)) * 2 ** -1000;
+}
+
+// Orbit of z0 under z -> z^p + c in fixed point, stored as doubles until it
+// escapes (the escaping value included) or maxIterations is reached
+function referenceOrbit(zr, zi, cr, ci, power, maxIterations, bits) {
+    const re = new Float64Array(maxIterations + 1);
+    const im = new Float64Array(maxIterations + 1);
+    const one = BigInt(bits);
+    re[0] = toDouble(zr, bits);
+    im[0] = toDouble(zi, bits);
+
+    let length = 1;
+    while (length <= maxIterations) {
+        let pr = zr;
+        let pi = zi;
+        for (let k = 1; k < power; k++) {
+            const t = (pr * zr - pi * zi) >> one;
+            pi = (pr * zi + pi * zr) >> one;
+            pr = t;
+        }
+        zr = pr + cr;
+        zi = pi + ci;
+        re[length] = toDouble(zr, bits);
+        im[length] = toDouble(zi, bits);
+        length++;
+        if (re[length - 1] * re[length - 1] + im[length - 1] * im[length - 1] > 4) break;
+    }
+    return { re, im, length };
+}
+
+// Fixed-point bits needed to resolve one pixel of the view, plus guard bits
+function precisionBits(width, height, scale) {
+    return GUARD_BITS + Math.max(0, Math.ceil(Math.log2(Math.max(width, height) / (2 * scale))));
+}
+
+// Same contract as renderPixels (options, field, progress, time limit and
+// result), rendered by perturbation around the centre (offsetX, offsetY).
+// The result also carries `rebases`, the number of glitch rebases.
+async function renderPerturbed({
+    width = 800,
+    height = 600,
+    maxIterations = 500,
+    power = 2,
+    c = { real: 0.285, imag: 0.01 },
+    scale = 1.5,
+    offsetX = 0,
+    offsetY = 0,
+    colorScheme = "rainbow",
+    maxTime = 120000,
+    debugLog = null,
+    onProgress = null,
+    data = new Uint8ClampedArray(width * height * 4),
+    field = null
+}) {
+    const startTime = Date.now();
+    const bits = precisionBits(width, height, scale);
+    const cr = toFixed(c.real, bits);
+    const ci = toFixed(c.imag, bits);
+    const center = referenceOrbit(offsetToFixed(offsetX, bits), offsetToFixed(offsetY, bits), cr, ci, power, maxIterations, bits);
+    const critical = referenceOrbit(0n, 0n, cr, ci, power, maxIterations, bits);
+    if (debugLog) debugLog(`Perturbation: ${bits} bits, reference orbit ${center.length - 1} iterations`);
+
+    const logPower = Math.log(power);
+    const table = getColorTable(colorScheme, maxIterations);
+    const lastEntry = table.length - 1;
+    const pixels = data.byteOffset % 4 === 0 ? new Uint32Array(data.buffer, data.byteOffset, width * height) : null;
+    const tableBytes = new Uint8Array(table.buffer);
+    const progressStep = Math.max(1, Math.floor(height / 100));
+    // Pixel offsets from the centre, as map() places pixels around it
+    const deltaX = new Float64Array(width);
+    for (let x = 0; x < width; x++) deltaX[x] = map(x, 0, width, -scale, scale);
+    let iterations = 0;
+    let rebases = 0;
+
+    for (let y = 0; y < height; y++) {
+        if (Date.now() - startTime > maxTime) {
+            if (debugLog) debugLog('Time limit reached, aborting fractal generation.');
+            return null;
+        }
+
+        const deltaY = map(y, 0, height, -scale, scale);
+        let idx = y * width;
+
+        for (let x = 0; x < width; x++, idx++) {
+            let refRe = center.re;
+            let refIm = center.im;
+            let refEnd = center.length - 1;
+            let m = 0;
+            let dr = deltaX[x];
+            let di = deltaY;
+            let r2 = 0;
+            let n = 0;
+
+            while (n < maxIterations) {
+                const Zr = refRe[m];
+                const Zi = refIm[m];
+                let sr, si;
+                if (power === 2) {
+                    sr = 2 * Zr + dr;
+                    si = 2 * Zi + di;
+                } else {
+                    // Horner: sum of z^k Z^(p-1-k) for k < p
+                    const zr = Zr + dr;
+                    const zi = Zi + di;
+                    let Pr = 1, Pi = 0;
+                    sr = 1; si = 0;
+                    for (let k = 1; k < power; k++) {
+                        const t = Pr * Zr - Pi * Zi;
+                        Pi = Pr * Zi + Pi * Zr;
+                        Pr = t;
+                        const u = sr * zr - si * zi + Pr;
+                        si = sr * zi + si * zr + Pi;
+                        sr = u;
+                    }
+                }
+                const t = dr * sr - di * si;
+                di = dr * si + di * sr;
+                dr = t;
+                m++;
+
+                const zr = refRe[m] + dr;
+                const zi = refIm[m] + di;
+                r2 = zr * zr + zi * zi;
+                if (r2 > 4) break;
+                n++;
+
+                if (m === refEnd || r2 < dr * dr + di * di) {
+                    refRe = critical.re;
+                    refIm = critical.im;
+                    refEnd = critical.length - 1;
+                    m = 0;
+                    dr = zr;
+                    di = zi;
+                    rebases++;
+                }
+            }
+
+            let mu = n;
+            if (n < maxIterations) {
+                iterations += n + 1;
+                mu = n + 1 - Math.log(Math.log(Math.sqrt(r2))) / logPower;
+            } else {
+                iterations += n;
+            }
+
+            const entry = colorIndex(mu, lastEntry);
+            if (field) field[idx] = entry;
+            if (pixels) {
+                pixels[idx] = table[entry];
+            } else {
+                const o = idx * 4;
+                const e = entry * 4;
+                data[o] = tableBytes[e];
+                data[o + 1] = tableBytes[e + 1];
+                data[o + 2] = tableBytes[e + 2];
+                data[o + 3] = tableBytes[e + 3];
+            }
+        }
+
+        if (onProgress && ((y + 1) % progressStep === 0 || y + 1 === height)) {
+            onProgress(y + 1, height);
+        }
+        await new Promise(resolve => setImmediate(resolve));
+    }
+
+    return { data, iterations, rebases };
+}
+
+module.exports = { usesPerturbation, referenceOrbit, toFixed, toDouble, exactOffset, offsetToFixed, renderPerturbed };
@@ -0,0 +1,181 @@
+const os = require('os');
+const path = require('path');
+const { Worker } = require('worker_threads');
+const { renderQueueWait } = require('./metrics');
+
+// Bounded pool of render worker threads with a bounded FIFO queue in front.
+// Renders run off the main event loop, so API calls stay responsive while
+// fractals are being generated.
+class RenderPool {
+    constructor({
+        size = os.cpus().length,
+        queueSize = 16,
+        workerPath = path.join(__dirname, 'renderWorker.js'),
+        queueWaitMetric = renderQueueWait
+    } = {}) {
+        this.size = Math.max(1, size);
+        this.queueSize = Math.max(0, queueSize);
+        this.workerPath = workerPath;
+        this.queueWaitMetric = queueWaitMetric;
+        this.queue = [];
+        this.workers = [];
+        this.idle = [];
+        this.nextJobId = 1;
+
+        for (let i = 0; i < this.size; i++) {
+            this.spawnWorker();
+        }
+    }
+
+    spawnWorker() {
+        const worker = new Worker(this.workerPath);
+        worker.job = null;
+
+        worker.on('message', (message) => {
+            const job = worker.job;
+            if (!job || message.id !== job.id) return;
+
+            if (message.type === 'progress') {
+                if (job.onProgress) job.onProgress(message);
+                return;
+            }
+            if (message.type === 'stage') {
+                if (job.onStage) job.onStage(message.stage);
+                return;
+            }
+
+            worker.job = null;
+            if (message.type === 'done') {
+                job.resolve(message.result);
+            } else {
+                job.reject(new Error(message.error));
+            }
+            this.release(worker);
+        });
+
+        worker.on('error', (err) => {
+            console.error('Render worker crashed:', err);
+            if (worker.job) worker.job.reject(err);
+            worker.job = null;
+        });
+
+        worker.on('exit', (code) => {
+            if (worker.job) worker.job.reject(new Error(`Render worker exited with code ${code}`));
+            worker.job = null;
+            this.workers = this.workers.filter(w => w !== worker);
+            this.idle = this.idle.filter(w => w !== worker);
+            if (!this.closed) {
+                this.spawnWorker();
+                this.drain();
+            }
+        });
+
+        this.workers.push(worker);
+        this.idle.push(worker);
+        return worker;
+    }
+
+    // Runs a task on the next free worker. Resolves with the worker's result,
+    // or rejects with a QUEUE_FULL error if every worker is busy and the
+    // queue is already at capacity. onStart fires when a worker picks the
+    // task up, onProgress and onStage for each progress and stage message the
+    // worker posts. `cost` is the task's predicted seconds, used by waitSeconds.
+    run(task, { onStart = null, onProgress = null, onStage = null, cost = 0 } = {}) {
+        if (this.isFull()) {
+            const err = new Error('Render queue is full');
+            err.code = 'QUEUE_FULL';
+            return Promise.reject(err);
+        }
+
+        return new Promise((resolve, reject) => {
+            this.queue.push({ id: this.nextJobId++, task, cost, onStart, onProgress, onStage, resolve, reject, queuedAt: Date.now() });
+            this.drain();
+        });
+    }
+
+    drain() {
+        while (this.idle.length > 0 && this.queue.length > 0) {
+            const worker = this.idle.shift();
+            const job = this.queue.shift();
+            worker.job = job;
+            job.startedAt = Date.now();
+            if (this.queueWaitMetric) this.queueWaitMetric.observe({}, (job.startedAt - job.queuedAt) / 1000);
+            worker.postMessage({ id: job.id, task: job.task });
+            if (job.onStart) job.onStart();
+        }
+    }
+
+    release(worker) {
+        this.idle.push(worker);
+        this.drain();
+    }
+
+    // Predicted seconds until a task queued now would start: running tasks
+    // finish at their predicted cost and queued ones are handed out in
+    // order, each to the worker that frees up first
+    waitSeconds() {
+        const now = Date.now();
+        const freeAt = this.workers.map(w => w.job ? Math.max(0, w.job.cost - (now - w.job.startedAt) / 1000) : 0);
+        for (const job of this.queue) {
+            const first = freeAt.indexOf(Math.min(...freeAt));
+            freeAt[first] += job.cost;
+        }
+        return freeAt.length ? Math.min(...freeAt) : 0;
+    }
+
+    get queueDepth() {
+        return this.queue.length;
+    }
+
+    isFull() {
+        return this.idle.length === 0 && this.queue.length >= this.queueSize;
+    }
+
+    status() {
+        return {
+            workers: this.workers.length,
+            busy: this.workers.length - this.idle.length,
+            queued: this.queue.length,
+            queueSize: this.queueSize
+        };
+    }
+
+    async close() {
+        this.closed = true;
+        await Promise.all(this.workers.map(w => w.terminate()));
+    }
+}
+
+let sharedPool = null;
+
+// Process-wide pool, sized from RENDER_WORKERS / RENDER_QUEUE_SIZE.
+function getRenderPool() {
+    if (!sharedPool) {
+        const queueSize = parseInt(process.env.RENDER_QUEUE_SIZE);
+        sharedPool = new RenderPool({
+            size: parseInt(process.env.RENDER_WORKERS) || os.cpus().length,
+            queueSize: isNaN(queueSize) ? 16 : queueSize
+        });
+    }
+    return sharedPool;
+}
+
+let estimatePool = null;
+
+// Process-wide pool for the cost model's samples (see estimateRender), sized
+// from ESTIMATE_WORKERS / ESTIMATE_QUEUE_SIZE. It is kept apart from the
+// render pool so a request is estimated at once rather than after the
+// renders queued before it.
+function getEstimatePool() {
+    if (!estimatePool) {
+        const queueSize = parseInt(process.env.ESTIMATE_QUEUE_SIZE);
+        estimatePool = new RenderPool({
+            size: parseInt(process.env.ESTIMATE_WORKERS) || Math.min(2, os.cpus().length),
+            queueSize: isNaN(queueSize) ? 64 : queueSize,
+            queueWaitMetric: null
+        });
+    }
+    return estimatePool;
+}
+
+module.exports = { RenderPool, getRenderPool, getEstimatePool };
@@ -0,0 +1,49 @@
+// Worker thread entry point for RenderPool: renders one fractal per message.
+// A task carrying a packed `field` is recoloured from it instead of rendered.
+// Renders resolve to { image, field, stats } with the new field packed for
+// the field cache (null if the task's cacheField is false); recolours to
+// { image, stats }. stats holds the worker's
+// time in seconds and the iterations computed. A `progressive` task posts a
+// `stage` message with each preview image (see generateFractal) as it is ready.
+// A `sample` task is the cost model's estimate sample (see sampleIterations)
+// and resolves to its iterations, or null if it ran out of time.
+const { parentPort } = require('worker_threads');
+const { generateFractal, recolorFractal } = require('./fractalGenerator');
+const { createIndexField } = require('./fractalKernel');
+const { packField, unpackField } = require('./fieldCache');
+const { sampleIterations } = require('./costModel');
+
+function seconds(start) {
+    return Number(process.hrtime.bigint() - start) / 1e9;
+}
+
+async function runTask(id, task) {
+    if (task.sample) {
+        return sampleIterations(task);
+    }
+    const start = process.hrtime.bigint();
+    if (task.field) {
+        const field = unpackField(task.field, task.maxIterations);
+        const image = await recolorFractal({ ...task, field });
+        return { image, stats: { seconds: seconds(start), iterations: 0 } };
+    }
+
+    const field = task.cacheField ? createIndexField(task.maxIterations, task.width * task.height) : null;
+    let iterations = 0;
+    const image = await generateFractal({
+        ...task,
+        field,
+        onProgress: (done, total) => parentPort.postMessage({ id, type: 'progress', progress: done / total }),
+        onStage: (stage) => parentPort.postMessage({ id, type: 'stage', stage }),
+        onRendered: (result) => { iterations = result.iterations; }
+    });
+    return image ? { image, field: field && packField(field), stats: { seconds: seconds(start), iterations } } : null;
+}
+
+parentPort.on('message', async ({ id, task }) => {
+    try {
+        parentPort.postMessage({ id, type: 'done', result: await runTask(id, task) });
+    } catch (err) {
+        parentPort.postMessage({ id, type: 'error', error: err.message });
+    }
+});
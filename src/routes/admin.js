@@ -4,33 +4,28 @@ const { verifyToken, isAdmin } = require('./auth');
 const User = require('../users');
 const Gallery = require('../models/gallery.model');
 const History = require('../models/history.model');
-const fs = require('fs');
-const path = require('path');
-
-const fractalsDir = './fractals';
+const { parsePage } = require('../pagination');
 
 router.use(verifyToken);
 router.use(isAdmin);
 
 router.get('/users', (req, res) => {
-    let limit = parseInt(req.query.limit);
-    if (req.user.role === 'admin' && limit === 0) {
-        limit = null; // No limit for admins when 0 is provided
-    } else if (isNaN(limit)) {
-        limit = 5; // Default limit
+    // No limit for admins when 0 is provided; default limit 5
+    const page = parsePage(req.query, { defaultLimit: 5, allowUnlimited: true });
+    if (!page) {
+        return res.status(400).json({ message: "Invalid cursor." });
     }
-    const offset = parseInt(req.query.offset) || 0;
 
-    User.getAll(limit, offset, (err, usersData, totalCount) => {
+    User.getAll(page, (err, usersData, totalCount, nextCursor) => {
         if (err) {
             console.error("Database error retrieving users:", err);
-            return res.status(500).json({ message: "Internal server error" });
+            return res.status(err.status || 500).json({ message: err.status ? err.message : "Internal server error" });
         }
         const usersWithoutPasswords = usersData.map(user => {
             const { password, ...userWithoutPassword } = user;
             return userWithoutPassword;
         });
-        res.json({ data: usersWithoutPasswords, totalCount, limit, offset });
+        res.json({ data: usersWithoutPasswords, totalCount, limit: page.limit, offset: page.offset, nextCursor });
     });
 });
 
@@ -67,19 +62,21 @@ router.put('/users/:id/toggle-generation', (req, res) => {
 });
 
 router.get('/history', (req, res) => {
-    const limit = parseInt(req.query.limit) || 10;
-    const offset = parseInt(req.query.offset) || 0;
+    const page = parsePage(req.query, { defaultLimit: 10 });
+    if (!page) {
+        return res.status(400).json({ message: "Invalid cursor." });
+    }
     const filters = {}; // Empty object
     const sortBy = req.query.sortBy || 'generated_at';
     const sortOrder = req.query.sortOrder || 'DESC';
 
-    History.getAllHistory(filters, sortBy, sortOrder, limit, offset, (err, historyData, totalCount) => {
+    History.getAllHistory(filters, sortBy, sortOrder, page, (err, historyData, totalCount, nextCursor) => {
         if (err) {
             console.error("Database error retrieving history:", err);
-            return res.status(500).json({ message: "Internal server error" });
+            return res.status(err.status || 500).json({ message: err.status ? err.message : "Internal server error" });
         }
 
-        User.getAll(null, null, (err, usersData) => {
+        User.getAll({ limit: null, offset: 0, cursor: null, keyset: false, withCount: false }, (err, usersData) => {
             if (err) {
                 console.error("Database error retrieving users for history mapping:", err);
                 return res.status(500).json({ message: "Internal server error" });
@@ -91,8 +88,7 @@ router.get('/history', (req, res) => {
             });
 
             const historyWithUrlsAndUsernames = historyData.map(item => {
-                const imagePath = path.join(fractalsDir, `${item.hash}.png`);
-                const imageUrl = fs.existsSync(imagePath) ? `${req.protocol}://${req.get('host')}/fractals/${item.hash}.png` : null;
+                const imageUrl = `${req.protocol}://${req.get('host')}/fractals/${item.hash}.png`; // evicted images are rendered again on request
                 return {
                     ...item,
                     username: userMap[item.user_id] || 'Unknown',
@@ -100,7 +96,7 @@ router.get('/history', (req, res) => {
                 };
             });
 
-            res.json({ data: historyWithUrlsAndUsernames, totalCount, limit, offset });
+            res.json({ data: historyWithUrlsAndUsernames, totalCount, limit: page.limit, offset: page.offset, nextCursor });
         });
     });
 });
@@ -63,5 +63,12 @@ function isAdmin(req, res, next) {
     }
 }
 
-module.exports = { router, verifyToken, isAdmin };
+function canGenerate(req, res, next) {
+    if (req.user.role !== 'admin' && !req.user.can_generate_fractals) {
+        return res.status(403).json({ message: 'Fractal generation is currently disabled for your account. Please contact an administrator.' });
+    }
+    next();
+}
+
+module.exports = { router, verifyToken, isAdmin, canGenerate };
 
@@ -1,110 +1,35 @@
 const express = require('express');
 const router = express.Router();
-const { generateFractal } = require('../fractalGenerator');
-const fs = require('fs');
-const path = require('path'); // Add this line
-const crypto = require('crypto');
-const { verifyToken, isAdmin } = require('./auth.js');
+const { getRenderPool } = require('../renderPool');
+const { verifyToken, isAdmin, canGenerate } = require('./auth.js');
 const Fractal = require('../models/fractal.model.js');
 const History = require('../models/history.model.js');
 const Gallery = require('../models/gallery.model.js');
+const { parseOptions, produceFractal } = require('../fractalService');
+
+const renderPool = getRenderPool();
+
+// POST /generate - Generate a new fractal. Renders predicted to run over
+// the time limit are refused with 422, ones that would wait too long with
+// 429 and a Retry-After header.
+router.post('/generate', verifyToken, canGenerate, (req, res) => {
+    const options = parseOptions(req.body);
+
+    produceFractal(req.user, options)
+        .then(({ fractal, hash, cached, estimate }) => {
+            const fractalUrl = hash ? `${req.protocol}://${req.get('host')}/fractals/${hash}.png` : null;
+            res.json({ ...fractal, url: fractalUrl, cached, estimate });
+        })
+        .catch((err) => {
+            if (err.retryAfter !== undefined) res.set('Retry-After', String(err.retryAfter));
+            res.status(err.status || 500).send(err.message);
+        });
+});
 
-const fractalsDir = './fractals';
-
-let isGenerating = false;
-
-// POST /generate - Generate a new fractal
-router.post('/generate', verifyToken, async (req, res) => {
-    if (req.user.role !== 'admin' && !req.user.can_generate_fractals) {
-        return res.status(403).json({ message: 'Fractal generation is currently disabled for your account. Please contact an administrator.' });
-    }
-
-    if (isGenerating) {
-        return res.status(429).send('Another fractal is currently generating. Try again later.');
-    }
-
-    const options = {
-        width: parseInt(req.body.width) || 1920,
-        height: parseInt(req.body.height) || 1080,
-        maxIterations: parseInt(req.body.maxIterations) || 500,
-        power: parseFloat(req.body.power) || 2,
-        c: {
-            real: parseFloat(req.body.c.real) || 0.285,
-            imag: parseFloat(req.body.c.imag) || 0.01
-        },
-        scale: parseFloat(req.body.scale) || 1,
-        offsetX: parseFloat(req.body.offsetX) || 0,
-        offsetY: parseFloat(req.body.offsetY) || 0,
-        colorScheme: req.body.colorScheme || 'rainbow',
-    };
-
-    const optionsString = JSON.stringify(options);
-
-    const hash = crypto.createHash('sha256').update(optionsString).digest('hex');
-
-    Fractal.findFractalByHash(hash, async (err, row) => {
-        if (err) {
-            return res.status(500).send("Database error");
-        }
-
-        if (row) {
-            // Fractal exists, log to history and add to gallery (if not already there)
-            History.createHistoryEntry(req.user.id, row.id, (err) => {
-                if (err) {
-                    console.error("Failed to log history", err);
-                }
-            });
-            Gallery.addToGallery(req.user.id, row.id, row.hash, (err) => {
-                if (err) {
-                    console.error("Failed to add to gallery", err);
-                }
-            });
-            const fractalUrl = fractal.hash ? `${req.protocol}://${req.get('host')}/fractals/${fractal.hash}.png` : null;
-            res.json({ ...fractal, url: fractalUrl, generated_at_user: generatedAt });
-        } else {
-            // Fractal does not exist, generate it
-            isGenerating = true;
-            let buffer;
-            try {
-                buffer = await generateFractal(options);
-            } catch (err) {
-                isGenerating = false;
-                console.error(err);
-                return res.status(500).send('Fractal generation failed');
-            }
-            isGenerating = false;
-
-            if (!buffer) {
-                return res.status(499).send('Fractal generation aborted due to time limit.');
-            }
-
-            const imagePath = `${fractalsDir}/${hash}.png`;
-            fs.writeFileSync(imagePath, buffer);
-
-            const fractalData = { ...options, hash, imagePath };
-
-            Fractal.createFractal(fractalData, (err, result) => {
-                if (err) {
-                    console.error("Failed to save fractal to DB", err);
-                    return res.status(500).send("Failed to save fractal.");
-                }
-
-                History.createHistoryEntry(req.user.id, result.id, (err) => {
-                    if (err) {
-                        console.error("Failed to log history", err);
-                    }
-                });
-                Gallery.addToGallery(req.user.id, result.id, hash, (err) => {
-                    if (err) {
-                        console.error("Failed to add to gallery", err);
-                    }
-                });
-
-                const fractalUrl = hash ? `${req.protocol}://${req.get('host')}/fractals/${hash}.png` : null;
-                res.json({ ...options, hash, url: fractalUrl });
-            });
-        }
-    });
+// GET /queue - Render pool load: busy workers, queued renders and the
+// predicted wait for a new one
+router.get('/queue', verifyToken, (req, res) => {
+    res.json({ ...renderPool.status(), waitSeconds: renderPool.waitSeconds() });
 });
 
 // GET /fractals - List all fractals (with pagination, filtering, sorting)
@@ -153,8 +78,7 @@ router.get('/fractals/:fractal_id', verifyToken, (req, res) => {
         // Ensure req.user.id and fractal.id are valid before querying history
         if (!req.user || !req.user.id || !fractal || !fractal.id) {
             console.error("Missing user ID or fractal ID for history entry query. req.user:", req.user, "fractal:", fractal);
-            const imagePath = path.join(fractalsDir, `${fractal.hash}.png`);
-            const fractalUrl = fs.existsSync(imagePath) ? `${req.protocol}://${req.get('host')}/fractals/${fractal.hash}.png` : null;
+            const fractalUrl = `${req.protocol}://${req.get('host')}/fractals/${fractal.hash}.png`; // evicted images are rendered again on request
             return res.json({ ...fractal, url: fractalUrl, generated_at_user: null }); // Return without history data
         }
 
@@ -162,14 +86,12 @@ router.get('/fractals/:fractal_id', verifyToken, (req, res) => {
             if (err) {
                 console.error("Error fetching history entry:", err);
                 // Continue without generated_at if there's an error
-                const imagePath = path.join(fractalsDir, `${fractal.hash}.png`);
-                const fractalUrl = fs.existsSync(imagePath) ? `${req.protocol}://${req.get('host')}/fractals/${fractal.hash}.png` : null;
+                const fractalUrl = `${req.protocol}://${req.get('host')}/fractals/${fractal.hash}.png`;
                 return res.json({ ...fractal, url: fractalUrl, generated_at_user: null }); // Ensure generated_at_user is null on error
             }
 
             const generatedAt = historyEntry ? `${historyEntry.generated_at}Z` : null;
-            const imagePath = path.join(fractalsDir, `${fractal.hash}.png`);
-            const fractalUrl = fs.existsSync(imagePath) ? `${req.protocol}://${req.get('host')}/fractals/${fractal.hash}.png` : null;
+            const fractalUrl = `${req.protocol}://${req.get('host')}/fractals/${fractal.hash}.png`;
             res.json({ ...fractal, url: fractalUrl, generated_at_user: generatedAt });
         });
     });
@@ -1,14 +1,17 @@
 const express = require('express');
 const router = express.Router();
 const { verifyToken, isAdmin } = require('./auth.js');
-const fs = require('fs');
+const { removeImage } = require('../imageStore');
 const History = require('../models/history.model.js');
 const Fractal = require('../models/fractal.model.js');
 const Gallery = require('../models/gallery.model.js');
+const { parsePage } = require('../pagination.js');
 
 router.get('/gallery', verifyToken, (req, res) => {
-    let limit = parseInt(req.query.limit) || 10; // Default limit to 10 (matching frontend)
-    const offset = parseInt(req.query.offset) || 0; // Default offset to 0
+    const page = parsePage(req.query, { defaultLimit: 10 }); // Default limit to 10 (matching frontend)
+    if (!page) {
+        return res.status(400).json({ message: "Invalid cursor." });
+    }
 
     const filters = {
         width: parseInt(req.query.width),
@@ -27,15 +30,15 @@ router.get('/gallery', verifyToken, (req, res) => {
     const sortBy = req.query.sortBy;
     const sortOrder = req.query.sortOrder;
 
-    Gallery.getGalleryForUser(req.user.id, filters, sortBy, sortOrder, limit, offset, (err, rows, totalCount) => {
+    Gallery.getGalleryForUser(req.user.id, filters, sortBy, sortOrder, page, (err, rows, totalCount, nextCursor) => {
         if (err) {
-            return res.status(500).json({ message: "Database error" });
+            return res.status(err.status || 500).json({ message: err.status ? err.message : "Database error" });
         }
         const galleryWithUrls = rows.map(row => {
             const fractalUrl = `${req.protocol}://${req.get('host')}/fractals/${row.hash}.png`;
             return { ...row, url: fractalUrl };
         });
-        res.json({ data: galleryWithUrls, totalCount, limit, offset, filters, sortBy, sortOrder });
+        res.json({ data: galleryWithUrls, totalCount, limit: page.limit, offset: page.offset, nextCursor, filters, sortBy, sortOrder });
     });
 });
 
@@ -75,7 +78,7 @@ router.delete('/gallery/:id', verifyToken, (req, res) => {
                             return console.error("Error getting image path", err);
                         }
                         if (row) {
-                            fs.unlink(row.image_path, (err) => {
+                            removeImage(fractalHash, (err) => {
                                 if (err) console.error("Error deleting image file", err);
                             });
                             Fractal.deleteFractal(fractalId, (err) => {
@@ -96,13 +99,11 @@ router.get('/admin/history', verifyToken, (req, res) => {
         return res.status(403).send('Access denied. Admin privileges required.');
     }
 
-    let limit = parseInt(req.query.limit);
-    if (req.user.role === 'admin' && limit === 0) {
-        limit = null; // No limit for admins when 0 is provided
-    } else if (isNaN(limit)) {
-        limit = 5; // Default limit
+    // No limit for admins when 0 is provided; default limit 5
+    const page = parsePage(req.query, { defaultLimit: 5, allowUnlimited: true });
+    if (!page) {
+        return res.status(400).json({ message: "Invalid cursor." });
     }
-    const offset = parseInt(req.query.offset) || 0;
 
     const filters = {
         colorScheme: req.query.colorScheme,
@@ -115,15 +116,15 @@ router.get('/admin/history', verifyToken, (req, res) => {
     const sortBy = req.query.sortBy;
     const sortOrder = req.query.sortOrder;
 
-    History.getAllHistory(filters, sortBy, sortOrder, limit, offset, (err, rows, totalCount) => {
+    History.getAllHistory(filters, sortBy, sortOrder, page, (err, rows, totalCount, nextCursor) => {
         if (err) {
-            return res.status(500).json({ message: "Database error" });
+            return res.status(err.status || 500).json({ message: err.status ? err.message : "Database error" });
         }
         const historyWithUrls = rows.map(row => {
             const fractalUrl = `${req.protocol}://${req.get('host')}/fractals/${row.hash}.png`;
             return { ...row, url: fractalUrl };
         });
-        res.json({ data: historyWithUrls, totalCount, limit, offset, filters, sortBy, sortOrder });
+        res.json({ data: historyWithUrls, totalCount, limit: page.limit, offset: page.offset, nextCursor, filters, sortBy, sortOrder });
     });
 });
 
@@ -132,13 +133,11 @@ router.get('/admin/gallery', verifyToken, (req, res) => {
         return res.status(403).send('Access denied. Admin privileges required.');
     }
 
-    let limit = parseInt(req.query.limit);
-    if (req.user.role === 'admin' && limit === 0) {
-        limit = null; // No limit for admins when 0 is provided
-    } else if (isNaN(limit)) {
-        limit = 5; // Default limit
+    // No limit for admins when 0 is provided; default limit 5
+    const page = parsePage(req.query, { defaultLimit: 5, allowUnlimited: true });
+    if (!page) {
+        return res.status(400).json({ message: "Invalid cursor." });
     }
-    const offset = parseInt(req.query.offset) || 0;
 
     const filters = {
         colorScheme: req.query.colorScheme,
@@ -151,15 +150,15 @@ router.get('/admin/gallery', verifyToken, (req, res) => {
     const sortBy = req.query.sortBy;
     const sortOrder = req.query.sortOrder;
 
-    Gallery.getAllGallery(filters, sortBy, sortOrder, limit, offset, (err, rows, totalCount) => {
+    Gallery.getAllGallery(filters, sortBy, sortOrder, page, (err, rows, totalCount, nextCursor) => {
         if (err) {
-            return res.status(500).json({ message: "Database error" });
+            return res.status(err.status || 500).json({ message: err.status ? err.message : "Database error" });
         }
         const galleryWithUrls = rows.map(row => {
             const fractalUrl = `${req.protocol}://${req.get('host')}/fractals/${row.hash}.png`;
             return { ...row, url: fractalUrl };
         });
-        res.json({ data: galleryWithUrls, totalCount, limit, offset, filters, sortBy, sortOrder });
+        res.json({ data: galleryWithUrls, totalCount, limit: page.limit, offset: page.offset, nextCursor, filters, sortBy, sortOrder });
     });
 });
 
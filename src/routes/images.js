@@ -0,0 +1,45 @@
+const express = require('express');
+const path = require('path');
+const router = express.Router();
+const { imagePath, touchImage } = require('../imageStore');
+const { ensureImage } = require('../fractalService');
+
+// Image names are the hash of the options they were rendered from, so an
+// image never changes: browsers may cache it for good and revalidate by hash.
+const CACHE_CONTROL = 'public, max-age=31536000, immutable';
+
+// GET /fractals/:hash.png - Serve a rendered image from the image store,
+// rendering it again first if it was evicted
+router.get('/:name', (req, res, next) => {
+    const match = /^([0-9a-f]{64})\.png$/.exec(req.params.name);
+    if (!match) return next();
+    const hash = match[1];
+    const etag = `"${hash}"`;
+
+    // A client holding any copy of the image already has the right bytes
+    const ifNoneMatch = req.get('If-None-Match');
+    if (ifNoneMatch && ifNoneMatch.split(/\s*,\s*/).some(tag => tag.replace(/^W\//, '') === etag)) {
+        touchImage(hash);
+        res.set({ 'Cache-Control': CACHE_CONTROL, 'ETag': etag });
+        return res.status(304).end();
+    }
+
+    const send = () => {
+        res.set({ 'Cache-Control': CACHE_CONTROL, 'ETag': etag });
+        res.sendFile(path.resolve(imagePath(hash)), { etag: false, lastModified: false }, (err) => {
+            if (err && !res.headersSent) next(err);
+        });
+    };
+
+    if (touchImage(hash)) return send();
+
+    ensureImage(hash)
+        .then((found) => {
+            if (!found) return res.status(404).send('Image not found.');
+            touchImage(hash);
+            send();
+        })
+        .catch((err) => res.status(err.status || 500).send(err.message));
+});
+
+module.exports = router;
@@ -0,0 +1,125 @@
+const express = require('express');
+const router = express.Router();
+const { verifyToken, canGenerate } = require('./auth.js');
+const { getRenderPool } = require('../renderPool');
+const { parseOptions, isRendering, produceFractal } = require('../fractalService');
+const { createJob, getJob, getStage, updateJob, subscribe, isFinished, jobView } = require('../jobs');
+
+function baseUrlOf(req) {
+    return `${req.protocol}://${req.get('host')}`;
+}
+
+// Looks up the job in req.params.id, answering 404 unless it belongs to the
+// user (admins can see every job)
+function findJob(req, res) {
+    const job = getJob(req.params.id);
+    if (!job || (job.userId !== req.user.id && req.user.role !== 'admin')) {
+        res.status(404).json({ message: 'Job not found.' });
+        return null;
+    }
+    return job;
+}
+
+// POST /jobs - Submit a fractal for rendering. Answers 202 with the job id
+// and, if a render is needed, its estimate (ETA) once the render has been
+// admitted; a render refused up front is answered with its 422 or 429.
+// With `progressive: true` in the body the render produces preview stages
+// (1/8 scale first), listed in the job's `stages` as they become available.
+router.post('/jobs', verifyToken, canGenerate, (req, res) => {
+    const options = parseOptions(req.body);
+    // A request for a fractal that is already rendering joins that render
+    if (getRenderPool().isFull() && !isRendering(options)) {
+        return res.status(429).send('The render queue is full. Try again later.');
+    }
+
+    const job = createJob(req.user.id, options);
+    const baseUrl = baseUrlOf(req);
+    let answered = false;
+    const accept = () => {
+        if (answered) return;
+        answered = true;
+        res.status(202).json({
+            ...jobView(job, baseUrl),
+            statusUrl: `${baseUrl}/api/jobs/${job.id}`,
+            eventsUrl: `${baseUrl}/api/jobs/${job.id}/events`
+        });
+    };
+
+    produceFractal(req.user, options, {
+        onEstimate: (estimate) => {
+            updateJob(job, { estimate });
+            accept();
+        },
+        onStart: () => updateJob(job, { status: 'running', startedAt: Date.now() }),
+        onProgress: ({ progress }) => updateJob(job, { status: 'running', progress }),
+        onStage: (stage) => updateJob(job, { stages: [...job.stages, stage] }),
+        progressive: req.body.progressive === true
+    })
+        .then(({ fractal, hash, cached, estimate }) => {
+            const fractalUrl = hash ? `${baseUrl}/fractals/${hash}.png` : null;
+            updateJob(job, { status: 'done', progress: 1, estimate, result: { ...fractal, url: fractalUrl, cached, estimate } });
+            accept();
+        })
+        .catch((err) => {
+            updateJob(job, { status: 'failed', error: { status: err.status || 500, message: err.message } });
+            if (answered) return;
+            answered = true;
+            if (err.retryAfter !== undefined) res.set('Retry-After', String(err.retryAfter));
+            res.status(err.status || 500).send(err.message);
+        });
+});
+
+// GET /jobs/:id - Job status, progress and (once done) the fractal
+router.get('/jobs/:id', verifyToken, (req, res) => {
+    const job = findJob(req, res);
+    if (!job) return;
+    res.json(jobView(job, baseUrlOf(req)));
+});
+
+// GET /jobs/:id/stages/:step - PNG of the job's preview at 1/step scale
+router.get('/jobs/:id/stages/:step', verifyToken, (req, res) => {
+    const job = findJob(req, res);
+    if (!job) return;
+    const stage = getStage(job, parseInt(req.params.step));
+    if (!stage) {
+        return res.status(404).json({ message: 'Stage not rendered.' });
+    }
+    res.type('png').send(Buffer.from(stage.image));
+});
+
+// GET /jobs/:id/events - Server-sent events stream of job updates. Each
+// update is a `status` event carrying the job; the stream ends after the
+// job finishes.
+router.get('/jobs/:id/events', verifyToken, (req, res) => {
+    const job = findJob(req, res);
+    if (!job) return;
+
+    res.writeHead(200, {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'Connection': 'keep-alive',
+        'X-Accel-Buffering': 'no'
+    });
+
+    const baseUrl = baseUrlOf(req);
+    const send = (job) => {
+        res.write(`event: status\ndata: ${JSON.stringify(jobView(job, baseUrl))}\n\n`);
+        if (isFinished(job)) {
+            cleanup();
+            res.end();
+        }
+    };
+
+    // Comment lines keep idle proxies from closing a long render's stream
+    const keepAlive = setInterval(() => res.write(': keep-alive\n\n'), 15000);
+    const unsubscribe = subscribe(job, send);
+    const cleanup = () => {
+        clearInterval(keepAlive);
+        unsubscribe();
+    };
+    req.on('close', cleanup);
+
+    send(job);
+});
+
+module.exports = router;
@@ -0,0 +1,33 @@
+const express = require('express');
+const router = express.Router();
+const { getRenderPool } = require('../renderPool');
+const { fieldCacheStatus } = require('../fieldCache');
+const { imageStoreStatus } = require('../imageStore');
+const { tileStoreStatus } = require('../tileStore');
+const { costModelStatus } = require('../costModel');
+const { Gauge, metricsText } = require('../metrics');
+
+new Gauge('fractal_render_queue_depth', 'Renders waiting for a free worker.', () => getRenderPool().status().queued);
+new Gauge('fractal_render_workers_busy', 'Render workers currently rendering.', () => getRenderPool().status().busy);
+new Gauge('fractal_render_workers', 'Render worker threads.', () => getRenderPool().status().workers);
+new Gauge('fractal_render_wait_seconds', 'Predicted wait before a render queued now would start.', () => getRenderPool().waitSeconds());
+new Gauge('fractal_cost_model_correction', 'Learned multiplier on the cost model\'s base rates, by kind.',
+    () => Object.entries(costModelStatus().corrections).map(([kind, value]) => [{ kind }, value]), ['kind']);
+new Gauge('fractal_field_cache_bytes', 'Memory held by cached escape-time fields.', () => fieldCacheStatus().bytes);
+new Gauge('fractal_image_store_bytes', 'Disk used by rendered images in ./fractals.', () => imageStoreStatus().bytes);
+new Gauge('fractal_image_store_images', 'Rendered images in ./fractals.', () => imageStoreStatus().images);
+new Gauge('fractal_tile_store_bytes', 'Disk used by cached map tiles in ./tiles.', () => tileStoreStatus().bytes);
+new Gauge('fractal_tile_store_tiles', 'Cached map tiles in ./tiles.', () => tileStoreStatus().tiles);
+
+// GET /metrics - Prometheus text exposition. When METRICS_TOKEN is set,
+// scrapers must send it as a bearer token.
+router.get('/', (req, res) => {
+    const token = process.env.METRICS_TOKEN;
+    if (token && req.get('Authorization') !== `Bearer ${token}`) {
+        return res.status(401).send('Unauthorized');
+    }
+    res.set('Content-Type', 'text/plain; version=0.0.4; charset=utf-8');
+    res.send(metricsText());
+});
+
+module.exports = router;
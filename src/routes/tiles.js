@@ -0,0 +1,48 @@
+const express = require('express');
+const path = require('path');
+const router = express.Router();
+const { verifyToken, canGenerate } = require('./auth.js');
+const { tilePath, touchTile } = require('../tileStore');
+const { hashOptions, tileOptions, produceTile } = require('../fractalService');
+
+// A tile's URL pins down its options, and so its bytes, for good
+const CACHE_CONTROL = 'private, max-age=31536000, immutable';
+
+// GET /tiles/:z/:x/:y(.png) - TILE_SIZE x TILE_SIZE PNG tile (x, y) of zoom
+// level z (see tileOptions) of the fractal given by the query parameters
+// maxIterations, power, c_real, c_imag and colorScheme, which default as for
+// /generate. Tiles come from the tile store or are rendered on demand; the
+// X-Tile-Cache header says which (hit or miss). Renders the cost model
+// refuses are answered 422 or 429 as for /generate.
+router.get('/tiles/:z/:x/:y', verifyToken, canGenerate, (req, res, next) => {
+    const match = /^(\d+)(?:\.png)?$/.exec(req.params.y);
+    const coordinate = (value) => /^\d+$/.test(value) ? Number(value) : NaN;
+    const options = match && tileOptions(req.query, coordinate(req.params.z), coordinate(req.params.x), Number(match[1]));
+    if (!options) {
+        return res.status(400).json({ message: 'No such tile.' });
+    }
+
+    // A client holding any copy of the tile already has the right bytes,
+    // even if the store has since evicted it
+    const etag = `"${hashOptions(options)}"`;
+    const ifNoneMatch = req.get('If-None-Match');
+    if (ifNoneMatch && ifNoneMatch.split(/\s*,\s*/).some(tag => tag.replace(/^W\//, '') === etag)) {
+        res.set({ 'Cache-Control': CACHE_CONTROL, 'ETag': etag });
+        return res.status(304).end();
+    }
+
+    produceTile(options)
+        .then(({ hash, cached }) => {
+            touchTile(hash);
+            res.set({ 'Cache-Control': CACHE_CONTROL, 'ETag': etag, 'X-Tile-Cache': cached ? 'hit' : 'miss' });
+            res.sendFile(path.resolve(tilePath(hash)), { etag: false, lastModified: false }, (err) => {
+                if (err && !res.headersSent) next(err);
+            });
+        })
+        .catch((err) => {
+            if (err.retryAfter !== undefined) res.set('Retry-After', String(err.retryAfter));
+            res.status(err.status || 500).send(err.message);
+        });
+});
+
+module.exports = router;
@@ -0,0 +1,101 @@
+// Table definitions, indexes and connection pragmas for fractal.db. Kept
+// apart from database.js so scripts/db_bench.js can build the same schema
+// in a scratch database.
+
+const TABLES = {
+    fractals: `
+        CREATE TABLE IF NOT EXISTS fractals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            hash TEXT UNIQUE NOT NULL,
+            width INTEGER NOT NULL,
+            height INTEGER NOT NULL,
+            iterations INTEGER NOT NULL,
+            power REAL NOT NULL,
+            c_real REAL NOT NULL,
+            c_imag REAL NOT NULL,
+            scale REAL NOT NULL,
+            offsetX REAL NOT NULL,
+            offsetY REAL NOT NULL,
+            colorScheme TEXT NOT NULL,
+            image_path TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            offsetX_decimal TEXT,
+            offsetY_decimal TEXT
+        )`,
+    history: `
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            fractal_id INTEGER NOT NULL,
+            generated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (fractal_id) REFERENCES fractals (id)
+        )`,
+    gallery: `
+        CREATE TABLE IF NOT EXISTS gallery (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            fractal_id INTEGER NOT NULL,
+            fractal_hash TEXT NOT NULL,
+            added_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(user_id, fractal_hash),
+            FOREIGN KEY (fractal_id) REFERENCES fractals (id)
+        )`,
+    users: `
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            role TEXT DEFAULT 'user',
+            can_generate_fractals INTEGER DEFAULT 1
+        )`
+};
+
+// Columns added to a table since it was first created, by table; older
+// databases get them by ALTER TABLE. offsetX_decimal / offsetY_decimal hold
+// an offset given as a decimal string (see exactOffset in perturbation.js),
+// which a REAL column would round to 15 digits, and are NULL otherwise.
+const ADDED_COLUMNS = {
+    fractals: ['offsetX_decimal TEXT', 'offsetY_decimal TEXT'],
+    history: [],
+    gallery: [],
+    users: []
+};
+
+// Indexes for the queries the models actually run, by table
+const INDEXES = {
+    fractals: [
+        // /fractals filters and its default sort
+        'CREATE INDEX IF NOT EXISTS idx_fractals_created_at ON fractals (created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_fractals_color_scheme ON fractals (colorScheme)',
+        'CREATE INDEX IF NOT EXISTS idx_fractals_power ON fractals (power)',
+        'CREATE INDEX IF NOT EXISTS idx_fractals_iterations ON fractals (iterations)',
+        'CREATE INDEX IF NOT EXISTS idx_fractals_size ON fractals (width, height)'
+    ],
+    history: [
+        // A user's history (newest first) and their entry for one fractal
+        'CREATE INDEX IF NOT EXISTS idx_history_user_generated ON history (user_id, generated_at)',
+        'CREATE INDEX IF NOT EXISTS idx_history_user_fractal ON history (user_id, fractal_id)',
+        'CREATE INDEX IF NOT EXISTS idx_history_fractal ON history (fractal_id)',
+        'CREATE INDEX IF NOT EXISTS idx_history_generated ON history (generated_at)'
+    ],
+    gallery: [
+        // A user's gallery (newest first), and references to one fractal
+        'CREATE INDEX IF NOT EXISTS idx_gallery_user_added ON gallery (user_id, added_at)',
+        'CREATE INDEX IF NOT EXISTS idx_gallery_fractal_hash ON gallery (fractal_hash)',
+        'CREATE INDEX IF NOT EXISTS idx_gallery_added ON gallery (added_at)'
+    ],
+    users: []
+};
+
+// WAL lets readers run alongside the writer; with WAL, synchronous=NORMAL is
+// still safe against corruption and only risks the last commits on power
+// loss. cache_size is in KiB when negative (64 MB).
+const PRAGMAS = [
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA cache_size = -65536',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA busy_timeout = 5000'
+];
+
+module.exports = { TABLES, ADDED_COLUMNS, INDEXES, PRAGMAS };
@@ -0,0 +1,67 @@
+const db = require('./database.js');
+const { dbQueryDuration } = require('./metrics');
+
+// Prepared statements cached by SQL text, so hot queries are parsed and
+// planned once instead of on every call. Dynamic queries (filters, sort
+// order) produce a bounded number of distinct SQL strings; the least
+// recently used statements are finalized past STATEMENT_CACHE_SIZE.
+// get/all/run take the same arguments as the db methods, and run's callback
+// sees lastID/changes on `this` as with db.run.
+const STATEMENT_CACHE_SIZE = 200;
+const statements = new Map();
+
+// Calls back with the cached statement for `sql`, preparing it first if
+// needed. A failed prepare (e.g. an unknown sort column) is passed to the
+// callback and nothing is cached.
+function prepared(sql, callback) {
+    const cached = statements.get(sql);
+    if (cached) {
+        // Refresh LRU position
+        statements.delete(sql);
+        statements.set(sql, cached);
+        return callback(null, cached);
+    }
+
+    const statement = db.prepare(sql, (err) => {
+        if (err) return callback(err);
+        // Another call may have prepared the same SQL in the meantime
+        if (statements.has(sql)) {
+            statement.finalize();
+            return prepared(sql, callback);
+        }
+        statements.set(sql, statement);
+        if (statements.size > STATEMENT_CACHE_SIZE) {
+            const [oldSql, oldStatement] = statements.entries().next().value;
+            statements.delete(oldSql);
+            oldStatement.finalize();
+        }
+        callback(null, statement);
+    });
+}
+
+function query(method, sql, params, callback = () => {}) {
+    const done = dbQueryDuration.startTimer({ method });
+    prepared(sql, (err, statement) => {
+        if (err) {
+            done();
+            return callback(err);
+        }
+        if (method !== 'get') {
+            return statement[method](params, function (...args) {
+                done();
+                callback.apply(this, args);
+            });
+        }
+        // get stops after the first row; reset so the statement doesn't hold
+        // a read transaction open until its next use
+        statement.get(params, (err, row) => {
+            statement.reset();
+            done();
+            callback(err, row);
+        });
+    });
+}
+
+exports.get = (sql, params, callback) => query('get', sql, params, callback);
+exports.all = (sql, params, callback) => query('all', sql, params, callback);
+exports.run = (sql, params, callback) => query('run', sql, params, callback);
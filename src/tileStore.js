@@ -0,0 +1,101 @@
+const fs = require('fs');
+const path = require('path');
+
+// Disk cache for map tiles (see fractalService's tileOptions) in ./tiles.
+// Like the image store, a tile is named by the hash of the options it was
+// rendered from, so a cached tile is never stale, and an in-memory index
+// loaded once at startup saves requests from stat-ing the disk. Tiles belong
+// to no gallery: once the cache grows past TILE_CACHE_MB the least recently
+// used are evicted, down to LOW_WATER_FRACTION of the budget, and rendered
+// again the next time they are requested.
+const tilesDir = './tiles';
+const DEFAULT_BUDGET_MB = 512;
+const LOW_WATER_FRACTION = 0.9;
+
+const budgetMb = parseFloat(process.env.TILE_CACHE_MB);
+const budgetBytes = (isNaN(budgetMb) ? DEFAULT_BUDGET_MB : budgetMb) * 1024 * 1024;
+
+// hash -> size in bytes, least recently used first
+const tiles = new Map();
+let totalBytes = 0;
+
+function tilePath(hash) {
+    return `${tilesDir}/${hash}.png`;
+}
+
+// Builds the index from the files on disk, oldest first. Call once before
+// serving.
+function loadTileStore() {
+    fs.mkdirSync(tilesDir, { recursive: true });
+    tiles.clear();
+    totalBytes = 0;
+    const found = [];
+    for (const name of fs.readdirSync(tilesDir)) {
+        if (name.endsWith('.tmp')) {
+            // Left over from a write interrupted by a crash
+            fs.unlinkSync(path.join(tilesDir, name));
+            continue;
+        }
+        if (!name.endsWith('.png')) continue;
+        const stat = fs.statSync(path.join(tilesDir, name));
+        found.push({ hash: name.slice(0, -4), size: stat.size, mtimeMs: stat.mtimeMs });
+    }
+    found.sort((a, b) => a.mtimeMs - b.mtimeMs);
+    for (const { hash, size } of found) {
+        tiles.set(hash, size);
+        totalBytes += size;
+    }
+    console.log(`Tile store: ${tiles.size} tiles, ${(totalBytes / 1024 / 1024).toFixed(1)} MB`);
+    evictIfNeeded();
+}
+
+function hasTile(hash) {
+    return tiles.has(hash);
+}
+
+// Marks the tile most recently used; returns false if it isn't in the store
+function touchTile(hash) {
+    const size = tiles.get(hash);
+    if (size === undefined) return false;
+    tiles.delete(hash);
+    tiles.set(hash, size);
+    return true;
+}
+
+// Writes the tile and adds it to the index, under a temporary name first so
+// it is never served half-written. Resolves to the tile's path.
+async function saveTile(hash, buffer) {
+    const file = tilePath(hash);
+    const tmpFile = `${file}.${process.pid}.tmp`;
+    await fs.promises.writeFile(tmpFile, buffer);
+    await fs.promises.rename(tmpFile, file);
+
+    if (tiles.has(hash)) totalBytes -= tiles.get(hash);
+    tiles.delete(hash);
+    tiles.set(hash, buffer.length);
+    totalBytes += buffer.length;
+    evictIfNeeded();
+    return file;
+}
+
+function evictIfNeeded() {
+    if (totalBytes <= budgetBytes) return;
+    const target = budgetBytes * LOW_WATER_FRACTION;
+    let evicted = 0;
+    for (const [hash, size] of tiles) {
+        if (totalBytes <= target) break;
+        tiles.delete(hash);
+        totalBytes -= size;
+        fs.unlink(tilePath(hash), (err) => {
+            if (err && err.code !== 'ENOENT') console.error("Failed to evict tile", hash, err);
+        });
+        evicted++;
+    }
+    console.log(`Tile store evicted ${evicted} tiles`);
+}
+
+function tileStoreStatus() {
+    return { tiles: tiles.size, bytes: totalBytes, budgetBytes };
+}
+
+module.exports = { tilesDir, tilePath, loadTileStore, hasTile, touchTile, saveTile, tileStoreStatus };
@@ -1,6 +1,7 @@
 const db = require('./database');
 const History = require('./models/history.model'); // Import History model
 const Gallery = require('./models/gallery.model'); // Import Gallery model
+const { pageClauses, finishPage, pageCount } = require('./pagination');
 
 const User = {
     findByUsername: (username, callback) => {
@@ -35,22 +36,26 @@ const User = {
         });
     },
 
-    getAll: (limit, offset, callback) => {
+    getAll: (page, callback) => {
+        let clauses;
+        try {
+            clauses = pageClauses(page, { column: 'id', idColumn: 'id', sortKey: 'id', order: 'ASC' });
+        } catch (err) {
+            return callback(err);
+        }
+
         const countSql = `SELECT COUNT(*) as totalCount FROM users`;
-        db.get(countSql, [], (err, countRow) => {
+        const countUsers = (cb) => db.get(countSql, [], (err, countRow) => cb(err, countRow && countRow.totalCount));
+        pageCount(page, 'users', countUsers, (err, totalCount) => {
             if (err) return callback(err);
-            const totalCount = countRow.totalCount;
 
-            let dataSql = `SELECT id, username, role, can_generate_fractals FROM users`;
-            let params = [];
-
-            if (limit > 0) {
-                dataSql += ' LIMIT ? OFFSET ?';
-                params.push(limit, offset);
-            }
+            const whereSql = clauses.where ? ` WHERE ${clauses.where}` : '';
+            const dataSql = `SELECT id, username, role, can_generate_fractals FROM users${whereSql} ORDER BY ${clauses.orderBy} ${clauses.limitSql}`;
+            const params = [...clauses.params, ...clauses.limitParams];
 
-            db.all(dataSql, params, (err, rows) => {
+            db.all(dataSql, params, (err, allRows) => {
                 if (err) return callback(err);
+                const { rows, nextCursor } = finishPage(allRows, page, { sortKey: 'id', order: 'ASC' });
 
                 // Fetch counts for each user
                 const usersWithCountsPromises = rows.map(user => {
@@ -71,7 +76,7 @@ const User = {
 
                 Promise.all(usersWithCountsPromises)
                     .then(usersWithCounts => {
-                        callback(null, usersWithCounts, totalCount);
+                        callback(null, usersWithCounts, totalCount, nextCursor);
                     })
                     .catch(error => {
                         callback(error);